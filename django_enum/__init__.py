@@ -5,6 +5,13 @@ from django.conf import settings
 # Project imports
 from patchy import patchy
 from .fields import *
+try:
+    from enum import Flag
+except ImportError:
+    # Python 3.5, enum.Flag is only available from 3.6
+    pass
+else:
+    from .flags import *
 
 
 logger = logging.getLogger(__name__)
@@ -41,3 +48,4 @@ def patch_enum():
             if backend == 'django.db.backends.mysql':
                 import django.db.backends.mysql.base
                 p.cls('mysql.features.DatabaseFeatures', 'MysqlDatabaseFeatures').auto()
+                p.cls('mysql.schema.DatabaseSchemaEditor', 'MysqlDatabaseSchemaEditor').auto()
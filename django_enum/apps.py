@@ -1,4 +1,6 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 from . import patch_enum
 
 
@@ -7,3 +9,8 @@ class DjangoEnumConfig(AppConfig):
 
     def ready(self):
         patch_enum()
+
+        # Decode enum types in the driver
+        if getattr(settings, 'ENUM_CASTERS', None):
+            from .casters import register_casters_on_connect
+            connection_created.connect(register_casters_on_connect)
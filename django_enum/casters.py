@@ -0,0 +1,58 @@
+""" psycopg2 type casters decoding PostgreSQL enum types to EnumField values in the driver """
+from django.apps import apps
+from django.conf import settings
+
+from .fields import EnumField
+
+__all__ = ['register_casters']
+
+
+def get_enum_types():
+    """ Enum of each database enum type used by EnumFields stored as text, None where several share a type """
+    enums = {}
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, EnumField) and field.type_def and not field.stores_codes:
+                enums[field.type_name] = field.type_def if enums.get(field.type_name, field.type_def) is field.type_def else None
+    return enums
+
+
+def register_casters(connection, members=False):
+    """ Register casters for the enum types of a PostgreSQL connection, resolved by type OID
+        Values are returned as the canonical strings of the enum, so EnumField lookups hash and compare by identity,
+         or with members as the enum members themselves and EnumField skips its converter for those types
+        Types shared by several enums, or not yet created, are left to the default text decoding
+        * connection :: Database connection, ie from the connection_created signal
+        * members :: Whether to return enum members instead of strings
+    """
+    from psycopg2.extensions import new_array_type, new_type, register_type
+
+    connection.enum_casters = {}
+    enums = {type_name: enum for type_name, enum in get_enum_types().items() if enum}
+    if not enums:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT typname, oid, typarray FROM pg_type WHERE typtype = 'e' AND typname IN %s", [tuple(enums)])
+        types = cursor.fetchall()
+
+    for type_name, oid, array_oid in types:
+        enum = enums[type_name]
+        lookup = {str(em.value): em if members else str(em.value) for em in enum}
+
+        def cast(value, cursor, lookup=lookup):
+            if value is None:
+                return None
+            # Unknown values are left for EnumField to reject
+            return lookup.get(value, value)
+
+        caster = new_type((oid,), type_name.upper(), cast)
+        register_type(caster, connection.connection)
+        register_type(new_array_type((array_oid,), type_name.upper() + '[]', caster), connection.connection)
+        if members:
+            connection.enum_casters[type_name] = enum
+
+
+def register_casters_on_connect(sender, connection, **kwargs):
+    """ connection_created receiver registering casters as configured by settings.ENUM_CASTERS """
+    if connection.vendor == 'postgresql':
+        register_casters(connection, members=settings.ENUM_CASTERS == 'members')
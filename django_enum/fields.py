@@ -24,11 +24,23 @@ class EnumField(CustomTypeField):
         * String matching an Enum member value
         * String representing the Enum member _'[EnumClass].[AttributeName]'_
         * String matching an Enum member value when both are lower cased - if case_sensitive is False
+        With storage 'smallint' the members are stored as stable integer codes instead of text,
+         taken from the enum Meta.db_codes mapping of value to code or numbered in declaration order
     """
     description = 'Enumeration field using python PEP435 and database implementations'
     case_sensitive = None
     manual_choices = False
     type_def_subclass = Enum
+    storage = 'text'
+    storage_options = ('text', 'smallint')
+
+    # Lookup tables of accepted spellings to members, rebuilt when type_def is set
+    value_members = {}
+    casefold_members = {}
+    name_members = {}
+    choice_keys = frozenset()
+    member_codes = {}
+    code_members = {}
 
     data_types = {
         'unknown': models.CharField,
@@ -36,7 +48,11 @@ class EnumField(CustomTypeField):
         'mysql': 'enum(%(values)s)',
     }
 
-    def __init__(self, enum=None, case_sensitive=None, default=None, *args, **kwargs):
+    def __init__(self, enum=None, case_sensitive=None, default=None, *args, storage=None, **kwargs):
+        if storage is not None:
+            if storage not in self.storage_options:
+                raise ValueError('storage must be one of {}'.format(', '.join(self.storage_options)))
+            self.storage = storage
         if 'choices' in kwargs:
             self.manual_choices = kwargs.pop('choices')
         if default and enum:
@@ -61,21 +77,63 @@ class EnumField(CustomTypeField):
         else:
             self.choices = [(str(em), em.value) for em in self.type_def]
 
+        # Build lookups once so conversions avoid EnumMeta.__call__ and scanning members
+        self.value_members = {str(em.value): em for em in self.type_def}
+        self.casefold_members = {value.casefold(): em for value, em in reversed(list(self.value_members.items()))}
+        self.name_members = {
+            '{}.{}'.format(self.type_def.__name__, name): em
+            for name, em in self.type_def.__members__.items()}
+        self.choice_keys = frozenset(option for option, v in self.flat_choices_iter())
+        self.member_codes = {em: code for code, em in self.get_codes(self.type_def).items()}
+        self.code_members = {code: em for em, code in self.member_codes.items()}
+
+    @staticmethod
+    def get_codes(enum):
+        """ Mapping of integer code to member, from Meta.db_codes or in declaration order """
+        try:
+            db_codes = enum.Meta.db_codes
+        except AttributeError:
+            return {code: em for code, em in enumerate(enum, 1)}
+        return {db_codes[str(em.value)]: em for em in enum}
+
+    @property
+    def stores_codes(self):
+        return self.storage == 'smallint'
+
     def deconstruct(self):
         name, path, args, kwargs = super().deconstruct()
         if not self.manual_choices and 'choices' in kwargs:
             del kwargs['choices']
         if self.case_sensitive is not None:
             kwargs['case_sensitive'] = self.case_sensitive
+        if self.storage != EnumField.storage:
+            kwargs['storage'] = self.storage
         return name, path, args, kwargs
 
     def from_db_value(self, value, expression, connection, context):
         if value is None:
             return None
+        if self.stores_codes:
+            with suppress(KeyError):
+                return self.code_members[value]
+            raise ValueError('Invalid enumeration code returned from database')
+        try:
+            return self.value_members[value]
+        except (KeyError, TypeError):
+            pass
+        if isinstance(value, self.type_def):
+            # Already decoded by a driver caster
+            return value
         with suppress(KeyError):
-            return self.type_def(str(value))
+            return self.value_members[str(value)]
         raise ValueError('Invalid enumeration value returned from database')
 
+    def get_db_converters(self, connection):
+        # Skip conversion where the driver returns members of this enum
+        if not self.stores_codes and getattr(connection, 'enum_casters', {}).get(self.type_name) is self.type_def:
+            return []
+        return super().get_db_converters(connection)
+
     def to_python(self, value):
         if value is None or isinstance(value, self.type_def):
             return value
@@ -83,17 +141,15 @@ class EnumField(CustomTypeField):
             # Enum member of the wrong type!
             raise ValidationError("Invalid enum '{}' is a member of an incompatible enumeration".format(repr(value)))
         if isinstance(value, str):
-            with suppress(ValueError):
-                return self.type_def(str(value))
-            # Enum match failed, if not case_sensitive, try insensitive scan
+            with suppress(KeyError):
+                return self.value_members[value]
+            # Enum match failed, if not case_sensitive, try insensitive match
             if self.case_sensitive is False:
-                for em in self.type_def:
-                    if str(value).lower() == em.value.lower():
-                        return em
+                with suppress(KeyError):
+                    return self.casefold_members[value.casefold()]
             # Check for a Enum member string representation
-            if value.startswith(self.type_def.__name__ + '.'):
-                with suppress(ValueError):
-                    return self.type_def[value[len(self.type_def.__name__) + 1:]]
+            with suppress(KeyError):
+                return self.name_members[value]
             raise ValidationError("Invalid value '{}' not in enumeration {}".format(
                 value, [em.value for em in self.type_def]))
         raise ValidationError("Invalid type '{}' is not an enum member or string".format(type(value).__name__))
@@ -103,12 +159,16 @@ class EnumField(CustomTypeField):
             return value
         if not isinstance(value, self.type_def):
             value = self.to_python(value)
+        if self.stores_codes:
+            return self.member_codes[value]
         return value.value
 
     def value_to_string(self, obj):
-        """ Serialise to text value as represented in the Enum member or database """
+        """ Serialise to text value as represented in the Enum member """
         value = self.value_from_object(obj)
-        return self.get_prep_value(value)
+        if not value:
+            return value
+        return self.to_python(value).value
 
     def db_type_parameters(self, connection):
         paras = super().db_type_parameters(connection)
@@ -118,6 +178,8 @@ class EnumField(CustomTypeField):
         return paras
 
     def db_type(self, connection):
+        if self.stores_codes:
+            return models.SmallIntegerField().db_type(connection)
         type_string = super().db_type(connection)
 
         # Use overloaded str DBType to pass parametised version where possible
@@ -134,7 +196,7 @@ class EnumField(CustomTypeField):
         choices = choices or self.choices
         for option_key, option_value in choices:
             if isinstance(option_value, (list, tuple)):
-                yield from flat_choices_iter(option_value)
+                yield from self.flat_choices_iter(option_value)
             else:
                 yield option_key, option_value
 
@@ -144,7 +206,7 @@ class EnumField(CustomTypeField):
 
         if self.manual_choices:
             # If restricted choices, check against them
-            if any(str(value) == option for option, v in self.flat_choices_iter()):
+            if str(value) in self.choice_keys:
                 return
         elif isinstance(value, self.type_def):
             return
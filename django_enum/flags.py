@@ -0,0 +1,246 @@
+""" Flag enumerations stored as integer bitmasks
+    Requires enum.Flag, available from Python 3.6
+"""
+from contextlib import suppress
+from enum import Enum, Flag
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import sql
+from django_types import CustomTypeField
+from django_types.operations import CustomTypeOperation
+
+__all__ = ['FlagField']
+
+
+class FlagField(CustomTypeField):
+    """ Field based on a python Flag, storing combinations of flags as an integer bitmask
+        FlagField takes a Flag as its argument, and value can be set using any of the following:
+        * Flag member or combination of members of the correct Flag class
+        * Integer of combined flag values
+        * String of member names joined by |, optionally as _'[FlagClass].[AttributeName]'_
+        * Iterable of any of the above
+        Flags can be added without changing the database, as the column is a fixed width integer
+    """
+    description = 'Flag enumeration field stored as an integer bitmask'
+    type_def_subclass = Flag
+
+    # Lookup tables rebuilt when type_def is set
+    value_members = {}
+    mask = 0
+
+    def __init__(self, flag=None, default=None, *args, **kwargs):
+        if isinstance(default, Flag):
+            kwargs['default'] = default.value
+        elif default is not None:
+            kwargs['default'] = default
+        super().__init__(*args, **kwargs)
+        if flag:
+            self.type_def = flag
+
+    @CustomTypeField.type_def.setter
+    def type_def(self, flag):
+        CustomTypeField.type_def.fset(self, flag)
+        self.value_members = {em.value: em for em in self.type_def}
+        self.mask = reduce(or_, self.value_members, 0)
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None:
+            return None
+        with suppress(KeyError):
+            return self.value_members[value]
+        # Bits of flags no longer declared are ignored
+        return self.type_def(value & self.mask)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, self.type_def):
+            return value
+        if isinstance(value, Enum):
+            raise ValidationError("Invalid flag '{}' is a member of an incompatible enumeration".format(repr(value)))
+        if isinstance(value, str) and value.isdigit():
+            value = int(value)
+        if isinstance(value, int) and not isinstance(value, bool):
+            if value & ~self.mask:
+                raise ValidationError("Invalid value {} not a combination of flags {}".format(
+                    value, [em.name for em in self.type_def]))
+            return self.type_def(value)
+        if isinstance(value, str):
+            value = value.split('|') if value else []
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return reduce(or_, (self.to_python_name(name) if isinstance(name, str) else self.to_python(name) for name in value),
+                          self.type_def(0))
+        raise ValidationError("Invalid type '{}' is not a flag, integer, string or iterable".format(type(value).__name__))
+
+    def to_python_name(self, name):
+        name = name.strip()
+        if name.startswith(self.type_def.__name__ + '.'):
+            name = name[len(self.type_def.__name__) + 1:]
+        with suppress(KeyError):
+            return self.type_def[name]
+        raise ValidationError("Invalid name '{}' not in flags {}".format(name, [em.name for em in self.type_def]))
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return self.to_python(value).value
+
+    def value_to_string(self, obj):
+        """ Serialise to the integer value stored in the database """
+        value = self.get_prep_value(self.value_from_object(obj))
+        return None if value is None else str(value)
+
+    def db_type(self, connection):
+        # Fixed width so that added flags are a state only change
+        return models.BigIntegerField().db_type(connection)
+
+
+class FlagLookup(models.Lookup):
+    """ Bitwise comparison of the flags set in a FlagField """
+    sql_template = None
+    rhs_count = 1
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return self.sql_template % {'lhs': lhs, 'rhs': rhs}, lhs_params + rhs_params * self.rhs_count
+
+
+@FlagField.register_lookup
+class HasAll(FlagLookup):
+    lookup_name = 'has_all'
+    sql_template = '(%(lhs)s & %(rhs)s) = %(rhs)s'
+    rhs_count = 2
+
+
+@FlagField.register_lookup
+class HasAny(FlagLookup):
+    lookup_name = 'has_any'
+    sql_template = '(%(lhs)s & %(rhs)s) != 0'
+
+
+@FlagField.register_lookup
+class HasNone(FlagLookup):
+    lookup_name = 'has_none'
+    sql_template = '(%(lhs)s & %(rhs)s) = 0'
+
+
+class FlagState:
+    @classmethod
+    def flags(cls):
+        return {em.name: em.value for em in cls}
+
+    @classmethod
+    def mask(cls):
+        return reduce(or_, cls.flags().values(), 0)
+
+
+def flag_state(flags, name=None, app_label=None):
+    """ Create a FlagState representing the flags or Flag, as a mapping of names to integer values """
+    if isinstance(flags, type) and issubclass(flags, Flag):
+        if not name:
+            name = flags.__name__
+        flags = {em.name: em.value for em in flags}
+    elif not name:
+        name = 'Unnamed Flag'
+    f = Flag(name, sorted(flags.items(), key=lambda item: (item[1], item[0])), type=FlagState)
+    f.Meta = type('Meta', (object,), {})
+    f.Meta.app_label = app_label
+    return f
+
+
+class FlagOperation(CustomTypeOperation):
+    """ Flags are stored in integer columns, so operations mostly only change migration state """
+    field_type = FlagField
+
+
+class CreateFlag(FlagOperation):
+    def __init__(self, db_type, flags):
+        self.db_type = db_type
+        # Mapping of flag names to integer values
+        self.flags = flags
+
+    def describe(self):
+        return 'Create flag type {db_type}'.format(db_type=self.db_type)
+
+    def state_forwards(self, app_label, state):
+        state.add_type(self.db_type, flag_state(self.flags, name=self.db_type, app_label=app_label))
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        pass
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        pass
+
+
+class RemoveFlag(FlagOperation):
+    def __init__(self, db_type):
+        self.db_type = db_type
+
+    def describe(self):
+        return 'Remove flag type {db_type}'.format(db_type=self.db_type)
+
+    def state_forwards(self, app_label, state):
+        state.remove_type(self.db_type)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        pass
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        pass
+
+
+class AlterFlag(FlagOperation):
+    """ Add or remove flags of a type
+        Adding flags or renaming them with the same value only changes state,
+         removed flag values no longer used by any flag are cleared from records
+    """
+    def __init__(self, db_type, add_flags=None, remove_flags=None):
+        self.db_type = db_type
+        # Mappings of flag names to integer values
+        self.add_flags = dict(add_flags or {})
+        self.remove_flags = dict(remove_flags or {})
+
+    def describe(self):
+        return 'Alter flag type {db_type},{added}{removed}'.format(
+            db_type=self.db_type,
+            added=' added {} flag(s)'.format(len(self.add_flags)) if self.add_flags else '',
+            removed=' removed {} flag(s)'.format(len(self.remove_flags)) if self.remove_flags else '')
+
+    def state_forwards(self, app_label, state):
+        flags = {
+            name: value for name, value in state.db_types[self.db_type].flags().items()
+            if name not in self.remove_flags}
+        flags.update(self.add_flags)
+        to_flag = flag_state(flags, name=self.db_type, app_label=app_label)
+        state.add_type(self.db_type, to_flag)
+
+        # Update all fields using this flag
+        for info in self.get_fields(state):
+            changed_field = info.field.clone()
+            changed_field.type_def = to_flag
+            info.model_state.fields[info.field_index] = (info.field_name, changed_field)
+            state.reload_model(info.model_app_label, info.model_name)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        cleared = from_state.db_types[self.db_type].mask() & ~to_state.db_types[self.db_type].mask()
+        if not cleared:
+            return
+
+        # Make sure ORM is ready for use
+        from_state.clear_delayed_apps_cache()
+        db_alias = schema_editor.connection.alias
+        for info in self.get_fields(from_state):
+            model = from_state.apps.get_model(info.model_app_label, info.model_name)
+            if not self.allow_migrate_model(db_alias, model):
+                continue
+            # Single set-based statement, only touching records with a cleared flag set
+            qs = model._base_manager.using(db_alias).filter(**{info.field_name + '__has_any': cleared})
+            query = qs.query.clone(klass=sql.UpdateQuery)
+            query.add_update_values({info.field_name: models.F(info.field_name).bitand(~cleared)})
+            schema_editor.execute(*query.get_compiler(db_alias).as_sql())
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        # Cleared flags cannot be restored
+        pass
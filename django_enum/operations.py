@@ -1,8 +1,8 @@
-
+from collections import OrderedDict
 from enum import Enum
 from operator import attrgetter
 
-from django.db import models
+from django.db import models, transaction
 from django.db.models import sql
 from django.db.models.deletion import Collector
 from django.utils import six
@@ -27,21 +27,45 @@ class EnumState:
     def values_set(cls):
         return set(cls.values())
 
+    @classmethod
+    def codes(cls):
+        return dict(cls.Meta.db_codes)
+
+    @classmethod
+    def declared(cls):
+        return getattr(cls.Meta, 'db_declared', True)
+
 
-def enum_state(values, name=None, app_label=None):
-    """ Create an EnumState representing the values or Enum """
+def enum_state(values, name=None, app_label=None, codes=None, declared=True):
+    """ Create an EnumState representing the values or Enum
+        Integer codes of values are recorded, numbered in order of values if not given
+        Types only used by fields storing codes are not declared in the database
+    """
     if isinstance(values, type) and issubclass(values, Enum):
         if not name:
             name = values.__name__
-        values = (em.value for em in values)
+        if codes is None:
+            codes = {str(em.value): code for code, em in EnumField.get_codes(values).items()}
+        values = [em.value for em in values]
     elif not name:
         name = 'Unnamed Enum'
+    values = list(values)
+    if codes is None:
+        codes = {v: code for code, v in enumerate(values, 1)}
     e = Enum(name, [(v, v) for v in values], type=EnumState)
     e.Meta = type('Meta', (object,), {})
     e.Meta.app_label = app_label
+    e.Meta.db_codes = {v: codes[v] for v in values}
+    e.Meta.db_declared = declared
     return e
 
 
+def next_codes(codes, values):
+    """ Allocate codes to new values after the highest code used, so codes are never reused """
+    start = max(codes.values(), default=0) + 1
+    return {v: code for code, v in enumerate(sorted(values), start)}
+
+
 class SQLCollector(Collector):
     """ Collector that generates the required deletion SQL instead of performing it """
     def as_sql(self):
@@ -88,22 +112,30 @@ class SQLCollector(Collector):
 class EnumOperation(CustomTypeOperation):
     field_type = EnumField
 
+    def get_text_fields(self, fields):
+        """ Exclude fields storing integer codes, their columns are unaffected by the database type """
+        return [(from_model, to_model, field, on_delete) for (from_model, to_model, field, on_delete) in fields if not field.stores_codes]
+
 
 class CreateEnum(EnumOperation):
-    def __init__(self, db_type, values):
+    def __init__(self, db_type, values, codes=None, declare=True):
         # Values follow Enum functional API options to specify
         self.db_type = db_type
         self.values = values
+        # Integer codes of values, for fields with smallint storage
+        self.codes = codes
+        # Whether to declare the database type, not needed when only used by fields storing codes
+        self.declare = declare
 
     def describe(self):
         return 'Create enum type {db_type}'.format(db_type=self.db_type)
 
     def state_forwards(self, app_label, state):
-        enum = enum_state(self.values, name=self.db_type, app_label=app_label)
+        enum = enum_state(self.values, name=self.db_type, app_label=app_label, codes=self.codes, declared=self.declare)
         state.add_type(self.db_type, enum)
 
     def database_forwards(self, app_label, schema_editor, from_state, to_state):
-        if schema_editor.connection.features.requires_enum_declaration:
+        if self.declare and schema_editor.connection.features.requires_enum_declaration:
             enum = to_state.db_types[self.db_type]
             sql = schema_editor.sql_create_enum % {
                 'enum_type': self.db_type,
@@ -111,7 +143,7 @@ class CreateEnum(EnumOperation):
             schema_editor.execute(sql, enum.values())
 
     def database_backwards(self, app_label, schema_editor, from_state, to_state):
-        if schema_editor.connection.features.requires_enum_declaration:
+        if self.declare and schema_editor.connection.features.requires_enum_declaration:
             sql = schema_editor.sql_delete_enum % {
                 'enum_type': self.db_type}
             schema_editor.execute(sql)
@@ -129,13 +161,13 @@ class RemoveEnum(EnumOperation):
         state.remove_type(self.db_type)
 
     def database_forwards(self, app_label, schema_editor, from_state, to_state):
-        if schema_editor.connection.features.requires_enum_declaration:
+        if schema_editor.connection.features.requires_enum_declaration and from_state.db_types[self.db_type].declared():
             sql = schema_editor.sql_delete_enum % {
                 'enum_type': self.db_type}
             schema_editor.execute(sql)
 
     def database_backwards(self, app_label, schema_editor, from_state, to_state):
-        if schema_editor.connection.features.requires_enum_declaration:
+        if schema_editor.connection.features.requires_enum_declaration and to_state.db_types[self.db_type].declared():
             enum = to_state.db_types[self.db_type]
             sql = schema_editor.sql_create_enum % {
                 'enum_type': self.db_type,
@@ -155,7 +187,7 @@ class RenameEnum(EnumOperation):
 
     def state_forwards(self, app_label, state):
         old_enum = state.db_types[self.old_db_type]
-        enum = enum_state(old_enum, name=self.db_type, app_label=app_label)
+        enum = enum_state(old_enum, name=self.db_type, app_label=app_label, declared=old_enum.declared())
         state.remove_type(self.old_db_type)
         state.add_type(self.db_type, enum)
 
@@ -167,7 +199,7 @@ class RenameEnum(EnumOperation):
             state.reload_model(info.model_app_label, info.model_name)
 
     def database_forwards(self, app_label, schema_editor, from_state, to_state):
-        if schema_editor.connection.features.requires_enum_declaration:
+        if schema_editor.connection.features.requires_enum_declaration and from_state.db_types[self.old_db_type].declared():
             sql = schema_editor.sql_rename_enum % {
                 'old_type': self.old_db_type,
                 'enum_type': self.db_type}
@@ -184,22 +216,43 @@ class RenameEnum(EnumOperation):
 class AlterEnum(EnumOperation):
     temp_db_type = 'django_enum_temp'
     transition_db_type = 'django_enum_transition'
+    online_batch_size = 10000
 
-    def __init__(self, db_type, add_values=None, remove_values=None, on_delete=models.PROTECT):
+    def __init__(
+            self, db_type, add_values=None, remove_values=None, on_delete=models.PROTECT, codes=None, batch_size=None,
+            online=False, declare=False):
         self.db_type = db_type
         self.add_values = set(add_values or ())
         self.remove_values = set(remove_values or ())
         self.on_delete = on_delete
+        # Integer codes of all values after the change, for fields with smallint storage
+        self.codes = codes
+        # Apply on_delete updates and deletes in batches of primary key ranges
+        self.batch_size = batch_size
+        # Replace columns without a table rewrite where values are removed, on databases declaring enum types
+        self.online = online
+        # Declare the database type, where it was previously only used by fields storing codes
+        self.declare = declare
 
     def describe(self):
-        return 'Alter enum type {db_type},{added}{removed}'.format(
+        return 'Alter enum type {db_type},{added}{removed}{recoded}{declared}'.format(
             db_type=self.db_type,
             added=' added {} value(s)'.format(len(self.add_values)) if self.add_values else '',
-            removed=' removed {} value(s)'.format(len(self.remove_values)) if self.remove_values else '')
+            removed=' removed {} value(s)'.format(len(self.remove_values)) if self.remove_values else '',
+            recoded=' recorded codes' if self.codes else '',
+            declared=' declared type' if self.declare else '')
 
     def state_forwards(self, app_label, state):
         from_enum = state.db_types[self.db_type]
-        to_enum = enum_state((from_enum.values_set() | self.add_values) - self.remove_values, name=self.db_type, app_label=app_label)
+        # Keep the existing order with added values at the end, so inline enums can be extended in place
+        values = [v for v in from_enum.values() if v not in self.remove_values]
+        values += sorted(self.add_values - from_enum.values_set())
+        codes = self.codes
+        if codes is None:
+            codes = {v: code for v, code in from_enum.codes().items() if v in values}
+            codes.update(next_codes(from_enum.codes(), set(values) - set(codes)))
+        to_enum = enum_state(
+            values, name=self.db_type, app_label=app_label, codes=codes, declared=from_enum.declared() or self.declare)
         state.add_type(self.db_type, to_enum)
 
         # Update all fields using this enum
@@ -218,6 +271,29 @@ class AlterEnum(EnumOperation):
         from_state.clear_delayed_apps_cache()
         db_alias = schema_editor.connection.alias
 
+        from_values = from_state.db_types[self.db_type].values()
+        to_values = to_state.db_types[self.db_type].values()
+        # Types only used by fields storing codes have no database type to alter
+        requires_declaration = schema_editor.connection.features.requires_enum_declaration
+        declared = requires_declaration and from_state.db_types[self.db_type].declared()
+        to_declared = requires_declaration and to_state.db_types[self.db_type].declared()
+        if to_declared and not declared:
+            # Declared with the values after the change, so there is nothing more to alter
+            sql = schema_editor.sql_create_enum % {
+                'enum_type': self.db_type,
+                'values': ', '.join(['%s'] * len(to_values))}
+            pre_actions.append((sql, to_values))
+        elif declared and not to_declared:
+            sql = schema_editor.sql_delete_enum % {
+                'enum_type': self.db_type}
+            post_actions.append((sql, []))
+            declared = False
+
+        online = self.online and schema_editor.connection.features.requires_enum_declaration
+        if online and self.remove_values and schema_editor.connection.in_atomic_block and not schema_editor.collect_sql:
+            raise ValueError('Online AlterEnum of {} must be in a migration with atomic = False'.format(self.db_type))
+        online_fields = []
+
         # Get field/model list
         fields = [
             (from_model, to_model, from_field, self.on_delete or from_field.on_delete)
@@ -230,33 +306,24 @@ class AlterEnum(EnumOperation):
         if self.remove_values:
             # The first post delete actions are to finalise the field types
             if schema_editor.connection.features.has_enum:
-                if schema_editor.connection.features.requires_enum_declaration:
+                if online:
+                    online_fields = [(from_model, field) for (from_model, to_model, field, on_delete) in self.get_text_fields(fields)]
+                elif schema_editor.connection.features.requires_enum_declaration:
                     sql_alter_column_type = getattr(
                         schema_editor,
                         'sql_alter_column_type_using',
                         schema_editor.sql_alter_column_type)
-                    for (from_model, to_model, field, on_delete) in fields:
-                        db_table = schema_editor.quote_name(from_model._meta.db_table)
-                        db_field = schema_editor.quote_name(field.column)
-                        sql = schema_editor.sql_alter_column % {
-                            'table': db_table,
-                            'changes': sql_alter_column_type % {
-                                'column': db_field,
-                                'type': self.temp_db_type,
-                                'old_type': self.db_type}}
-                        post_actions.append((sql, []))
+                    post_actions.extend(self.alter_columns_sql(schema_editor, (
+                        (from_model, sql_alter_column_type % {
+                            'column': schema_editor.quote_name(field.column),
+                            'type': self.temp_db_type,
+                            'old_type': self.db_type}, [])
+                        for (from_model, to_model, field, on_delete) in self.get_text_fields(fields))))
                 else:
-                    for (from_model, to_model, field, on_delete) in fields:
-                        db_table = schema_editor.quote_name(from_model._meta.db_table)
-                        db_field = schema_editor.quote_name(field.column)
-                        new_field = to_model._meta.get_field(field.name)
-                        db_type, params = new_field.db_type(schema_editor.connection).paramatized
-                        sql = schema_editor.sql_alter_column % {
-                            'table': db_table,
-                            'changes': schema_editor.sql_alter_column_type % {
-                                'column': db_field,
-                                'type': db_type}}
-                        post_actions.append((sql, params))
+                    post_actions.extend(self.alter_columns_sql(schema_editor, (
+                        self.alter_column_type(schema_editor, from_model, to_model._meta.get_field(field.name))
+                        for (from_model, to_model, field, on_delete) in self.get_text_fields(fields)),
+                        algorithm=self.get_algorithm(schema_editor, from_values, to_values)))
 
             if self.add_values:
                 # If there's the possibility of inconsistent actions, use transition type
@@ -264,18 +331,30 @@ class AlterEnum(EnumOperation):
                 # On DB's without enum support this isn't necessary as they are always CHAR
                 transition_fields = [
                     (from_model, field)
-                    for (from_model, to_model, field, on_delete) in fields
+                    for (from_model, to_model, field, on_delete) in self.get_text_fields(fields)
                     if hasattr(on_delete, 'deconstruct')
                     or (on_delete == models.SET_DEFAULT and field.get_default() in self.add_values)]
 
-                if transition_fields and schema_editor.connection.features.has_enum:
-                    transition_values = to_state.db_types[self.db_type].values_set() | self.remove_values
+                if transition_fields and online:
+                    # Columns are not rewritten, so new values are added to the existing type instead
+                    transition_values = from_values + [v for v in to_values if v not in from_values]
+                    transition_enum = enum_state(transition_values, 'transitional_enum')
+                    for value in sorted(self.add_values):
+                        sql = schema_editor.sql_alter_enum % {
+                            'enum_type': self.db_type,
+                            'value': '%s',
+                            'condition': ''}
+                        pre_actions.append((sql, [value]))
+                    for (model, field) in transition_fields:
+                        field.type_def = transition_enum
+                elif transition_fields and schema_editor.connection.features.has_enum:
+                    transition_values = from_values + [v for v in to_values if v not in from_values]
                     transition_enum = enum_state(transition_values, 'transitional_enum')
                     if schema_editor.connection.features.requires_enum_declaration:
                         # Create transition type
                         sql = schema_editor.sql_create_enum % {
                             'enum_type': self.transition_db_type,
-                            'choices': ', '.join(['%s'] * len(transition_values))}
+                            'values': ', '.join(['%s'] * len(transition_values))}
                         pre_actions.append((sql, list(transition_values)))
                         # Drop transition type after done
                         sql = schema_editor.sql_delete_enum % {
@@ -284,19 +363,14 @@ class AlterEnum(EnumOperation):
 
                     # Set fields to transition type
                     for (model, field) in transition_fields:
-                        db_table = schema_editor.quote_name(model._meta.db_table)
-                        db_field = schema_editor.quote_name(field.column)
                         field.type_name = self.transition_db_type
                         field.type_def = transition_enum
-                        db_type, params = field.db_type(schema_editor.connection).paramatized
-                        sql = schema_editor.sql_alter_column % {
-                            'table': db_table,
-                            'changes': schema_editor.sql_alter_column_type % {
-                                'column': db_field,
-                                'type': db_type}}
-                        pre_actions.append((sql, params))
-
-            if schema_editor.connection.features.requires_enum_declaration:
+                    pre_actions.extend(self.alter_columns_sql(schema_editor, (
+                        self.alter_column_type(schema_editor, model, field)
+                        for (model, field) in transition_fields),
+                        algorithm=self.get_algorithm(schema_editor, from_values, transition_values)))
+
+            if declared:
                 # Create new type with temporary name
                 to_enum = to_state.db_types[self.db_type]
                 sql = schema_editor.sql_create_enum % {
@@ -314,25 +388,18 @@ class AlterEnum(EnumOperation):
 
         elif self.add_values:
             # Just adding values? Directly modify types, no hassle!
-            if schema_editor.connection.features.requires_enum_declaration:
-                for value in self.add_values:
+            if requires_declaration:
+                for value in to_values[len(from_values):] if declared else ():
                     sql = schema_editor.sql_alter_enum % {
                         'enum_type': self.db_type,
-                        'value': '%s'}
+                        'value': '%s',
+                        'condition': ''}
                     post_actions.append((sql, [value]))
             elif schema_editor.connection.features.has_enum:
-                for (from_model, to_model, field, on_delete) in fields:
-                    db_table = schema_editor.quote_name(from_model._meta.db_table)
-                    db_field = schema_editor.quote_name(field.column)
-                    new_field = to_model._meta.get_field(field.name)
-                    db_type, params = new_field.db_type(schema_editor.connection).paramatized
-
-                    schema_editor.sql_alter_column % {
-                        'table': db_table,
-                        'changes': schema_editor.sql_alter_column_type % {
-                            'column': db_field,
-                            'type': db_type}}
-                    post_actions.append((sql, params))
+                post_actions.extend(self.alter_columns_sql(schema_editor, (
+                    self.alter_column_type(schema_editor, from_model, to_model._meta.get_field(field.name))
+                    for (from_model, to_model, field, on_delete) in self.get_text_fields(fields)),
+                    algorithm=self.get_algorithm(schema_editor, from_values, to_values)))
 
         # Prepare database for data to be migrated
         for sql, params in pre_actions:
@@ -340,30 +407,30 @@ class AlterEnum(EnumOperation):
 
         # Apply all on_delete actions making data consistent with to_state values
         if self.remove_values:
-            # Cheap hack to allow on_delete to work
-            for (from_model, to_model, field, on_delete) in fields:
-                field.remote_field = self
-
-            # Records affected by on_delete action
-            on_delete_gen = ((
-                    field,
-                    from_model.objects.using(db_alias).filter(
-                        models.Q(('{}__in'.format(field.name), self.remove_values))
-                    ).only('pk'),
-                    on_delete)
-                for (from_model, to_model, field, on_delete) in fields)
-
-            # Validate on_delete constraints
             collector = SQLCollector(using=db_alias)
-            for (field, qs, on_delete) in on_delete_gen:
-                if qs:
-                    # Trigger the on_delete collection directly
-                    on_delete(collector, field, qs, db_alias)
+            codes = to_state.db_types[self.db_type].codes()
+            batch_size = self.batch_size
+            if batch_size and schema_editor.collect_sql:
+                # Ranges depend on the records when applied, so they can't be written out in advance
+                batch_size = None
+                schema_editor.collected_sql.append(
+                    '-- Records with removed values of {} are updated in batches of {} when migrated, '
+                    'shown here as single statements'.format(self.db_type, self.batch_size))
+            for (from_model, to_model, field, on_delete) in fields:
+                # Records affected by on_delete action
+                qs = from_model._base_manager.using(db_alias).filter(
+                    models.Q(('{}__in'.format(field.name), self.remove_values)))
+                for sql, params in self.on_delete_sql(
+                        field, qs, on_delete, collector, codes=codes, batch_size=batch_size):
+                    schema_editor.execute(sql, params)
             for sql, params in collector.as_sql():
                 # Use SQLCollector.as_sql() instead of directly executing
                 # Such that manage.py sqlmigration correctly reflects all actions
                 schema_editor.execute(sql, params)
 
+        for (model, field) in online_fields:
+            self.replace_column_online(schema_editor, model, field)
+
         # Apply final changes
         for sql, params in post_actions:
             schema_editor.execute(sql, params)
@@ -374,3 +441,211 @@ class AlterEnum(EnumOperation):
         self.database_forwards(app_label, schema_editor, from_state, to_state)
 
         self.add_values, self.remove_values = self.remove_values, self.add_values
+
+    @staticmethod
+    def alter_column_type(schema_editor, model, field):
+        """ Column change to the database type of a field, as (model, sql, params) for alter_columns_sql """
+        db_type, params = field.db_type(schema_editor.connection).paramatized
+        if hasattr(schema_editor, '_set_field_new_type_null_status'):
+            # MySQL redeclares the whole column, keep it unchanged besides the type
+            db_type = schema_editor._set_field_new_type_null_status(field, db_type)
+        return model, schema_editor.sql_alter_column_type % {
+            'column': schema_editor.quote_name(field.column),
+            'type': db_type}, list(params)
+
+    @staticmethod
+    def get_algorithm(schema_editor, from_values, to_values):
+        """ Explicit algorithm clause for redeclaring inline enum columns, where the database has them """
+        if hasattr(schema_editor, 'enum_alter_algorithm'):
+            return schema_editor.enum_alter_algorithm(from_values, to_values)
+
+    @staticmethod
+    def alter_columns_sql(schema_editor, changes, algorithm=None):
+        """ Combine column changes into a single ALTER TABLE per table, so each table is rewritten once
+            * changes :: Iterable of (model, column change sql, params)
+            * algorithm :: Clause added to each statement, ie ALGORITHM=INSTANT
+        """
+        tables = OrderedDict()
+        for model, change, params in changes:
+            table_changes, table_params = tables.setdefault(model._meta.db_table, ([], []))
+            table_changes.append(change)
+            table_params.extend(params)
+        return [
+            (schema_editor.sql_alter_column % {
+                'table': schema_editor.quote_name(db_table),
+                'changes': ', '.join(table_changes + ([algorithm] if algorithm else []))}, table_params)
+            for db_table, (table_changes, table_params) in tables.items()]
+
+    def on_delete_sql(self, field, qs, on_delete, collector, codes=None, batch_size=None):
+        """ Generate set-based UPDATE/DELETE statements applying on_delete to records with removed values
+            Records are only collected when cascading to dependent records, or for custom on_delete handlers
+            * codes :: Integer codes of the values after the change, written for fields storing codes
+            * batch_size :: Records per statement, each range found as the previous statement is applied
+        """
+        if on_delete is models.DO_NOTHING:
+            return
+        if on_delete is models.PROTECT:
+            protected = list(qs.only('pk')[:10])
+            if protected:
+                raise models.ProtectedError(
+                    "Cannot remove values {values} from enum {db_type} because they are used by "
+                    "protected field '{model}.{field}'".format(
+                        values=sorted(self.remove_values),
+                        db_type=self.db_type,
+                        model=qs.model.__name__,
+                        field=field.name),
+                    protected)
+            return
+
+        if on_delete is models.CASCADE:
+            if not collector.can_fast_delete(qs):
+                # Dependent records must be collected to cascade to them
+                collector.collect(qs.only('pk'))
+                return
+            query_class, values = sql.DeleteQuery, None
+        elif on_delete is models.SET_NULL:
+            query_class, values = sql.UpdateQuery, {field.name: None}
+        elif on_delete is models.SET_DEFAULT:
+            query_class, values = sql.UpdateQuery, {field.name: field.get_default()}
+        elif hasattr(on_delete, 'deconstruct'):
+            # models.SET(value)
+            value = on_delete.deconstruct()[1][0]
+            query_class, values = sql.UpdateQuery, {field.name: value() if callable(value) else value}
+        else:
+            # Cheap hack to allow custom on_delete handlers to work
+            field.remote_field = self
+            on_delete(collector, field, qs.only('pk'), collector.using)
+            return
+
+        if values:
+            # The field only knows the values before the change, which may not include added values,
+            # so values after it are written directly, as their codes for fields storing codes
+            values = {
+                name: models.Value(codes[value] if field.stores_codes else value) if value in codes else value
+                for name, value in values.items()
+                for value in [getattr(value, 'value', value)]}
+
+        for batch in self.get_batches(qs, batch_size):
+            query = batch.query.clone(klass=query_class)
+            if values:
+                query.add_update_values(values)
+            yield query.get_compiler(collector.using).as_sql()
+
+    def get_batches(self, qs, batch_size=None):
+        """ Split a queryset into consecutive primary key ranges of batch_size records """
+        if not batch_size:
+            yield qs
+            return
+        for lower, upper in self.get_ranges(qs, batch_size):
+            batch = qs
+            if lower is not None:
+                batch = batch.filter(pk__gt=lower)
+            if upper is not None:
+                batch = batch.filter(pk__lte=upper)
+            yield batch
+
+    @staticmethod
+    def get_ranges(qs, batch_size):
+        """ Consecutive primary key ranges (lower, upper] of batch_size records, None where unbounded
+            Each range is found from the records remaining after the previous one, so they may be updated in between
+        """
+        lower = None
+        while True:
+            batch = qs if lower is None else qs.filter(pk__gt=lower)
+            upper = next(iter(batch.order_by('pk').values_list('pk', flat=True)[batch_size - 1:batch_size]), None)
+            yield lower, upper
+            if upper is None:
+                return
+            lower = upper
+
+    def replace_column_online(self, schema_editor, model, field):
+        """ Replace the column of a field with one of the new type without rewriting the table under lock
+            A shadow column is added and kept in sync by a trigger while it is backfilled in batches,
+             then swapped in place of the column in a short transaction
+            Single column indexes and unique constraints are recreated, other constraints on the column are not supported
+        """
+        connection = schema_editor.connection
+        quote_name = schema_editor.quote_name
+        db_table = model._meta.db_table
+        shadow = schema_editor._create_index_name(model, [field.column], suffix='_enum')
+        names = {
+            'table': quote_name(db_table),
+            'column': quote_name(field.column),
+            'shadow': quote_name(shadow),
+            'type': self.temp_db_type,
+            'check': quote_name(schema_editor._create_index_name(model, [shadow], suffix='_notnull')),
+            'function': quote_name(schema_editor._create_index_name(model, [field.column], suffix='_enum_sync')),
+            'trigger': quote_name(schema_editor._create_index_name(model, [field.column], suffix='_enum_sync')),
+        }
+
+        with connection.cursor() as cursor:
+            cursor.execute(schema_editor.sql_enum_column_indexes, [names['table'], field.column])
+            indexes = cursor.fetchall()
+            cursor.execute(schema_editor.sql_enum_column_checks, [names['table'], field.column])
+            unsupported = [name for name, in cursor.fetchall()]
+        unsupported += [constraint or index for index, unique, constraint, supported in indexes if not supported]
+        if unsupported:
+            raise ValueError('Online AlterEnum cannot recreate {constraints} on {table}.{column}'.format(
+                constraints=', '.join(unsupported),
+                table=db_table,
+                column=field.column))
+
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute(schema_editor.sql_enum_add_shadow % names)
+            if not field.null:
+                schema_editor.execute(schema_editor.sql_enum_add_shadow_check % names)
+            schema_editor.execute(schema_editor.sql_enum_create_sync_function % names)
+            schema_editor.execute(schema_editor.sql_enum_create_sync_trigger % names)
+
+        # Backfill existing records, each batch committed separately
+        pk_column = '{}.{}'.format(names['table'], quote_name(model._meta.pk.column))
+        qs = model._base_manager.using(connection.alias).all()
+        batch_size = self.batch_size or self.online_batch_size
+        if schema_editor.collect_sql:
+            # Ranges depend on the records when applied, so they can't be written out in advance
+            ranges = [(None, None)]
+            schema_editor.collected_sql.append(
+                '-- Backfilled in batches of {} when migrated, shown here as a single statement'.format(batch_size))
+        else:
+            ranges = self.get_ranges(qs, batch_size)
+        for lower, upper in ranges:
+            conditions, params = ['TRUE'], []
+            if lower is not None:
+                conditions.append('{} > %s'.format(pk_column))
+                params.append(lower)
+            if upper is not None:
+                conditions.append('{} <= %s'.format(pk_column))
+                params.append(upper)
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute(
+                    schema_editor.sql_enum_backfill_shadow % dict(names, condition=' AND '.join(conditions)),
+                    params)
+        if not field.null:
+            schema_editor.execute(schema_editor.sql_enum_validate_shadow_check % names)
+
+        # Build indexes on the shadow column without blocking writes
+        renames = []
+        for i, (index, unique, constraint, supported) in enumerate(indexes):
+            index_names = dict(
+                names,
+                index=quote_name(schema_editor._create_index_name(model, [shadow], suffix='_enum{}'.format(i))),
+                name=quote_name(constraint or index),
+                unique='UNIQUE ' if unique else '')
+            schema_editor.execute(schema_editor.sql_enum_create_shadow_index % index_names)
+            if constraint:
+                renames.append(schema_editor.sql_enum_unique_using_index % index_names)
+            else:
+                renames.append(schema_editor.sql_enum_rename_index % index_names)
+
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute(schema_editor.sql_enum_lock_table % names)
+            schema_editor.execute(schema_editor.sql_enum_drop_sync_trigger % names)
+            schema_editor.execute(schema_editor.sql_enum_drop_sync_function % names)
+            schema_editor.execute(schema_editor.sql_enum_drop_column % names)
+            schema_editor.execute(schema_editor.sql_enum_rename_shadow % names)
+            if not field.null:
+                # Uses the validated check constraint to avoid scanning the table
+                schema_editor.execute(schema_editor.sql_enum_set_not_null % names)
+                schema_editor.execute(schema_editor.sql_enum_drop_shadow_check % names)
+            for sql in renames:
+                schema_editor.execute(sql)
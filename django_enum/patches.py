@@ -1,12 +1,20 @@
 """ Container classes for methods and attributes to be patched into django """
 from enum import Enum
 # Framework imports
+from django.core.management.base import CommandError
 from django.db import models
 # Project imports
 from django_types.utils import find_fields
 from patchy import super_patchy
-from .operations import CreateEnum, RemoveEnum, RenameEnum, AlterEnum, enum_state
+from .operations import CreateEnum, RemoveEnum, RenameEnum, AlterEnum, enum_state, next_codes
 from .fields import EnumField
+try:
+    from enum import Flag
+except ImportError:
+    # Python 3.5, enum.Flag is only available from 3.6
+    Flag = None
+else:
+    from .flags import FlagField, CreateFlag, RemoveFlag, AlterFlag, flag_state
 
 
 class MigrationQuestioner:
@@ -80,6 +88,64 @@ class PostgresDatabaseSchemaEditor:
 
     sql_alter_column_type_using = 'ALTER COLUMN %(column)s TYPE %(type)s USING (%(column)s::text::%(type)s)'
 
+    # Online column replacement, a shadow column of the new type kept in sync by a trigger until swapped in
+    sql_enum_add_shadow = 'ALTER TABLE %(table)s ADD COLUMN %(shadow)s %(type)s NULL'
+    sql_enum_add_shadow_check = 'ALTER TABLE %(table)s ADD CONSTRAINT %(check)s CHECK (%(shadow)s IS NOT NULL) NOT VALID'
+    sql_enum_create_sync_function = (
+        'CREATE FUNCTION %(function)s() RETURNS trigger AS $$ BEGIN '
+        'NEW.%(shadow)s := NEW.%(column)s::text::%(type)s; RETURN NEW; '
+        'END $$ LANGUAGE plpgsql')
+    sql_enum_create_sync_trigger = (
+        'CREATE TRIGGER %(trigger)s BEFORE INSERT OR UPDATE ON %(table)s '
+        'FOR EACH ROW EXECUTE PROCEDURE %(function)s()')
+    sql_enum_backfill_shadow = 'UPDATE %(table)s SET %(shadow)s = %(column)s::text::%(type)s WHERE %(condition)s'
+    sql_enum_validate_shadow_check = 'ALTER TABLE %(table)s VALIDATE CONSTRAINT %(check)s'
+    sql_enum_create_shadow_index = 'CREATE %(unique)sINDEX CONCURRENTLY %(index)s ON %(table)s (%(shadow)s)'
+    sql_enum_lock_table = 'LOCK TABLE %(table)s IN ACCESS EXCLUSIVE MODE'
+    sql_enum_drop_sync_trigger = 'DROP TRIGGER %(trigger)s ON %(table)s'
+    sql_enum_drop_sync_function = 'DROP FUNCTION %(function)s()'
+    sql_enum_drop_column = 'ALTER TABLE %(table)s DROP COLUMN %(column)s'
+    sql_enum_rename_shadow = 'ALTER TABLE %(table)s RENAME COLUMN %(shadow)s TO %(column)s'
+    sql_enum_set_not_null = 'ALTER TABLE %(table)s ALTER COLUMN %(column)s SET NOT NULL'
+    sql_enum_drop_shadow_check = 'ALTER TABLE %(table)s DROP CONSTRAINT %(check)s'
+    sql_enum_unique_using_index = 'ALTER TABLE %(table)s ADD CONSTRAINT %(name)s UNIQUE USING INDEX %(index)s'
+    sql_enum_rename_index = 'ALTER INDEX %(index)s RENAME TO %(name)s'
+    # Indexes on a column with name, uniqueness, unique constraint name and whether it can be recreated on another column
+    sql_enum_column_indexes = (
+        'SELECT ic.relname, i.indisunique, c.conname, '
+        'NOT (i.indnatts > 1 OR i.indisprimary OR i.indpred IS NOT NULL OR i.indexprs IS NOT NULL '
+        "OR COALESCE(c.contype, 'u') != 'u') "
+        'FROM pg_index i JOIN pg_class ic ON ic.oid = i.indexrelid '
+        'JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) '
+        'LEFT JOIN pg_constraint c ON c.conindid = i.indexrelid AND c.conrelid = i.indrelid '
+        'WHERE i.indrelid = %s::regclass AND a.attname = %s')
+    # Check and foreign key constraints on a column, which are not recreated
+    sql_enum_column_checks = (
+        'SELECT c.conname FROM pg_constraint c '
+        'JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey) '
+        "WHERE c.conrelid = %s::regclass AND a.attname = %s AND c.contype IN ('c', 'f')")
+
+
+class MysqlDatabaseSchemaEditor:
+    # Enum column changes with explicit algorithms, so an unexpected table copy fails instead
+    # https://dev.mysql.com/doc/refman/8.0/en/innodb-online-ddl-operations.html#online-ddl-column-operations
+    sql_enum_algorithm_instant = 'ALGORITHM=INSTANT'
+    sql_enum_algorithm_inplace = 'ALGORITHM=INPLACE, LOCK=NONE'
+    sql_enum_algorithm_copy = 'ALGORITHM=COPY'
+
+    def enum_alter_algorithm(self, from_values, to_values):
+        """ Algorithm for redeclaring enum columns with from_values as to_values
+            Appending values without changing the storage size (up to 255 values in 1 byte) is metadata only
+        """
+        appended = to_values[:len(from_values)] == from_values and (len(from_values) > 255 or len(to_values) <= 255)
+        if not appended:
+            return self.sql_enum_algorithm_copy
+        # INSTANT is available from MySQL 8.0.12 and MariaDB 10.3.7
+        version = self.connection.mysql_version
+        if (8, 0, 12) <= version < (10, 0) or version >= (10, 3, 7):
+            return self.sql_enum_algorithm_instant
+        return self.sql_enum_algorithm_inplace
+
 
 class MigrationAutodetector:
 
@@ -89,8 +155,21 @@ class MigrationAutodetector:
             if info.field.type_name not in self.to_state.db_types:
                 self.to_state.add_type(info.field.type_name, enum_state(info.field.type_def, app_label=info.field.type_app_label))
 
-        from_enum_types = set(db_type for db_type, e in self.from_state.db_types.items() if issubclass(e, Enum))
-        to_enum_types = set(db_type for db_type, e in self.to_state.db_types.items() if issubclass(e, Enum))
+        # Flags are enums too, but detected separately
+        from_enum_types = set(
+            db_type for db_type, e in self.from_state.db_types.items()
+            if issubclass(e, Enum) and not (Flag and issubclass(e, Flag)))
+        to_enum_types = set(
+            db_type for db_type, e in self.to_state.db_types.items()
+            if issubclass(e, Enum) and not (Flag and issubclass(e, Flag)))
+        # Types with fields storing integer codes, where the codes must be recorded and kept stable
+        from_coded_types = set(
+            info.field.type_name for info in find_fields(self.from_state, field_type=EnumField) if info.field.stores_codes)
+        to_coded_types = set(
+            info.field.type_name for info in find_fields(self.to_state, field_type=EnumField) if info.field.stores_codes)
+        # Types with fields storing text, which need the database type declared
+        to_text_types = set(
+            info.field.type_name for info in find_fields(self.to_state, field_type=EnumField) if not info.field.stores_codes)
 
         # Look for renamed enums
         new_enum_sets = {k: self.to_state.db_types[k].values_set() for k in to_enum_types - from_enum_types}
@@ -100,6 +179,12 @@ class MigrationAutodetector:
                 # Compare only the values
                 if enum_set == rem_enum_set:
                     if self.questioner.ask_rename_enum(db_type, rem_db_type, enum_set):
+                        if db_type in to_text_types and not self.from_state.db_types[rem_db_type].declared():
+                            # Operations are inserted at the beginning, so this follows the rename
+                            self.add_operation(
+                                self.to_state.db_types[db_type].Meta.app_label,
+                                AlterEnum(db_type=db_type, declare=True),
+                                beginning=True)
                         self.add_operation(
                             self.to_state.db_types[db_type].Meta.app_label,
                             RenameEnum(old_type=rem_db_type, new_type=db_type),
@@ -110,9 +195,15 @@ class MigrationAutodetector:
 
         # Create new enums
         for db_type, values in new_enum_sets.items():
+            paras = {'db_type': db_type, 'values': list(values)}
+            if db_type in to_coded_types:
+                paras['codes'] = self.to_state.db_types[db_type].codes()
+                paras['values'].sort(key=paras['codes'].get)
+            if db_type not in to_text_types:
+                paras['declare'] = False
             self.add_operation(
                 self.to_state.db_types[db_type].Meta.app_label,
-                CreateEnum(db_type=db_type, values=list(values)),
+                CreateEnum(**paras),
                 beginning=True)
 
         # Remove old enums
@@ -128,7 +219,25 @@ class MigrationAutodetector:
             self.to_state.db_types[k].values_set())
             for k in from_enum_types & to_enum_types}
         for db_type, (old_set, new_set) in existing_enum_sets.items():
-            if old_set != new_set:
+            recode = False
+            if db_type in to_coded_types:
+                old_codes = self.from_state.db_types[db_type].codes()
+                new_codes = self.to_state.db_types[db_type].codes()
+                if db_type in from_coded_types:
+                    changed = sorted(v for v in old_set & new_set if old_codes[v] != new_codes[v])
+                    if changed:
+                        raise CommandError(
+                            'Enum {db_type} changes the stored codes of {values}, as its members were reordered or '
+                            'inserted. Declare Meta.db_codes on the enum to keep the existing codes: {codes}'.format(
+                                db_type=db_type,
+                                values=changed,
+                                codes={v: old_codes[v] for v in sorted(old_set & new_set, key=old_codes.get)}))
+                    recode = any(new_codes[v] != code for v, code in next_codes(old_codes, new_set - old_set).items())
+                else:
+                    # Codes are first being relied upon, record them
+                    recode = new_codes != old_codes
+            declare = db_type in to_text_types and not self.from_state.db_types[db_type].declared()
+            if old_set != new_set or recode or declare:
                 paras = {'db_type': db_type}
                 removed = list(old_set - new_set)
                 added = list(new_set - old_set)
@@ -137,12 +246,59 @@ class MigrationAutodetector:
                     paras['on_delete'] = self.questioner.ask_remove_enum_values(db_type, removed)
                 if added:
                     paras['add_values'] = added
+                if recode:
+                    paras['codes'] = new_codes
+                if declare:
+                    paras['declare'] = True
                 self.add_operation(
                     self.from_state.db_types[db_type].Meta.app_label,
                     AlterEnum(**paras),
                     beginning=True)
 
+    def detect_flags(self):
+        if not Flag:
+            return
+        # Scan to_state new flags in use
+        for info in find_fields(self.to_state, field_type=FlagField):
+            if info.field.type_name not in self.to_state.db_types:
+                self.to_state.add_type(info.field.type_name, flag_state(info.field.type_def, app_label=info.field.type_app_label))
+
+        from_flag_types = set(db_type for db_type, e in self.from_state.db_types.items() if issubclass(e, Flag))
+        to_flag_types = set(db_type for db_type, e in self.to_state.db_types.items() if issubclass(e, Flag))
+
+        # Create new flags
+        for db_type in to_flag_types - from_flag_types:
+            self.add_operation(
+                self.to_state.db_types[db_type].Meta.app_label,
+                CreateFlag(db_type=db_type, flags=self.to_state.db_types[db_type].flags()),
+                beginning=True)
+
+        # Remove old flags
+        for db_type in from_flag_types - to_flag_types:
+            self.add_operation(
+                self.from_state.db_types[db_type].Meta.app_label,
+                RemoveFlag(db_type=db_type),
+                beginning=True)
+
+        # Renamed or revalued flags are a remove + add
+        for db_type in from_flag_types & to_flag_types:
+            old_flags = self.from_state.db_types[db_type].flags()
+            new_flags = self.to_state.db_types[db_type].flags()
+            if old_flags != new_flags:
+                paras = {'db_type': db_type}
+                removed = {name: value for name, value in old_flags.items() if new_flags.get(name) != value}
+                added = {name: value for name, value in new_flags.items() if old_flags.get(name) != value}
+                if removed:
+                    paras['remove_flags'] = removed
+                if added:
+                    paras['add_flags'] = added
+                self.add_operation(
+                    self.from_state.db_types[db_type].Meta.app_label,
+                    AlterFlag(**paras),
+                    beginning=True)
+
     # Better to do after model creation and then inject operations at front of list
     def generate_created_models(self, *args, **kwargs):
         super_patchy(*args, **kwargs)
         self.detect_enums()
+        self.detect_flags()
@@ -0,0 +1,147 @@
+""" Suggest partial indexes from observed queries """
+import re
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test.utils import CaptureQueriesContext
+
+__all__ = ['IndexAdvisor']
+
+
+# A single comparison of a column to a literal, ie "table"."column" = 'value'
+predicate = namedtuple('predicate', ['table', 'column', 'operator', 'value'])
+# A recommended index and the evidence for it
+suggestion = namedtuple('suggestion', ['model', 'fields', 'filters', 'count', 'matching', 'total'])
+
+
+class IndexAdvisor:
+    """ Collects SQL and proposes PartialIndex declarations for recurring constant predicates
+        * min_count :: Number of queries a predicate must appear in to be considered
+        * max_values :: Columns compared to more distinct values than this are
+          treated as variable and become candidate index fields instead
+    """
+    re_identifier = r'[`"]?(\w+)[`"]?'
+    re_predicate = re.compile(
+        r'{ident}\.{ident}\s*(=|IS NOT|IS)\s*(\'(?:[^\']|\'\')*\'|-?\d+(?:\.\d+)?\b|NULL\b|TRUE\b|FALSE\b)'.format(
+            ident=re_identifier),
+        re.IGNORECASE)
+    re_column = re.compile(r'{ident}\.{ident}'.format(ident=re_identifier))
+    re_where = re.compile(r'\sWHERE\s(.*?)(?:\sGROUP BY\s|\sORDER BY\s|\sLIMIT\s|$)', re.IGNORECASE | re.DOTALL)
+    re_order_by = re.compile(r'\sORDER BY\s(.*?)(?:\sLIMIT\s|\sOFFSET\s|$)', re.IGNORECASE | re.DOTALL)
+
+    def __init__(self, min_count=2, max_values=5):
+        self.min_count = min_count
+        self.max_values = max_values
+        self.queries = []
+
+    def add(self, sql):
+        """ Add an executed SQL statement (with parameters interpolated) """
+        where = self.re_where.search(sql)
+        if not where or not sql.lstrip().upper().startswith('SELECT'):
+            return
+        predicates = set(
+            predicate(table, column, op.upper(), value)
+            for table, column, op, value in self.re_predicate.findall(where.group(1)))
+        order_by = self.re_order_by.search(sql)
+        columns = set(self.re_column.findall(where.group(1) + (order_by.group(1) if order_by else '')))
+        self.queries.append((predicates, columns))
+
+    def add_queries(self, queries):
+        """ Add from a list in the format of connection.queries """
+        for query in queries:
+            self.add(query['sql'])
+
+    @contextmanager
+    def capture(self, using=DEFAULT_DB_ALIAS):
+        """ Context manager that adds all queries executed within it
+            Limited to the queries retained by connection.queries (9000 by default)
+        """
+        with CaptureQueriesContext(connections[using]) as context:
+            yield self
+        self.add_queries(context.captured_queries)
+
+    def get_groups(self):
+        """ Group queries by table and the constant predicates they share """
+        predicate_counts = Counter(p for predicates, columns in self.queries for p in predicates)
+        column_values = {}
+        for p in predicate_counts:
+            column_values.setdefault((p.table, p.column), set()).add((p.operator, p.value))
+        constant = set(
+            p for p, count in predicate_counts.items()
+            if count >= self.min_count and len(column_values[p.table, p.column]) <= self.max_values)
+
+        groups = {}
+        for predicates, columns in self.queries:
+            for table in set(p.table for p in predicates & constant):
+                key = (table, frozenset(p for p in predicates & constant if p.table == table))
+                constant_columns = set(p.column for p in key[1])
+                count, field_columns = groups.get(key, (0, Counter()))
+                field_columns.update(
+                    column for column_table, column in columns
+                    if column_table == table and column not in constant_columns)
+                groups[key] = (count + 1, field_columns)
+        return {
+            key: (count, field_columns)
+            for key, (count, field_columns) in groups.items()
+            if count >= self.min_count}
+
+    @staticmethod
+    def get_model(table):
+        for model in apps.get_models():
+            if model._meta.db_table == table:
+                return model
+
+    @staticmethod
+    def get_filter(model, p):
+        """ Convert a predicate into a lookup and python value """
+        field = next(field for field in model._meta.concrete_fields if field.column == p.column)
+        if p.value.upper() == 'NULL':
+            return field.attname + '__isnull', p.operator == 'IS'
+        if p.value.startswith("'"):
+            value = p.value[1:-1].replace("''", "'")
+        elif p.value.upper() in ('TRUE', 'FALSE'):
+            value = p.value.upper() == 'TRUE'
+        else:
+            value = float(p.value) if '.' in p.value else int(p.value)
+        try:
+            value = field.to_python(value)
+        except ValidationError:
+            pass
+        return field.attname, value
+
+    def suggestions(self, using=DEFAULT_DB_ALIAS):
+        """ Generate suggestions, most frequently used first """
+        results = []
+        for (table, predicates), (count, field_columns) in self.get_groups().items():
+            model = self.get_model(table)
+            if not model:
+                continue
+            columns = {field.column: field for field in model._meta.concrete_fields}
+            try:
+                filters = dict(self.get_filter(model, p) for p in predicates)
+            except StopIteration:
+                continue
+            # Fields used by at least half of the queries, or the primary key
+            fields = [
+                columns[column].name
+                for column, used in field_columns.most_common()
+                if column in columns and used * 2 >= count] or [model._meta.pk.name]
+            qs = model._default_manager.using(using)
+            results.append(suggestion(
+                model=model,
+                fields=fields,
+                filters=filters,
+                count=count,
+                matching=qs.filter(**filters).count(),
+                total=qs.count()))
+        return sorted(results, key=lambda s: (-s.count, s.model._meta.label))
+
+    @staticmethod
+    def render(s):
+        """ Render a suggestion as a PartialIndex declaration """
+        return 'PartialIndex(fields={fields}, {filters})'.format(
+            fields=repr(s.fields),
+            filters=', '.join('{}={}'.format(k, repr(v)) for k, v in sorted(s.filters.items())))
@@ -10,3 +10,19 @@ class DjangoMoreAppConfig(AppConfig):
         if not hasattr(ProjectState, 'add_type'):
             from django_types import patch_types
             patch_types()
+
+        from patchy import patchy
+        # Validate partial unique indexes along with other unique checks
+        with patchy('django.db.models', 'django_more.patches') as p:
+            p.cls('Model').auto()
+
+        # Generate AlterUniqueDeferrable operations for fields declared deferrable
+        with patchy('django.db.migrations', 'django_more.patches') as p:
+            p.cls('autodetector.MigrationAutodetector').auto()
+
+        # GenericRelations to ordered models may be declared on any model, so add accessors once all are loaded
+        from .fields import OrderByField
+        for model in self.apps.get_models():
+            for field in model._meta.local_fields:
+                if isinstance(field, OrderByField):
+                    field.contribute_to_generic_relations()
@@ -1,4 +1,5 @@
-from django.db.models import ExpressionWrapper
+from django.db import NotSupportedError
+from django.db.models import ExpressionWrapper, F, Func
 
 
 # Used by OrderByField to allow subqueries within insert statements
@@ -9,3 +10,39 @@ class BypassExpression(ExpressionWrapper):
 
     def __init__(self, expression, output_field=None):
         super().__init__(expression, output_field)
+
+
+# Used by OrderByField to annotate neighbours and rank within groups
+class Window(Func):
+    """ Evaluate an expression over partitions of the selected rows, ie ROW_NUMBER() OVER (...)
+        * expression :: Function to evaluate over the window
+        * partition_by :: Field names or expressions to partition rows by
+        * order_by :: Field names (- prefixed for descending) or expressions to order partitions by
+    """
+    template = '%(expressions)s OVER (%(window)s)'
+    contains_aggregate = False
+
+    def __init__(self, expression, partition_by=(), order_by=(), output_field=None):
+        partition_by = [F(item) if isinstance(item, str) else item for item in partition_by]
+        order_by = [
+            (F(item[1:]).desc() if item.startswith('-') else F(item).asc()) if isinstance(item, str) else item
+            for item in order_by]
+        self.partition_count = len(partition_by)
+        super().__init__(expression, *partition_by, *order_by, output_field=output_field)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        connection.ops.check_expression_support(self)
+        expression, *window = [compiler.compile(arg) for arg in self.source_expressions]
+        partition_by, order_by = window[:self.partition_count], window[self.partition_count:]
+        clauses = []
+        params = list(expression[1])
+        for keyword, parts in (('PARTITION BY', partition_by), ('ORDER BY', order_by)):
+            if parts:
+                clauses.append('{} {}'.format(keyword, ', '.join(sql for sql, part_params in parts)))
+                params.extend(param for sql, part_params in parts for param in part_params)
+        return self.template % {'expressions': expression[0], 'window': ' '.join(clauses)}, params
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        if connection.Database.sqlite_version_info < (3, 25):
+            raise NotSupportedError('Window functions require SQLite 3.25 or later')
+        return self.as_sql(compiler, connection, **extra_context)
@@ -7,8 +7,9 @@ class UniqueForFieldsMixin:
     """ Mixin first to a Field to add a unique_for_fields field option """
     unique_for_fields = None
     db_constraint = None
+    deferrable = False
 
-    def __init__(self, unique_for_fields=None, db_constraint=True, *args, **kwargs):
+    def __init__(self, unique_for_fields=None, db_constraint=True, *args, deferrable=False, **kwargs):
         if 'unique' in kwargs:
             raise ValueError('{cls} may not be explicitly declared unique'.format(cls=self.__class__))
         if unique_for_fields:
@@ -17,6 +18,8 @@ class UniqueForFieldsMixin:
             kwargs['unique'] = True
         # Use different internal name to dodge schema_editor checks that make fk constraints
         self.unique_db_constraint = db_constraint
+        # Constraint is DEFERRABLE INITIALLY DEFERRED, applied through the AlterUniqueDeferrable operation
+        self.deferrable = deferrable
         super().__init__(*args, **kwargs)
 
     def deconstruct(self):
@@ -24,6 +27,8 @@ class UniqueForFieldsMixin:
         if self.unique_for_fields:
             kwargs['unique_for_fields'] = self.unique_for_fields
         kwargs['db_constraint'] = self.unique_db_constraint
+        if self.deferrable:
+            kwargs['deferrable'] = self.deferrable
         # Remove unique from field definition
         kwargs.pop('unique', None)
         return name, path, args, kwargs
@@ -38,6 +43,11 @@ class UniqueForFieldsMixin:
             ut = set((self.unique_together, )).union(normalize_together(cls._meta.original_attrs.get('unique_together')))
             cls._meta.original_attrs['unique_together'] = ut
 
+    def is_unique_deferred(self, connection):
+        """ Whether the uniqueness constraint is only checked on commit for a connection """
+        # Deferred unique constraints are only supported by PostgreSQL
+        return bool(self.deferrable and self.unique_db_constraint and connection.vendor == 'postgresql')
+
     def get_filter_kwargs_for_object(self, model_instance):
         """
         Return a dict that when passed as kwargs to self.model.filter(), would
@@ -56,4 +66,4 @@ class UniqueForFieldsMixin:
 
     @cached_property
     def group_attnames(self):
-        return [self.model._meta.get_field(field_name).get_attname() for field_name in self.unique_for_fields]
+        return [self.model._meta.get_field(field_name).get_attname() for field_name in self.unique_for_fields or ()]
@@ -1,20 +1,56 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_right
 from functools import partial
 from functools import partialmethod
-from django.db import models
+from functools import reduce
+from operator import or_
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, DatabaseError, IntegrityError, models, router, transaction
 from django.db.models import Case
+from django.db.models import F
+from django.db.models import Func
 from django.db.models import Max
+from django.db.models import Prefetch
 from django.db.models import Q
 from django.db.models import Subquery
+from django.db.models import Value
 from django.db.models import When
 from django.db.models.functions import Coalesce
+from django.db.models.functions import Greatest
 from django.db.models.fields.related import resolve_relation, make_model_tuple
 
 from django_types.utils import dependency_tuple
 
-from ..expressions import BypassExpression
+from ..expressions import BypassExpression, Window
 from .mixins import UniqueForFieldsMixin
 
 
+def longest_non_decreasing(values):
+    """ Indices of a longest non-decreasing subsequence of values, skipping None """
+    tails = []
+    tail_indices = []
+    previous = {}
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        length = bisect_right(tails, value)
+        if length == len(tails):
+            tails.append(value)
+            tail_indices.append(i)
+        else:
+            tails[length] = value
+            tail_indices[length] = i
+        previous[i] = tail_indices[length - 1] if length else None
+    indices = set()
+    i = tail_indices[-1] if tail_indices else None
+    while i is not None:
+        indices.add(i)
+        i = previous[i]
+    return indices
+
+
 class OrderByField(UniqueForFieldsMixin, models.Field):
     """ Integer that determine display or sort order of records """
     # Function name templates
@@ -22,17 +58,56 @@ class OrderByField(UniqueForFieldsMixin, models.Field):
     func_local_previous = 'get_previous_in_order'
     func_local_get_set = 'get_%(name)s_set'
     func_local_set_set = 'set_%(name)s_set'
+    func_local_reorder = 'reorder_%(name)s_set'
+    func_local_move_between = 'move_between'
+    func_local_move_to = 'move_to'
+    func_local_move_above = 'move_above'
+    func_local_move_below = 'move_below'
+    func_local_bulk_create = 'bulk_create_in_%(name)s'
+    func_local_annotate = 'annotate_%(name)s_neighbours'
+    func_local_count = 'count_%(name)s_set'
+    func_local_cursor = 'get_%(name)s_cursor'
+    func_local_move_to_group = 'move_to_%(name)s_group'
     func_remote_get_set = 'get_%(model)s_set'
     func_remote_set_set = 'set_%(model)s_set'
+    func_remote_reorder = 'reorder_%(model)s_set'
+    func_remote_count = 'count_%(model)s_set'
+    func_remote_get_sets = 'get_%(model)s_sets'
+    func_remote_prefetch = 'prefetch_%(model)s_set'
+
+    # Strategies for allocating positions to new records
+    allocations = ('max', 'counter')
 
     # Will use unique_for_fields if specified, otherwise unique by default
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, gap=None, allocation='max', track_size=False, **kwargs):
         if 'default' in kwargs:
             raise ValueError('OrderByField may not have a default value')
+        if gap is not None and gap < 2:
+            raise ValueError('OrderByField gap must be at least 2')
+        if allocation not in self.allocations:
+            raise ValueError('OrderByField allocation must be one of {}'.format(', '.join(self.allocations)))
+        if track_size and allocation != 'counter':
+            raise ValueError('OrderByField track_size requires counter allocation')
+        # Spacing between positions, allowing moves between neighbours without renumbering
+        self.gap = gap
+        # Counter allocation serialises concurrent inserts into a group on a counter row
+        self.allocation = allocation
+        # Group sizes are kept on counter rows as records are saved and deleted
+        self.track_size = track_size
         # Default None suppresses migration requests to set a default
         # TODO Add automatically filling to migrations
         super().__init__(*args, default=None, **kwargs)
 
+    @property
+    def step(self):
+        """ Difference between consecutive positions when numbering """
+        return self.gap or 1
+
+    @property
+    def shift_offset(self):
+        """ Offset beyond all positions, used to temporarily lift ranges clear of the unique constraint """
+        return 2 ** 62 if self.gap else 2 ** 30
+
     def get_dependencies(self):
         return [
             dependency_tuple(
@@ -53,6 +128,21 @@ class OrderByField(UniqueForFieldsMixin, models.Field):
         setattr(cls, self.func_local_previous % subs, partialmethod(self.get_next_or_previous_in_order, is_next=False))
         setattr(cls, self.func_local_get_set % subs, partialmethod(self.get_group_order))
         setattr(cls, self.func_local_set_set % subs, partialmethod(self.set_group_order))
+        setattr(cls, self.func_local_reorder % subs, partialmethod(self.reorder_group))
+        setattr(cls, self.func_local_move_between % subs, partialmethod(self.move_between))
+        setattr(cls, self.func_local_move_to % subs, partialmethod(self.move_to))
+        setattr(cls, self.func_local_move_above % subs, partialmethod(self.move_next_to, is_above=True))
+        setattr(cls, self.func_local_move_below % subs, partialmethod(self.move_next_to, is_above=False))
+        setattr(cls, self.func_local_bulk_create % subs, staticmethod(self.bulk_create))
+        setattr(cls, self.func_local_annotate % subs, staticmethod(self.annotate_neighbours))
+        setattr(cls, self.func_local_count % subs, partialmethod(self.get_group_size))
+        setattr(cls, self.func_local_cursor % subs, partialmethod(self.get_cursor))
+        setattr(cls, self.func_local_move_to_group % subs, staticmethod(self.move_to_group))
+        if self.track_size:
+            models.signals.post_init.connect(self.record_group_on_init, sender=cls, weak=False)
+            models.signals.pre_save.connect(self.record_group_on_save, sender=cls, weak=False)
+            models.signals.post_save.connect(self.update_size_on_save, sender=cls, weak=False)
+            models.signals.post_delete.connect(self.update_size_on_delete, sender=cls, weak=False)
         if self.unique_for_fields:
             # Declare that this field has dependencies
             self.has_dependencies = True
@@ -64,6 +154,12 @@ class OrderByField(UniqueForFieldsMixin, models.Field):
     def _lazy_contribute_to_class(self, model):
         # Sanity check
         assert(self.model == model)
+        # Models rendered for unmigrated apps in migration state exclude relations
+        try:
+            for field_name in self.unique_for_fields:
+                model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            return
         # Get foreign keys in the grouping
         field_fks = {
             field.name: field
@@ -71,14 +167,16 @@ class OrderByField(UniqueForFieldsMixin, models.Field):
             for field in (model._meta.get_field(field_name), )
             if not field.auto_created and field.many_to_one}
 
-        # Extract all associated generic relations
-        generic_fks = {
-            field.name: field
-            for field in model._meta.local_fields
+        # Extract all associated generic foreign keys, grouped by their concrete fields
+        self.generic_fks = [
+            field
+            for field in model._meta.private_fields
             if (field.many_to_one and not field.remote_field)             # find generic fks
-            and (field.name in field_fks or field.fk_field in field_fks)  # associated with this grouping
-            and field_fks.pop(field.name, True)                           # and discard their fields
-            and field_fks.pop(field.fk_field, True)}                      # from the field_fks list
+            and field.ct_field in self.unique_for_fields                  # associated with this grouping
+            and field.fk_field in self.unique_for_fields]
+        for field in self.generic_fks:
+            # Content type accessors would span every model using the generic fk
+            field_fks.pop(field.ct_field, None)
 
         # Queue creation of remote order accessors
         for field in field_fks.values():
@@ -86,20 +184,42 @@ class OrderByField(UniqueForFieldsMixin, models.Field):
                 partial(self.contribute_to_related_class, field=field),
                 make_model_tuple(resolve_relation(model, field.remote_field.model)))
 
-        # TODO Find GenericRelations and add accessors
+    def contribute_to_generic_relations(self):
+        """ Add remote accessors to models with a GenericRelation to the generic fks of the grouping
+            GenericRelations may be declared on any model, so called once all models are loaded
+        """
+        for field in getattr(self, 'generic_fks', ()):
+            for rel in self.model._meta.get_fields(include_hidden=True):
+                if (rel.auto_created and not rel.concrete and hasattr(rel.field, 'get_content_type')
+                        and rel.field.content_type_field_name == field.ct_field
+                        and rel.field.object_id_field_name == field.fk_field):
+                    self.contribute_to_related_class(rel.related_model, field=rel.field)
 
     def contribute_to_related_class(self, cls, field):
         subs = {'name': self.name, 'model': self.model.__name__.lower(), 'remote_name': field.name}
         setattr(cls, self.func_remote_get_set % subs, partialmethod(self.get_group_order, field=field))
         setattr(cls, self.func_remote_set_set % subs, partialmethod(self.set_group_order, field=field))
+        setattr(cls, self.func_remote_reorder % subs, partialmethod(self.reorder_group, field=field))
+        setattr(cls, self.func_remote_count % subs, partialmethod(self.get_group_size, field=field))
+        setattr(cls, self.func_remote_get_sets % subs, staticmethod(partial(self.get_group_orders, field=field)))
+        setattr(cls, self.func_remote_prefetch % subs, staticmethod(partial(self.get_prefetch, field=field)))
 
     def get_internal_type(self):
+        # Gaps consume the range of positions much faster
+        if self.gap:
+            return "BigIntegerField"
         return "PositiveIntegerField"
 
     def deconstruct(self):
         name, path, args, kwargs = super().deconstruct()
         # Remove default from field definition
         kwargs.pop('default', None)
+        if self.gap:
+            kwargs['gap'] = self.gap
+        if self.allocation != 'max':
+            kwargs['allocation'] = self.allocation
+        if self.track_size:
+            kwargs['track_size'] = self.track_size
         return name, path, args, kwargs
 
     def get_next_or_previous_in_order(self, model_instance, is_next=True):
@@ -117,8 +237,26 @@ class OrderByField(UniqueForFieldsMixin, models.Field):
         return filtered.last()
 
     def pre_save(self, model_instance, add):
+        position = getattr(model_instance, self.attname)
+        counted = getattr(model_instance._state, 'counted_fields', set())
+        if add and self.name in counted:
+            # Already added to the counter by bulk_create
+            counted.discard(self.name)
+            return position
+        if add and self.allocation == 'counter':
+            # The counter also tracks records added with a position
+            reserved = self.reserve_positions(
+                self.get_group_key(model_instance),
+                1 if position is None else 0,
+                floor=None if position is None else position + self.step,
+                added=1,
+                using=router.db_for_write(self.model, instance=model_instance))
+            if position is None:
+                setattr(model_instance, self.attname, reserved)
+                return reserved
+            return position
         # Default to the next number larger than existing records, or start from 0
-        if add and not getattr(model_instance, self.attname):
+        if add and position is None:
             return self.get_next_expression(model_instance)
         else:
             return super().pre_save(model_instance, add)
@@ -129,29 +267,376 @@ class OrderByField(UniqueForFieldsMixin, models.Field):
         # If no records in the ordering set, start from 0
         # Evade any custom model managers
         qs = models.QuerySet(self.model).filter(**self.get_filter_kwargs_for_object(model_instance))
-        qs = qs.annotate(_next=Max(self.attname) + 1).values('_next').order_by()
+        qs = qs.annotate(_next=Max(self.attname) + self.step).values('_next').order_by()
         # Hackishly clip group_by clause to guarantee single result
         qs.query.group_by = []
         return BypassExpression(Coalesce(Subquery(qs), 0, output_field=models.IntegerField()))
 
-    def get_group_order(self, model_instance, *, field=None, limit_to=None):
-        """ Get the ordered group associated with an object
+    def get_window(self, expression, output_field):
+        """ Window over the group of each record in order """
+        return Window(expression, partition_by=self.group_attnames, order_by=[self.attname], output_field=output_field)
+
+    def annotate_neighbours(self, queryset=None):
+        """ Annotate records with their neighbours and rank within their group in a single query
+            Adds next_in_order_id, previous_in_order_id and rank_in_order (from 0)
+            * queryset :: Queryset of this model to annotate, all records if not provided
+            Neighbours are found among the records selected by the queryset, before any slicing
+        """
+        if queryset is None:
+            queryset = self.model._default_manager.all()
+        pk = self.model._meta.pk
+        return queryset.annotate(
+            next_in_order_id=self.get_window(Func(F('pk'), function='LEAD'), pk),
+            previous_in_order_id=self.get_window(Func(F('pk'), function='LAG'), pk),
+            rank_in_order=self.get_window(Func(function='ROW_NUMBER'), models.BigIntegerField()) - 1)
+
+    def get_group_key(self, model_instance):
+        """ Values of the grouping fields of an instance """
+        return tuple(getattr(model_instance, attname) for attname in self.group_attnames)
+
+    def get_counter_kwargs(self, key):
+        """ Values identifying the counter row of a group """
+        return {
+            'scope': '{}.{}'.format(self.model._meta.label_lower, self.name),
+            'group': json.dumps(list(key), cls=DjangoJSONEncoder),
+        }
+
+    def get_counter(self, key, using):
+        """ Queryset of the counter row of a group """
+        from ..models import OrderCounter
+        return OrderCounter.objects.using(using).filter(**self.get_counter_kwargs(key))
+
+    def update_counter(self, key, using, **update_kwargs):
+        """ Update the counter row of a group, creating it if necessary
+            The counter row stays locked until the surrounding transaction completes
+        """
+        counter_qs = self.get_counter(key, using)
+        if not counter_qs.update(**update_kwargs):
+            try:
+                with transaction.atomic(using=using):
+                    counter_qs.model.objects.using(using).create(
+                        value=-self.step,
+                        size=BypassExpression(self.get_group_aggregate(key, models.Count('pk'), using)),
+                        **self.get_counter_kwargs(key))
+            except IntegrityError:
+                # Created concurrently
+                pass
+            counter_qs.update(**update_kwargs)
+        return counter_qs
+
+    def get_group_aggregate(self, key, aggregate, using):
+        """ Subquery of an aggregate over a group """
+        qs = models.QuerySet(self.model).using(using).filter(**dict(zip(self.group_attnames, key)))
+        qs = qs.annotate(_aggregate=aggregate).values('_aggregate').order_by()
+        # Hackishly clip group_by clause to guarantee single result
+        qs.query.group_by = []
+        return Subquery(qs, output_field=models.BigIntegerField())
+
+    def reserve_positions(self, key, count=1, *, floor=None, added=None, using=None):
+        """ Reserve consecutive positions at the end of a group, serialised on its counter row
+            The counter row stays locked until the surrounding transaction completes,
+            so concurrent allocations in the same group wait rather than collide
+            Returns the first position reserved, or None if none were
+            * key :: Values of the grouping fields
+            * count :: Number of positions to reserve
+            * floor :: Lowest position that may be reserved
+            * added :: Number of records being added to the group, defaults to count
+            * using :: Database alias to allocate in
+        """
+        using = using or router.db_for_write(self.model)
+        # Positions may be set without the counter, so never fall behind the end of the group
+        # With the unique constraint on the group and position this is an index seek
+        ends = [F('value'), Coalesce(self.get_group_aggregate(key, Max(self.attname), using), -self.step)]
+        if floor is not None:
+            ends.append(Value(floor - self.step))
+        with transaction.atomic(using=using, savepoint=False):
+            counter_qs = self.update_counter(
+                key, using,
+                value=Greatest(*ends) + count * self.step,
+                size=F('size') + (count if added is None else added))
+            if not count:
+                return None
+            end = counter_qs.values_list('value', flat=True).get()
+        return end - (count - 1) * self.step
+
+    def get_group_size(self, model_instance, *, field=None, using=None):
+        """ Number of records in the group associated with an object
+            With track_size this is read from the counter row, otherwise counted
             * model_instance :: (bound) Source instance of the call
             * field :: Local fk that connects to source model if it's remote
+            * using :: Database alias to read from
+        """
+        using = using or router.db_for_read(self.model)
+        if field:
+            related = self.get_related_filter(model_instance, field)
+            # Only a remote relation that is the entire grouping has a single counter row
+            if not self.track_size or set(related) != set(self.group_attnames):
+                return models.QuerySet(self.model).using(using).filter(**related).count()
+            key = tuple(related[attname] for attname in self.group_attnames)
+        elif not self.track_size:
+            return self.get_group(model_instance).using(using).count()
+        else:
+            key = self.get_group_key(model_instance)
+        size = self.get_counter(key, using).values_list('size', flat=True).first()
+        if size is None:
+            # Count within the lock of the counter row, then maintained by inserts and deletes
+            with transaction.atomic(using=using, savepoint=False):
+                self.update_counter(key, using, size=self.get_group_aggregate(key, models.Count('pk'), using))
+                size = self.get_counter(key, using).values_list('size', flat=True).get()
+        return size
+
+    def saves_group(self, update_fields):
+        """ Whether a save with update_fields writes the grouping fields """
+        return update_fields is None or bool(set(update_fields) & set(self.unique_for_fields + tuple(self.group_attnames)))
+
+    def record_group(self, instance):
+        """ Note the group of a record as saved, to recognise saves that don't change it without a query """
+        # Deferred grouping fields are left unloaded
+        if all(attname in instance.__dict__ for attname in self.group_attnames):
+            groups = getattr(instance._state, 'order_groups', {})
+            groups[self.name] = self.get_group_key(instance)
+            instance._state.order_groups = groups
+
+    def record_group_on_init(self, sender, instance, **kwargs):
+        self.record_group(instance)
+
+    def record_group_on_save(self, sender, instance, raw, using, update_fields, **kwargs):
+        """ Note the group a record is being saved out of, for update_size_on_save
+            Only read from the database when the group differs from that noted, ie changed, stale or deferred
+        """
+        if raw or instance._state.adding or instance.pk is None or not self.group_attnames:
+            return
+        if not self.saves_group(update_fields):
+            return
+        key = self.get_group_key(instance)
+        if getattr(instance._state, 'order_groups', {}).get(self.name) == key:
+            return
+        previous = models.QuerySet(self.model).using(using).filter(pk=instance.pk).values_list(*self.group_attnames).first()
+        if previous is not None and tuple(previous) != key:
+            moved_from = getattr(instance._state, 'order_moved_from', {})
+            moved_from[self.name] = tuple(previous)
+            instance._state.order_moved_from = moved_from
+
+    def update_size_on_save(self, sender, instance, using, update_fields, **kwargs):
+        """ Keep the size of counter rows current as records are saved into another group
+            Within the transaction of the save when there is one, so the sizes roll back with it
+        """
+        if self.saves_group(update_fields):
+            self.record_group(instance)
+        previous = getattr(instance._state, 'order_moved_from', {}).pop(self.name, None)
+        if previous is None:
+            return
+        with transaction.atomic(using=using, savepoint=False):
+            self.get_counter(previous, using).update(size=F('size') - 1)
+            self.get_counter(self.get_group_key(instance), using).update(size=F('size') + 1)
+
+    def update_size_on_delete(self, sender, instance, using, **kwargs):
+        """ Keep the size of counter rows current as records are deleted
+            The counter row of a group is removed once it is empty, ie cascade deleted with its parent
+        """
+        counter_qs = self.get_counter(self.get_group_key(instance), using)
+        counter_qs.filter(size__lte=1).delete()
+        counter_qs.update(size=F('size') - 1)
+
+    def get_related_filter(self, model_instance, field):
+        """ Filter kwargs of local attnames selecting records related to a remote instance
+            * model_instance :: Remote instance
+            * field :: Local fk, or GenericRelation on the remote model, that connects them
+        """
+        if hasattr(field, 'get_content_type'):
+            # GenericRelation declared on the remote model
+            return {
+                self.model._meta.get_field(field.content_type_field_name).attname: field.get_content_type().pk,
+                self.model._meta.get_field(field.object_id_field_name).attname: model_instance.pk}
+        return {
+            local_field.attname: getattr(model_instance, remote_field.attname)
+            for local_field, remote_field in field.related_fields}
+
+    def get_group_filter(self, model_instance, *, field=None, limit_to=None):
+        """ Q that filters to the group(s) associated with an object
+            * model_instance :: (bound) Source instance of the call
+            * field :: Local fk, or remote GenericRelation, that connects to source model if it's remote
             * limit_to :: An optional self.model instance to limit to one group
               when doing a remote call into composite fk groupings
         """
         filters = Q()
         if field:
             # Apply filter from remote field calls
-            filters &= Q(**field.forward_related_filter(model_instance))
+            filters &= Q(**self.get_related_filter(model_instance, field))
             if limit_to:
                 # Apply local additive filter for remote field calls
                 filters &= Q(**self.get_filter_kwargs_for_object(limit_to))
         else:
             # Apply filter for local field calls
             filters &= Q(**self.get_filter_kwargs_for_object(model_instance))
-        return self.model.objects.filter(filters).order_by(*self.group_attnames, self.attname).values_list('pk', flat=True)
+        return filters
+
+    def allocate_positions(self, objs, using=None):
+        """ Assign positions to instances without one, following the end of their groups
+            Reads the current end of every group involved in a single query
+            * objs :: Unsaved instances, which may be in many groups
+            * using :: Database alias to read from
+            With counter allocation each group reserves its positions on its counter row instead
+        """
+        using = using or router.db_for_write(self.model)
+        groups = {}
+        for obj in objs:
+            groups.setdefault(self.get_group_key(obj), []).append(obj)
+        if self.allocation == 'counter':
+            for key, group_objs in groups.items():
+                unset = [obj for obj in group_objs if getattr(obj, self.attname) is None]
+                # Allow for positions already set on any of the instances
+                positions = [getattr(obj, self.attname) for obj in group_objs]
+                floor = max((p + self.step for p in positions if p is not None), default=None)
+                position = self.reserve_positions(key, len(unset), floor=floor, added=len(group_objs), using=using)
+                for obj in group_objs:
+                    obj._state.counted_fields = getattr(obj._state, 'counted_fields', set()) | {self.name}
+                for obj in unset:
+                    setattr(obj, self.attname, position)
+                    position += self.step
+            return
+        ends = {}
+        connection = connections[using]
+        keys = list(groups)
+        batch_size = max(connection.ops.bulk_batch_size(self.group_attnames, keys), 1)
+        for offset in range(0, len(keys), batch_size):
+            filters = reduce(or_, (Q(**dict(zip(self.group_attnames, key))) for key in keys[offset:offset + batch_size]))
+            qs = models.QuerySet(self.model).using(using).filter(filters).order_by()
+            if self.group_attnames:
+                qs = qs.values(*self.group_attnames)
+            ends.update(
+                (tuple(row[attname] for attname in self.group_attnames), row['_max'])
+                for row in qs.annotate(_max=Max(self.attname)).values(*self.group_attnames, '_max'))
+        for key, group_objs in groups.items():
+            # Allow for positions already set on any of the instances
+            positions = [ends.get(key)] + [getattr(obj, self.attname) for obj in group_objs]
+            position = max((p for p in positions if p is not None), default=-self.step) + self.step
+            for obj in group_objs:
+                if getattr(obj, self.attname) is None:
+                    setattr(obj, self.attname, position)
+                    position += self.step
+
+    def bulk_create(self, objs, batch_size=None, using=None):
+        """ Bulk create instances, placing those without positions at the end of their groups
+            * objs :: Unsaved instances, which may be in many groups
+            * batch_size :: As for QuerySet.bulk_create()
+            * using :: Database alias to create in
+        """
+        objs = list(objs)
+        using = using or router.db_for_write(self.model)
+        # Counter rows remain locked until the records are inserted
+        with transaction.atomic(using=using, savepoint=False):
+            self.allocate_positions(objs, using=using)
+            return self.model._default_manager.using(using).bulk_create(objs, batch_size=batch_size)
+
+    def get_group_order(self, model_instance, *, field=None, limit_to=None, after=None, limit=None):
+        """ Get the ordered group associated with an object
+            * model_instance :: (bound) Source instance of the call
+            * field :: Local fk that connects to source model if it's remote
+            * limit_to :: An optional self.model instance to limit to one group
+              when doing a remote call into composite fk groupings
+            * after :: Cursor from get_cursor(), or an instance, to continue after
+            * limit :: Maximum number of records to return
+        """
+        filters = self.get_group_filter(model_instance, field=field, limit_to=limit_to)
+        if after is not None:
+            filters &= self.get_after_filter(after, within_group=not field)
+        qs = self.model.objects.filter(filters).order_by(*self.group_attnames, self.attname).values_list('pk', flat=True)
+        if limit is not None:
+            qs = qs[:limit]
+        return qs
+
+    def get_group_orders(self, model_instances, *, field, objects=False, using=None):
+        """ Get the ordered groups associated with many remote objects in a single query
+            Returns a dict of remote primary key to list of primary keys in order
+            * model_instances :: Remote instances
+            * field :: Local fk, or remote GenericRelation, that connects to the remote model
+            * objects :: Whether to return lists of instances instead of primary keys
+            * using :: Database alias to read from
+        """
+        model_instances = list(model_instances)
+        related = [self.get_related_filter(instance, field) for instance in model_instances]
+        orders = {instance.pk: [] for instance in model_instances}
+        if not related:
+            return orders
+        attnames = list(related[0])
+        to_python = [self.model._meta.get_field(attname).to_python for attname in attnames]
+        owners = {
+            tuple(convert(value) for convert, value in zip(to_python, values.values())): instance.pk
+            for instance, values in zip(model_instances, related)}
+        # Values shared by all instances, such as the content type of generic relations
+        shared = {
+            attname: related[0][attname]
+            for attname in attnames
+            if all(values[attname] == related[0][attname] for values in related)}
+        varying = [attname for attname in attnames if attname not in shared]
+        if len(varying) == 1:
+            filters = Q(**{varying[0] + '__in': [values[varying[0]] for values in related]})
+        else:
+            filters = reduce(or_, (Q(**values) for values in related))
+        qs = self.model._default_manager.using(using).filter(filters, **shared).order_by(*self.group_attnames, self.attname)
+        if objects:
+            rows = ((obj, [getattr(obj, attname) for attname in attnames]) for obj in qs)
+        else:
+            rows = ((pk, values) for pk, *values in qs.values_list('pk', *attnames))
+        for row, values in rows:
+            orders[owners[tuple(convert(value) for convert, value in zip(to_python, values))]].append(row)
+        return orders
+
+    def get_prefetch(self, *, field, queryset=None, to_attr=None):
+        """ Prefetch of records related through a field in order, for use with prefetch_related()
+            * field :: Local fk, or remote GenericRelation, that connects to the remote model
+            * queryset :: Queryset of this model to prefetch from
+            * to_attr :: Attribute to store the list of records in, as for Prefetch
+        """
+        if hasattr(field, 'get_content_type'):
+            lookup = field.name
+        else:
+            lookup = field.remote_field.get_accessor_name()
+        if queryset is None:
+            queryset = self.model._default_manager.all()
+        return Prefetch(lookup, queryset=queryset.order_by(*self.group_attnames, self.attname), to_attr=to_attr)
+
+    def get_cursor(self, model_instance):
+        """ Opaque cursor for the position of an instance within the ordering of groups """
+        values = [getattr(model_instance, attname) for attname in self.group_attnames + [self.attname]]
+        if values[-1] is None:
+            raise ValueError("Cursor cannot be created for an instance without a position.")
+        return urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode()).decode().rstrip('=')
+
+    def get_after_filter(self, cursor, within_group=False):
+        """ Q that selects records after a cursor, using the group and position index
+            * cursor :: Cursor from get_cursor(), or an instance
+            * within_group :: Whether records are already limited to the group of the cursor
+        """
+        if isinstance(cursor, self.model):
+            cursor = self.get_cursor(cursor)
+        names = self.group_attnames + [self.attname]
+        try:
+            values = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+        except (TypeError, ValueError) as e:
+            raise ValueError("Invalid cursor '{}'".format(cursor)) from e
+        if not isinstance(values, list) or len(values) != len(names):
+            raise ValueError("Invalid cursor '{}'".format(cursor))
+        if within_group:
+            return Q(**{self.attname + '__gt': values[-1]})
+        # Row comparison of (group..., position) > cursor, expanded for portability
+        return reduce(or_, (
+            Q(**dict(zip(names[:i], values[:i])), **{names[i] + '__gt': values[i]})
+            for i in range(len(names))))
+
+    def get_group_positions(self, model_instance, *, field=None, using=None):
+        """ Current positions within the group(s) associated with an object
+            Returns a dict of group values to a list of (pk, position) in order
+            * model_instance :: (bound) Source instance of the call
+            * field :: Local fk that connects to source model if it's remote
+            * using :: Database alias to read from
+        """
+        group_qs = models.QuerySet(self.model).using(using).filter(self.get_group_filter(model_instance, field=field))
+        groups = {}
+        for pk, position, *key in group_qs.values_list('pk', self.attname, *self.group_attnames).order_by(self.attname):
+            groups.setdefault(tuple(key), []).append((pk, position))
+        return groups
 
     def set_group_order(self, model_instance, id_list, *, field=None, reset_values=False, using=None):
         """ Set the ordering for a group
@@ -163,20 +648,405 @@ class OrderByField(UniqueForFieldsMixin, models.Field):
             * reset_values :: Boolean to indicate whether to freshly renumber
               entire group from 0
               Must be updating entire group to reset_values
+            * using :: Database alias to update
         """
-        # Case expression to number instances in correct order
-        enum_case = Case(*[When(pk=pk, then=i) for i, pk in enumerate(id_list)])
-        # Bulk update with next value + enumerated value
-        group_qs = self.get_group(model_instance)
-        update_qs = group_qs.filter(pk__in=id_list)
-        update_count = update_qs.update(**{self.attname: self.get_next_expression(model_instance) + enum_case})
-        # Can only safely reset up whole group was updated
-        if reset_values and update_count == group_qs.count():
-            # Bulk update with just enumerated value
-            update_qs.update(**{self.attname: enum_case})
-
-        # TODO Even better with enumerated CTE
-
-        # NOTE Possible fallback for some dbs? Update sequentially
-        # for pk in id_list:
-        #    qs.filter(pk=pk).update(**{self.attname: value})
+        using = using or router.db_for_write(self.model)
+        groups = self.get_group_positions(model_instance, field=field, using=using)
+        members = {pk: key for key, rows in groups.items() for pk, position in rows}
+
+        # Listed records by group, in the order given
+        listed = {}
+        for pk in id_list:
+            # Ids may be given as strings, ie from a form
+            pk = self.model._meta.pk.to_python(getattr(pk, 'pk', pk))
+            if pk in members:
+                listed.setdefault(members.pop(pk), []).append(pk)
+
+        deferred = self.is_unique_deferred(connections[using])
+        offset_positions = []
+        reset_positions = []
+        for key, pks in listed.items():
+            rows = groups[key]
+            base = max((position for pk, position in rows if position is not None), default=-self.step) + self.step
+            # Can only safely reset if whole group was updated
+            if reset_values and len(pks) == len(rows):
+                reset_positions.extend((pk, i * self.step) for i, pk in enumerate(pks))
+                if deferred:
+                    # Uniqueness is checked on commit, so renumber in a single pass
+                    continue
+                # Offset beyond all reset values so that neither pass can conflict
+                base = max(base, len(pks) * self.step)
+            offset_positions.extend((pk, base + i * self.step) for i, pk in enumerate(pks))
+
+        with transaction.atomic(using=using):
+            # Move to end of group with enumerated values, then renumber
+            self.bulk_update_positions(offset_positions, using=using)
+            self.bulk_update_positions(reset_positions, using=using)
+
+    def reorder_group(self, model_instance, id_list, *, field=None, using=None):
+        """ Reorder a group to match id_list, updating as few records as possible
+            Without gaps positions remain 0..n-1, so only the records whose index changes are moved
+            With gaps records that already have increasing positions with enough room
+            between them for the records in between are left untouched
+            * model_instance :: (bound) Source instance of the call
+            * id_list :: List of primary keys (or a queryset) in the desired order
+              Records of the group that are not listed follow in their current order
+            * field :: Local fk that connects to source model if it's remote
+            * using :: Database alias to update
+            Returns the number of records moved
+        """
+        using = using or router.db_for_write(self.model)
+        groups = self.get_group_positions(model_instance, field=field, using=using)
+        members = {pk: key for key, rows in groups.items() for pk, position in rows}
+        current = {pk: position for rows in groups.values() for pk, position in rows}
+        listed = {}
+        for pk in id_list:
+            pk = self.model._meta.pk.to_python(getattr(pk, 'pk', pk))
+            if pk in members:
+                listed.setdefault(members.pop(pk), []).append(pk)
+
+        changes = []
+        for key, rows in groups.items():
+            order = listed.get(key, []) + [pk for pk, position in rows if pk in members]
+            if not self.gap:
+                # The span between the first and last record out of place takes its contiguous positions
+                changes.extend((pk, i) for i, pk in enumerate(order) if current[pk] != i)
+                continue
+            # Keeping a record requires room for all records before it, and between it and the previous kept
+            keep = longest_non_decreasing([
+                current[pk] - i if current[pk] is not None and current[pk] >= i else None
+                for i, pk in enumerate(order)])
+            lower, run = -1, []
+            for i, pk in enumerate(order):
+                if i in keep:
+                    changes.extend(self.spread_positions(run, lower, current[pk], current))
+                    lower, run = current[pk], []
+                else:
+                    run.append(pk)
+            changes.extend(self.spread_positions(run, lower, None, current))
+
+        if not changes:
+            return 0
+        # Records must vacate positions that others are moving to first, unless uniqueness is checked on commit
+        targets = set(position for pk, position in changes)
+        vacating = [] if self.is_unique_deferred(connections[using]) else [
+            pk for pk, position in changes if current[pk] in targets]
+        base = max([position for position in current.values() if position is not None] + list(targets)) + self.step
+        with transaction.atomic(using=using):
+            self.bulk_update_positions([(pk, base + i * self.step) for i, pk in enumerate(vacating)], using=using)
+            self.bulk_update_positions(changes, using=using)
+        return len(changes)
+
+    def compact_group(self, key, *, batch_size=1000, using=None):
+        """ Renumber a group to consecutive positions, in batches of short transactions
+            Positions only ever decrease, so records not yet reached are always
+            beyond those already compacted and new records can be added concurrently
+            With counter allocation the counter row is reset to the end of the group by the last batch
+            Yields the number of records read and moved by each batch
+            * key :: Values of the grouping fields
+            * batch_size :: Number of records to lock and renumber in each transaction
+            * using :: Database alias to update
+        """
+        using = using or router.db_for_write(self.model)
+        deferred = self.is_unique_deferred(connections[using])
+        group_qs = models.QuerySet(self.model).using(using).filter(**dict(zip(self.group_attnames, key)))
+        position = 0
+        while True:
+            with transaction.atomic(using=using):
+                rows = list(group_qs.filter(**{self.attname + '__gte': position}).select_for_update().order_by(
+                    self.attname).values_list('pk', self.attname)[:batch_size])
+                changes = [
+                    (pk, position + i * self.step)
+                    for i, (pk, current) in enumerate(rows)
+                    if current != position + i * self.step]
+                if changes and not deferred:
+                    # Lift clear of the positions being assigned within the batch
+                    group_qs.filter(pk__in=[pk for pk, target in changes]).update(
+                        **{self.attname: F(self.attname) + self.shift_offset})
+                self.bulk_update_positions(changes, using=using)
+                if self.allocation == 'counter' and len(rows) < batch_size:
+                    # Follow the compacted end of the group, so the next record doesn't leave a hole
+                    self.update_counter(
+                        key, using,
+                        value=Coalesce(self.get_group_aggregate(key, Max(self.attname), using), -self.step),
+                        size=self.get_group_aggregate(key, models.Count('pk'), using))
+            yield len(rows), len(changes)
+            if len(rows) < batch_size:
+                return
+            position += len(rows) * self.step
+
+    def spread_positions(self, pks, lower, upper, current):
+        """ Changed (pk, position) pairs spreading pks evenly into the gap between two positions
+            * lower :: Position before all pks, -1 if at start of the group
+            * upper :: Position after all pks, None if at end of the group
+        """
+        if upper is None:
+            start = lower + self.step if lower >= 0 else 0
+            positions = [start + i * self.step for i in range(len(pks))]
+        else:
+            positions = [lower + (i + 1) * (upper - lower) // (len(pks) + 1) for i in range(len(pks))]
+        return [(pk, position) for pk, position in zip(pks, positions) if position != current[pk]]
+
+    def bulk_update_positions(self, positions, using, fields=()):
+        """ Update positions in as few statements as the database allows
+            * positions :: List of (pk, position) pairs, followed by a value for each of fields
+            * using :: Database alias to update
+            * fields :: Other fields of the model to update along with positions
+        """
+        connection = connections[using]
+        fields = [self] + list(fields)
+        batch_size = max(connection.ops.bulk_batch_size([self.model._meta.pk] + fields, positions), 1)
+        for offset in range(0, len(positions), batch_size):
+            batch = positions[offset:offset + batch_size]
+            sql = self.get_bulk_update_sql(connection, len(batch), fields)
+            if sql is None:
+                # Fall back to a CASE expression where joins are not supported in updates
+                models.QuerySet(self.model).using(using).filter(pk__in=[row[0] for row in batch]).update(**{
+                    field.attname: Case(*[When(pk=row[0], then=Value(row[i])) for row in batch], output_field=field)
+                    for i, field in enumerate(fields, 1)})
+            else:
+                columns = [self.model._meta.pk] + fields
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, [
+                        column.get_db_prep_value(param, connection)
+                        for row in batch for column, param in zip(columns, row)])
+
+    def get_bulk_update_sql(self, connection, count, fields):
+        """ SQL to update fields from a list of count (pk, value, ...) rows
+            Returns None if the database has no suitable syntax
+        """
+        qn = connection.ops.quote_name
+        aliases = ['v{}'.format(i) for i in range(len(fields))]
+        subs = {
+            'table': qn(self.model._meta.db_table),
+            'pk': qn(self.model._meta.pk.column),
+            'aliases': ', '.join(['pk'] + aliases),
+            'values': ', '.join(['({})'.format(', '.join(['%s'] * (len(fields) + 1)))] * count),
+            'set': ', '.join('{} = _v.{}'.format(qn(field.column), alias) for field, alias in zip(fields, aliases)),
+        }
+        if connection.vendor == 'postgresql':
+            # Parameters have no type, so the first row is cast for each column to be of its type
+            types = [self.model._meta.pk.rel_db_type(connection)] + [field.db_type(connection) for field in fields]
+            subs['values'] = ', '.join(
+                ['({})'.format(', '.join('%s::{}'.format(db_type) for db_type in types))] +
+                ['({})'.format(', '.join(['%s'] * (len(fields) + 1)))] * (count - 1))
+            return (
+                'UPDATE %(table)s SET %(set)s '
+                'FROM (VALUES %(values)s) AS _v (%(aliases)s) '
+                'WHERE %(table)s.%(pk)s = _v.pk' % subs)
+        if connection.vendor == 'sqlite':
+            # UPDATE FROM was added in SQLite 3.33
+            if connection.Database.sqlite_version_info >= (3, 33):
+                return (
+                    'WITH _v (%(aliases)s) AS (VALUES %(values)s) '
+                    'UPDATE %(table)s SET %(set)s '
+                    'FROM _v WHERE %(table)s.%(pk)s = _v.pk' % subs)
+            subs['set'] = ', '.join(
+                '{column} = (SELECT {alias} FROM _v WHERE _v.pk = {table}.{pk})'.format(
+                    column=qn(field.column), alias=alias, **subs)
+                for field, alias in zip(fields, aliases))
+            return (
+                'WITH _v (%(aliases)s) AS (VALUES %(values)s) '
+                'UPDATE %(table)s SET %(set)s '
+                'WHERE %(pk)s IN (SELECT pk FROM _v)' % subs)
+        if connection.vendor == 'mysql':
+            subs['values'] = ' UNION ALL '.join(
+                ['SELECT {}'.format(', '.join('%s AS {}'.format(alias) for alias in ['pk'] + aliases))] +
+                ['SELECT {}'.format(', '.join(['%s'] * (len(fields) + 1)))] * (count - 1))
+            subs['set'] = ', '.join(
+                '{}.{} = _v.{}'.format(subs['table'], qn(field.column), alias) for field, alias in zip(fields, aliases))
+            return (
+                'UPDATE %(table)s JOIN (%(values)s) AS _v ON %(table)s.%(pk)s = _v.pk '
+                'SET %(set)s' % subs)
+        return None
+
+    def get_position_between(self, model_instance, previous=None, following=None):
+        """ Find a free position between two neighbouring instances
+            Returns None if there is no gap between them
+            * model_instance :: (bound) Instance to be positioned
+            * previous :: Instance to be placed after, or None for start of group
+            * following :: Instance to be placed before, or None for end of group
+        """
+        if previous is None and following is None:
+            raise ValueError('move_between requires a previous or following instance')
+        group_qs = models.QuerySet(self.model).filter(
+            **self.get_filter_kwargs_for_object(model_instance)).exclude(pk=model_instance.pk)
+        positions = dict(group_qs.filter(
+            pk__in=[instance.pk for instance in (previous, following) if instance is not None]
+        ).values_list('pk', self.attname))
+        if previous is not None:
+            lower = positions[previous.pk]
+            if following is None:
+                # Find the neighbour that follows
+                upper = group_qs.filter(**{self.attname + '__gt': lower}).aggregate(
+                    _upper=models.Min(self.attname))['_upper']
+                if upper is None:
+                    return lower + self.step
+        if following is not None:
+            upper = positions[following.pk]
+            if previous is None:
+                # Find the neighbour that precedes, or allow position 0 at the start
+                lower = group_qs.filter(**{self.attname + '__lt': upper}).aggregate(
+                    _lower=Max(self.attname))['_lower']
+                if lower is None:
+                    lower = -1
+        if lower >= upper:
+            raise ValueError('move_between previous must come before following')
+        position = (lower + upper) // 2
+        if lower < position < upper:
+            return position
+        return None
+
+    def move_between(self, model_instance, previous=None, following=None):
+        """ Move an instance between two neighbours in its group
+            A single record update where there is a gap between the neighbours,
+            otherwise the group is renumbered
+            * model_instance :: (bound) Saved instance to be moved
+            * previous :: Instance to be placed after, or None for start of group
+            * following :: Instance to be placed before, or None for end of group
+        """
+        if not model_instance.pk:
+            raise ValueError("move_between cannot be used on unsaved objects.")
+        position = self.get_position_between(model_instance, previous, following)
+        if position is None:
+            self.rebalance_group(model_instance, previous, following)
+            model_instance.refresh_from_db(fields=[self.attname])
+        else:
+            models.QuerySet(self.model).filter(pk=model_instance.pk).update(**{self.attname: position})
+            setattr(model_instance, self.attname, position)
+
+    def move_to(self, model_instance, position):
+        """ Move an instance to a position, shifting the records in between by one step
+            The position and group of the instance are read from its locked row, not as set on it
+            * model_instance :: (bound) Saved instance to be moved
+            * position :: New position for the instance, from 0 to the last position of the group
+        """
+        if not model_instance.pk:
+            raise ValueError("move_to cannot be used on unsaved objects.")
+        if position < 0:
+            raise ValueError("move_to position cannot be negative")
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            current, *key = models.QuerySet(self.model).using(using).filter(pk=model_instance.pk).select_for_update(
+                ).values_list(self.attname, *self.group_attnames).get()
+            setattr(model_instance, self.attname, current)
+            if position == current:
+                return
+            group_qs = models.QuerySet(self.model).using(using).filter(**dict(zip(self.group_attnames, key)))
+            if position > current:
+                # Moving beyond the last record would leave a hole in the positions
+                last = group_qs.aggregate(_last=Max(self.attname))['_last']
+                if position > last:
+                    raise ValueError("move_to position cannot be beyond the end of the group")
+            range_qs = group_qs.filter(**{
+                self.attname + '__gte': min(position, current),
+                self.attname + '__lte': max(position, current)})
+            # Lock the range, so the records shifted can be checked against it
+            count = len(range_qs.select_for_update().values_list('pk'))
+            shift = self.step if position < current else -self.step
+            if self.is_unique_deferred(connections[using]):
+                # Uniqueness is checked on commit, so shift the range in place
+                counts = [range_qs.update(**{self.attname: Case(
+                    When(pk=model_instance.pk, then=Value(position)),
+                    default=F(self.attname) + shift)})]
+            else:
+                # Lift the range clear of all positions, then lower into place shifted by one step
+                counts = [
+                    range_qs.update(**{self.attname: F(self.attname) + self.shift_offset}),
+                    group_qs.filter(**{self.attname + '__gte': self.shift_offset}).update(**{self.attname: Case(
+                        When(pk=model_instance.pk, then=Value(position)),
+                        default=F(self.attname) - self.shift_offset + shift)})]
+            if any(updated != count for updated in counts):
+                # Rolls back any records already shifted
+                raise DatabaseError("move_to shifted {} records, expected {}".format(counts, count))
+        setattr(model_instance, self.attname, position)
+
+    def move_next_to(self, model_instance, other, *, is_above=True):
+        """ Move an instance to be immediately above or below another in its group
+            The positions and groups of both instances are read from their locked rows
+            * model_instance :: (bound) Saved instance to be moved
+            * other :: Instance of the same group to move next to
+            * is_above :: Whether to be placed before (above) other or after (below)
+        """
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            rows = {
+                pk: (position, key)
+                for pk, position, *key in models.QuerySet(self.model).using(using).filter(
+                    pk__in=[model_instance.pk, other.pk]).select_for_update().values_list(
+                    'pk', self.attname, *self.group_attnames)}
+            (current, key), (target, other_key) = rows[model_instance.pk], rows[other.pk]
+            if key != other_key:
+                raise ValueError("move_above/move_below must be with an instance of the same group")
+            if target > current:
+                # Moving down, other shifts up when taking its position from below
+                position = target - self.step if is_above else target
+            else:
+                # Moving up, other shifts down when taking its position from above
+                position = target if is_above else target + self.step
+            self.move_to(model_instance, position)
+
+    def move_to_group(self, id_list, *, compact=False, using=None, **group):
+        """ Move records into another group, appended to its end in their current order
+            Reassigns the grouping fields and positions together in a single bulk update
+            * id_list :: List of primary keys (or a queryset) of the records to move
+            * compact :: Whether to renumber the groups the records were moved from
+            * using :: Database alias to update
+            * group :: Values for each of the grouping fields, by name
+            Returns the number of records moved
+        """
+        if set(group) != set(self.unique_for_fields or ()):
+            raise ValueError('move_to_group requires values for {}'.format(', '.join(self.unique_for_fields or ())))
+        using = using or router.db_for_write(self.model)
+        fields = [self.model._meta.get_field(field_name) for field_name in self.unique_for_fields]
+        values = [
+            getattr(value, field.target_field.attname) if isinstance(value, models.Model) else value
+            for field in fields
+            for value in (group[field.name], )]
+        key = tuple(values)
+        if not isinstance(id_list, models.QuerySet):
+            id_list = [getattr(pk, 'pk', pk) for pk in id_list]
+
+        with transaction.atomic(using=using):
+            rows = list(models.QuerySet(self.model).using(using).filter(pk__in=id_list).select_for_update().order_by(
+                *self.group_attnames, self.attname).values_list('pk', *self.group_attnames))
+            if not rows:
+                return 0
+            # Number of records moved from each other group
+            sources = {}
+            for pk, *source in rows:
+                if tuple(source) != key:
+                    sources[tuple(source)] = sources.get(tuple(source), 0) + 1
+            if self.allocation == 'counter':
+                start = self.reserve_positions(key, len(rows), added=sum(sources.values()), using=using)
+                for source, count in sources.items():
+                    self.get_counter(source, using).update(size=F('size') - count)
+            else:
+                end = models.QuerySet(self.model).using(using).filter(**dict(zip(self.group_attnames, key))).aggregate(
+                    _end=Max(self.attname))['_end']
+                start = 0 if end is None else end + self.step
+            # Positions beyond the end of the target group cannot conflict with any record
+            self.bulk_update_positions(
+                [(pk, start + i * self.step, *values) for i, (pk, *source) in enumerate(rows)],
+                using=using,
+                fields=fields)
+
+        if compact:
+            for source in sources:
+                for batch in self.compact_group(source, using=using):
+                    pass
+        return len(rows)
+
+    def rebalance_group(self, model_instance, previous=None, following=None):
+        """ Renumber an entire group, evenly spreading gaps between positions
+            * model_instance :: (bound) Instance whose group is renumbered
+            * previous, following :: Optionally place the instance between these
+        """
+        id_list = [pk for pk in self.get_group_order(model_instance) if pk != model_instance.pk]
+        if following is not None:
+            id_list.insert(id_list.index(following.pk), model_instance.pk)
+        elif previous is not None:
+            id_list.insert(id_list.index(previous.pk) + 1, model_instance.pk)
+        else:
+            id_list = list(self.get_group_order(model_instance))
+        self.set_group_order(model_instance, id_list, reset_values=True)
@@ -1,8 +1,12 @@
 """ Define custom index types """
+import operator
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist, NON_FIELD_ERRORS, ValidationError
 from django.db.models import Index, Q
 from django.db import DEFAULT_DB_ALIAS
 
-__all__ = ['PartialIndex']
+__all__ = ['PartialIndex', 'PartialUniqueIndex']
 
 
 class PartialIndex(Index):
@@ -21,8 +25,11 @@ class PartialIndex(Index):
         return path, args, kwargs
 
     @staticmethod
-    def get_where_sql(query):
+    def get_where_sql(query, schema_editor=None):
         where, w_params = query.get_compiler(DEFAULT_DB_ALIAS).compile(query.where)
+        if schema_editor:
+            # Values must be literals within index definitions
+            w_params = [schema_editor.quote_value(param) for param in w_params]
         return " WHERE {}".format(where % (*w_params,))
 
     def get_query(self, model):
@@ -34,7 +41,7 @@ class PartialIndex(Index):
         query = self.get_query(model)
         # Access query compiler for WHERE directly
         if query.where:
-            parameters["extra"] = self.get_where_sql(query)
+            parameters["extra"] = self.get_where_sql(query, schema_editor)
         return parameters
 
     def make_qs_compatible(self):
@@ -68,6 +75,122 @@ class PartialIndex(Index):
             return repr(self.deconstruct()) == repr(val.deconstruct())
 
 
+class PartialUniqueIndex(PartialIndex):
+    """ Partial index that enforces uniqueness of fields for matching records """
+    suffix = "puq"
+
+    # Lookups that can be evaluated against an instance without a query
+    lookup_operators = {
+        'exact': operator.eq,
+        'gt': operator.gt,
+        'gte': operator.ge,
+        'lt': operator.lt,
+        'lte': operator.le,
+        'in': lambda value, options: value in options,
+    }
+
+    def create_sql(self, model, schema_editor, using=''):
+        sql_create_index = schema_editor.sql_create_index.replace('CREATE INDEX', 'CREATE UNIQUE INDEX', 1)
+        sql_parameters = self.get_sql_create_template_values(model, schema_editor, using)
+        return sql_create_index % sql_parameters
+
+    @property
+    def field_names(self):
+        return [field_name for field_name, order in self.fields_orders]
+
+    def matches(self, model_instance):
+        """ Whether the instance falls within the index condition
+            Returns None where the condition cannot be evaluated in python
+        """
+        return self.evaluate_q(model_instance, Q(*self.q_filters))
+
+    def evaluate_q(self, model_instance, q):
+        results = [
+            self.evaluate_q(model_instance, child) if isinstance(child, Q)
+            else self.evaluate_lookup(model_instance, *child)
+            for child in q.children]
+        # Three valued logic, None being unknown
+        if q.connector == Q.AND:
+            result = False if False in results else None if None in results else True
+        else:
+            result = True if True in results else None if None in results else False
+        if q.negated and result is not None:
+            return not result
+        return result
+
+    def evaluate_lookup(self, model_instance, lookup, value):
+        field_name, _, lookup_type = lookup.partition('__')
+        lookup_type = lookup_type or 'exact'
+        try:
+            field = model_instance._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or (field.is_relation and value is not None and not isinstance(value, int)):
+            return None
+        instance_value = getattr(model_instance, field.attname)
+        if lookup_type == 'isnull':
+            return (instance_value is None) == bool(value)
+        if lookup_type not in self.lookup_operators or instance_value is None or value is None:
+            return None
+        try:
+            instance_value = field.to_python(instance_value)
+            if lookup_type == 'in':
+                value = [field.to_python(option) for option in value]
+            else:
+                value = field.to_python(value)
+            return self.lookup_operators[lookup_type](instance_value, value)
+        except (ValidationError, TypeError):
+            return None
+
+    def get_violations(self, model_instances, using=None):
+        """ Find instances that would violate this index, using a single query
+            * model_instances :: Instances to check against the database and each other
+            * using :: Database alias to check against
+            Instances where the condition cannot be evaluated in python are
+            assumed to be within the index.
+        """
+        if not model_instances:
+            return []
+        model = model_instances[0].__class__
+        attnames = [model._meta.get_field(field_name).attname for field_name in self.field_names]
+        # Candidates are those in the index, NULL values are never unique violations
+        candidates = [
+            (instance, key)
+            for instance in model_instances
+            for key in (tuple(getattr(instance, attname) for attname in attnames), )
+            if None not in key and self.matches(instance) is not False]
+        if not candidates:
+            return []
+
+        # Records on the database that share values and are in the index
+        checked_pks = set(instance.pk for instance, key in candidates if instance.pk is not None)
+        values_filter = reduce(operator.or_, (Q(**dict(zip(attnames, key))) for instance, key in candidates))
+        existing = {}
+        qs = model._default_manager.using(using or DEFAULT_DB_ALIAS).filter(*self.q_filters).filter(values_filter)
+        for pk, *key in qs.values_list('pk', *attnames):
+            # Values of instances being checked supersede their database values
+            if pk not in checked_pks:
+                existing.setdefault(tuple(key), set()).add(pk)
+
+        # Duplicates within the instances themselves
+        seen = {}
+        for instance, key in candidates:
+            seen[key] = seen.get(key, 0) + 1
+        return [
+            instance
+            for instance, key in candidates
+            if key in existing or seen[key] > 1]
+
+    def validate_unique(self, model_instance, exclude=None, using=None):
+        """ Raise a ValidationError if the instance would violate this index """
+        if exclude and any(field_name in exclude for field_name in self.field_names):
+            return
+        if self.get_violations([model_instance], using=using):
+            model = model_instance.__class__
+            key = self.field_names[0] if len(self.field_names) == 1 else NON_FIELD_ERRORS
+            raise ValidationError({key: [model_instance.unique_error_message(model, tuple(self.field_names))]})
+
+
 # This feature is not present in Django 1.11 but is required for deconstruction of
 #  partial indexes. So if not present when needed, the Qs are wrapped in this
 class Qcompat(Q):
@@ -0,0 +1,83 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, models
+
+from django_more.fields import OrderByField
+
+
+class Command(BaseCommand):
+    help = 'Renumber every group of an OrderByField to consecutive positions, in small batched transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'label',
+            help='app_label.ModelName.field_name of the OrderByField, field_name is optional if there is only one.')
+        parser.add_argument(
+            '--filter', action='append', dest='filters', default=[],
+            help='field=value lookup to restrict the groups compacted, may be repeated.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of records renumbered in each transaction.')
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches, to throttle load and replication lag.')
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to compact.')
+
+    def handle(self, *args, label, filters, batch_size, sleep, database, **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        field = self.get_field(label)
+        try:
+            filter_kwargs = dict(lookup.split('=', 1) for lookup in filters)
+        except ValueError:
+            raise CommandError('Filters must be in the form field=value')
+
+        groups_qs = models.QuerySet(field.model).using(database).filter(**filter_kwargs)
+        if field.group_attnames:
+            keys = groups_qs.order_by(*field.group_attnames).values_list(*field.group_attnames).distinct().iterator()
+        else:
+            keys = [()] if groups_qs.exists() else []
+
+        group_count = total_read = total_moved = 0
+        for key in keys:
+            read = moved = 0
+            for batch_read, batch_moved in field.compact_group(key, batch_size=batch_size, using=database):
+                read += batch_read
+                moved += batch_moved
+                if options['verbosity'] > 1:
+                    self.stdout.write('    {} records read, {} moved'.format(read, moved))
+                if sleep:
+                    time.sleep(sleep)
+            group_count += 1
+            total_read += read
+            total_moved += moved
+            if options['verbosity'] > 0:
+                self.stdout.write('{group}: {read} records, {moved} moved'.format(
+                    group=', '.join('{}={}'.format(*item) for item in zip(field.group_attnames, key)) or 'all',
+                    read=read,
+                    moved=moved))
+        self.stdout.write('Compacted {groups} groups of {label}, {moved} of {read} records moved'.format(
+            groups=group_count,
+            label=label,
+            moved=total_moved,
+            read=total_read))
+
+    @staticmethod
+    def get_field(label):
+        model_label, _, field_name = label.rpartition('.')
+        if model_label.count('.') != 1:
+            model_label, field_name = label, None
+        try:
+            model = apps.get_model(model_label)
+        except (LookupError, ValueError) as e:
+            raise CommandError("Cannot find model '{}': {}".format(model_label, e))
+        fields = [
+            field for field in model._meta.concrete_fields
+            if isinstance(field, OrderByField) and field_name in (None, field.name)]
+        if len(fields) != 1:
+            raise CommandError("Cannot find a single OrderByField in '{}'".format(label))
+        return fields[0]
@@ -0,0 +1,102 @@
+from collections import namedtuple
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections, DatabaseError, DEFAULT_DB_ALIAS
+
+from django_more.indexes import PartialIndex
+
+
+# Usage details of a single index, None where not available from the database
+index_usage = namedtuple('index_usage', ['size', 'scans', 'rows'])
+
+
+class Command(BaseCommand):
+    help = 'Report size and usage of PartialIndexes declared in model Meta.indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'app_label', nargs='*',
+            help='Restrict report to these apps.')
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to report on.')
+
+    def handle(self, *args, app_label, database, **options):
+        connection = connections[database]
+        get_usage = getattr(self, 'get_usage_{}'.format(connection.vendor), self.get_usage_unknown)
+
+        indexes = [
+            (model, index, index.get_where_sql(index.get_query(model)))
+            for model in apps.get_models()
+            if not app_label or model._meta.app_label in app_label
+            for index in model._meta.indexes
+            if isinstance(index, PartialIndex)]
+        if not indexes:
+            self.stdout.write('No PartialIndexes declared')
+            return
+
+        # Indexes sharing a table and predicate
+        predicates = {}
+        for model, index, where in indexes:
+            predicates.setdefault((model._meta.db_table, where), []).append(index)
+
+        with connection.cursor() as cursor:
+            for model, index, where in indexes:
+                usage = get_usage(cursor, model, index)
+                flags = []
+                if usage.scans == 0:
+                    flags.append('UNUSED')
+                duplicates = [
+                    other.name
+                    for other in predicates[model._meta.db_table, where]
+                    if other is not index]
+                if duplicates:
+                    flags.append('DUPLICATE PREDICATE ({})'.format(', '.join(duplicates)))
+                self.stdout.write('{label} {name}: size {size}, scans {scans}, rows {rows}{flags}'.format(
+                    label=model._meta.label,
+                    name=index.name,
+                    size=self.format_size(usage.size),
+                    scans='unknown' if usage.scans is None else usage.scans,
+                    rows='unknown' if usage.rows is None else usage.rows,
+                    flags=''.join(' ' + flag for flag in flags)))
+                self.stdout.write('    {fields}{where}'.format(fields=', '.join(index.fields), where=where))
+
+    @staticmethod
+    def format_size(size):
+        if size is None:
+            return 'unknown'
+        for unit in ['B', 'kB', 'MB', 'GB']:
+            if size < 1024 or unit == 'GB':
+                break
+            size /= 1024
+        return '{:.0f} {}'.format(size, unit) if unit == 'B' else '{:.1f} {}'.format(size, unit)
+
+    def get_usage_postgresql(self, cursor, model, index):
+        cursor.execute(
+            'SELECT pg_relation_size(s.indexrelid), s.idx_scan, c.reltuples::bigint '
+            'FROM pg_stat_user_indexes s JOIN pg_class c ON c.oid = s.indexrelid '
+            'WHERE s.relname = %s AND s.indexrelname = %s',
+            [model._meta.db_table, index.name])
+        row = cursor.fetchone()
+        return index_usage(*row) if row else index_usage(None, None, None)
+
+    def get_usage_sqlite(self, cursor, model, index):
+        # dbstat and sqlite_stat1 depend on compile options and ANALYZE having been run
+        size = rows = None
+        try:
+            cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [index.name])
+            size = cursor.fetchone()[0]
+        except DatabaseError:
+            pass
+        try:
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s AND idx = %s', [model._meta.db_table, index.name])
+            row = cursor.fetchone()
+            rows = int(row[0].split()[0]) if row else None
+        except DatabaseError:
+            pass
+        # SQLite does not track index scans
+        return index_usage(size, None, rows)
+
+    def get_usage_unknown(self, cursor, model, index):
+        return index_usage(None, None, None)
@@ -0,0 +1,67 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.module_loading import import_string
+
+from django_more.advisor import IndexAdvisor
+
+
+class Command(BaseCommand):
+    help = 'Suggest PartialIndex declarations from recurring constant predicates in executed queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--run', action='append', dest='callables', default=[],
+            help='Dotted path to a callable to run as the workload, queries it executes are captured.')
+        parser.add_argument(
+            '--file', action='append', dest='files', default=[],
+            help='File of executed SQL statements, one per line. Use - for stdin.')
+        parser.add_argument(
+            '--min-count', type=int, default=2,
+            help='Minimum number of queries a predicate must appear in.')
+        parser.add_argument(
+            '--max-values', type=int, default=5,
+            help='Columns compared to more distinct values than this are treated as variable.')
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to capture queries from and estimate selectivity on.')
+
+    def handle(self, *args, callables, files, min_count, max_values, database, **options):
+        if not callables and not files:
+            raise CommandError('Provide a workload to observe with --run or --file')
+        advisor = IndexAdvisor(min_count=min_count, max_values=max_values)
+
+        for path in files:
+            if path == '-':
+                self.add_lines(advisor, sys.stdin)
+            else:
+                with open(path) as stream:
+                    self.add_lines(advisor, stream)
+
+        for path in callables:
+            try:
+                workload = import_string(path)
+            except ImportError as e:
+                raise CommandError("Cannot import workload '{}': {}".format(path, e))
+            with advisor.capture(using=database):
+                workload()
+
+        suggestions = advisor.suggestions(using=database)
+        if not suggestions:
+            self.stdout.write('No recurring constant predicates found in {} queries'.format(len(advisor.queries)))
+        for s in suggestions:
+            selectivity = s.matching / s.total if s.total else 0
+            self.stdout.write('# {label}: {count} queries, selectivity {pct:.1%} ({matching} of {total} rows)'.format(
+                label=s.model._meta.label,
+                count=s.count,
+                pct=selectivity,
+                matching=s.matching,
+                total=s.total))
+            self.stdout.write(advisor.render(s))
+
+    @staticmethod
+    def add_lines(advisor, stream):
+        for line in stream:
+            if line.strip():
+                advisor.add(line.strip())
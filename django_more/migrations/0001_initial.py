@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=255)),
+                ('group', models.CharField(max_length=255)),
+                ('value', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='ordercounter',
+            unique_together=set([('scope', 'group')]),
+        ),
+    ]
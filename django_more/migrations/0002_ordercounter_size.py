@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_more', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordercounter',
+            name='size',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import models
+
+__all__ = ['OrderCounter']
+
+
+# Used by OrderByField(allocation='counter') to serialise allocation of positions
+class OrderCounter(models.Model):
+    """ Last position allocated within an ordering group
+        * scope :: Label of the model and field, ie app_label.model_name.field_name
+        * group :: Values of the grouping fields, serialised
+        * value :: Last position allocated
+        * size :: Number of records in the group, None until first counted
+    """
+    scope = models.CharField(max_length=255)
+    group = models.CharField(max_length=255)
+    value = models.BigIntegerField()
+    size = models.BigIntegerField(null=True)
+
+    class Meta:
+        unique_together = [('scope', 'group')]
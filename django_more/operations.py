@@ -0,0 +1,68 @@
+from django.db.migrations.operations.base import Operation
+
+__all__ = ['AlterUniqueDeferrable']
+
+
+class AlterUniqueDeferrable(Operation):
+    """ Recreate the unique constraint on fields as DEFERRABLE INITIALLY DEFERRED
+        Only PostgreSQL supports deferred unique constraints, elsewhere does nothing
+        * model_name :: Name of the model the constraint is on
+        * fields :: Field names of the constraint, ie unique_for_fields and the field itself
+        * deferrable :: Whether the constraint is made deferrable, or returned to immediate
+    """
+    reduces_to_sql = True
+    reversible = True
+    sql_alter_unique = (
+        'ALTER TABLE %(table)s DROP CONSTRAINT %(name)s, '
+        'ADD CONSTRAINT %(name)s UNIQUE (%(columns)s)%(deferrable)s')
+    sql_deferrable = ' DEFERRABLE INITIALLY DEFERRED'
+
+    def __init__(self, model_name, fields, deferrable=True):
+        self.model_name = model_name
+        self.fields = list(fields)
+        self.deferrable = deferrable
+
+    def deconstruct(self):
+        kwargs = {
+            'model_name': self.model_name,
+            'fields': self.fields,
+        }
+        if not self.deferrable:
+            kwargs['deferrable'] = self.deferrable
+        return self.__class__.__name__, [], kwargs
+
+    def describe(self):
+        return 'Make unique constraint on {model} ({fields}) {mode}'.format(
+            model=self.model_name,
+            fields=', '.join(self.fields),
+            mode='deferrable' if self.deferrable else 'immediate')
+
+    def state_forwards(self, app_label, state):
+        # Field options record the deferrable state, the constraint itself is not in model state
+        pass
+
+    def alter_constraint(self, app_label, schema_editor, state, deferrable):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        model = state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        columns = [model._meta.get_field(field_name).column for field_name in self.fields]
+        names = schema_editor._constraint_names(model, columns, unique=True, primary_key=False)
+        if len(names) != 1:
+            raise ValueError('Found wrong number ({count}) of unique constraints for {table}({columns})'.format(
+                count=len(names),
+                table=model._meta.db_table,
+                columns=', '.join(columns)))
+        schema_editor.execute(self.sql_alter_unique % {
+            'table': schema_editor.quote_name(model._meta.db_table),
+            'name': schema_editor.quote_name(names[0]),
+            'columns': ', '.join(schema_editor.quote_name(column) for column in columns),
+            'deferrable': self.sql_deferrable if deferrable else '',
+        })
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        self.alter_constraint(app_label, schema_editor, to_state, self.deferrable)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        self.alter_constraint(app_label, schema_editor, to_state, not self.deferrable)
@@ -0,0 +1,70 @@
+""" Container classes for methods and attributes to be patched into django """
+# Framework imports
+from django.core.exceptions import ValidationError
+from django.db import router
+# Project imports
+from patchy import super_patchy
+from .fields.mixins import UniqueForFieldsMixin
+from .indexes import PartialUniqueIndex
+from .operations import AlterUniqueDeferrable
+
+
+class Model:
+
+    # Model validation doesn't know about indexes, so include partial unique indexes in it
+    def validate_unique(self, exclude=None):
+        errors = {}
+        try:
+            super_patchy(exclude=exclude)
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+        using = router.db_for_read(self.__class__, instance=self)
+        for index in self._meta.indexes:
+            if isinstance(index, PartialUniqueIndex):
+                try:
+                    index.validate_unique(self, exclude=exclude, using=using)
+                except ValidationError as e:
+                    errors = e.update_error_dict(errors)
+        if errors:
+            raise ValidationError(errors)
+
+
+class MigrationAutodetector:
+
+    def generate_altered_deferrable(self):
+        """ Make unique constraints of fields declared deferrable match their declaration
+            Constraints are created immediate, so new constraints are made deferrable after they are added
+        """
+        for app_label, model_name in sorted(self.new_model_keys):
+            new_model_state = self.to_state.models[app_label, model_name]
+            old_fields = {}
+            if (app_label, model_name) in self.kept_model_keys:
+                old_model_name = self.renamed_models.get((app_label, model_name), model_name)
+                old_fields = dict(self.from_state.models[app_label, old_model_name].fields)
+
+            for field_name, field in new_model_state.fields:
+                if not isinstance(field, UniqueForFieldsMixin) or not field.unique_db_constraint:
+                    continue
+                fields = tuple(field.unique_for_fields or ()) + (field_name, )
+                # Fields are compared by their old names, to account for renames
+                old_names = tuple(self.renamed_fields.get((app_label, model_name, n), n) for n in fields)
+                old_field = old_fields.get(old_names[-1])
+                old_deferrable = (
+                    isinstance(old_field, UniqueForFieldsMixin)
+                    and old_field.unique_db_constraint
+                    and old_field.deferrable
+                    # A constraint on other fields is replaced by an immediate one
+                    and tuple(old_field.unique_for_fields or ()) + old_names[-1:] == old_names)
+                if bool(field.deferrable) != bool(old_deferrable):
+                    self.add_operation(
+                        app_label,
+                        AlterUniqueDeferrable(new_model_state.name, fields, deferrable=bool(field.deferrable)),
+                        dependencies=[
+                            (app_label, model_name, field_name, True),
+                            (app_label, model_name, field_name, 'alter'),
+                            (app_label, model_name, field_name, 'foo_together_change')])
+
+    # Constraints are all in place once unique_together has been altered
+    def generate_altered_unique_together(self, *args, **kwargs):
+        super_patchy(*args, **kwargs)
+        self.generate_altered_deferrable()
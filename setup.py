@@ -27,6 +27,9 @@ setup(
         'patchy',
         'django_more',
         'django_more.fields',
+        'django_more.management',
+        'django_more.management.commands',
+        'django_more.migrations',
         'django_more.storages',
         'django_enum',
         'django_types',
@@ -0,0 +1,194 @@
+""" Benchmarks for performance sensitive paths
+    Run with: python -m tests.benchmarks [name ...]
+    Uses the test database of the configured USING_DB_ALIAS
+"""
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+import django
+from django.conf import settings
+from django.test.utils import get_runner
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+@contextmanager
+def timer(label):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        print('{:<40} failed: {}'.format(label, e))
+    else:
+        print('{:<40} {:.3f}s'.format(label, time.perf_counter() - start))
+
+
+@benchmark
+def set_group_order():
+    """ Reverse an entire group with OrderByField.set_group_order """
+    from django.db import transaction
+    from django.db.models import Case, When
+    from .models import OrderParent, OrderedItem
+
+    for size in (1000, 10000, 100000):
+        parent = OrderParent.objects.create(name='benchmark')
+        OrderedItem.objects.bulk_create(
+            (OrderedItem(parent=parent, order=i) for i in range(size)),
+            batch_size=400)
+        pks = list(parent.get_ordereditem_set())
+        random.shuffle(pks)
+
+        with timer('set_group_order {} ids'.format(size)):
+            parent.set_ordereditem_set(pks, reset_values=True)
+
+        # Previous implementation, one WHEN per id in two passes
+        with timer('set_group_order {} ids (CASE)'.format(size)), transaction.atomic():
+            enum_case = Case(*[When(pk=pk, then=i) for i, pk in enumerate(reversed(pks))])
+            update_qs = OrderedItem.objects.filter(parent=parent, pk__in=pks)
+            update_qs.update(order=size + enum_case)
+            update_qs.update(order=enum_case)
+
+        parent.delete()
+
+
+@benchmark
+def concurrent_inserts():
+    """ Threads appending to the same OrderByField group, retrying on conflicts """
+    import threading
+    from django.db import connection, DatabaseError, IntegrityError
+    from .models import OrderParent, OrderedItem, CounterOrderedItem
+
+    threads, inserts = 8, 50
+    for model in (OrderedItem, CounterOrderedItem):
+        # unique_for_fields constraints are only generated by migrations
+        field = model._meta.get_field('order')
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE UNIQUE INDEX {name} ON {table} ({columns})'.format(
+                name=connection.ops.quote_name(model._meta.db_table + '_order_uniq'),
+                table=connection.ops.quote_name(model._meta.db_table),
+                columns=', '.join(connection.ops.quote_name(column) for column in field.group_attnames + [field.column])))
+        parent = OrderParent.objects.create(name='benchmark')
+        conflicts = []
+        errors = []
+
+        def worker():
+            conflict_count = error_count = 0
+            try:
+                for i in range(inserts):
+                    while True:
+                        try:
+                            model.objects.create(parent=parent)
+                            break
+                        except IntegrityError:
+                            conflict_count += 1
+                        except DatabaseError:
+                            # Lock timeouts and deadlocks
+                            error_count += 1
+            finally:
+                conflicts.append(conflict_count)
+                errors.append(error_count)
+                connection.close()
+
+        with timer('{} {}x{} inserts'.format(model.__name__, threads, inserts)):
+            workers = [threading.Thread(target=worker) for i in range(threads)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+        print('{:<40} {} unique conflicts, {} other errors retried'.format('', sum(conflicts), sum(errors)))
+        parent.delete()
+
+
+def fill_enum_table(targets):
+    """ Yield the size of the FirstModel table as it is doubled within the database up to each target """
+    from django.db import connection
+    from .models import FirstModel, MetaEnum, TestEnum
+
+    table = connection.ops.quote_name(FirstModel._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(f.column) for f in FirstModel._meta.concrete_fields if not f.primary_key)
+    FirstModel.objects.bulk_create(FirstModel(test_enum=em, meta_enum=MetaEnum.VAL1) for em in TestEnum)
+    size = FirstModel.objects.count()
+    for target in targets:
+        with connection.cursor() as cursor:
+            while size < target:
+                cursor.execute('INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}'.format(
+                    table=table, columns=columns))
+                size *= 2
+        yield size
+    FirstModel.objects.all().delete()
+
+
+@benchmark
+def enum_decode():
+    """ Decode EnumField values from a values_list query """
+    from django.db import connection
+    from .models import FirstModel, TestEnum
+
+    field = FirstModel._meta.get_field('test_enum')
+    for size in fill_enum_table((10 ** 5, 10 ** 6, 10 ** 7)):
+        with timer('values_list {} rows'.format(size)):
+            for value in FirstModel.objects.values_list('test_enum', flat=True).iterator():
+                pass
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT {column} FROM {table}'.format(
+                table=connection.ops.quote_name(FirstModel._meta.db_table),
+                column=connection.ops.quote_name(field.column)))
+            raw = [row[0] for row in cursor.fetchall()]
+        with timer('from_db_value {} values'.format(size)):
+            for value in raw:
+                field.from_db_value(value, None, connection, None)
+        # Previous implementation, through EnumMeta.__call__
+        with timer('from_db_value {} values (EnumMeta)'.format(size)):
+            for value in raw:
+                TestEnum(str(value))
+        del raw
+
+
+@benchmark
+def enum_casters():
+    """ Decode EnumField values from a values_list query with driver casters (PostgreSQL) """
+    from django.db import connection
+    from django_enum.casters import register_casters
+    from .models import FirstModel
+
+    if connection.vendor != 'postgresql':
+        print('{:<40} skipped: requires postgresql'.format('enum_casters'))
+        return
+    for size in fill_enum_table((10 ** 5, 10 ** 6, 10 ** 7)):
+        for label, members in (('text', None), ('values', False), ('members', True)):
+            connection.close()
+            if members is not None:
+                register_casters(connection, members=members)
+            with timer('values_list {} rows ({})'.format(size, label)):
+                for value in FirstModel.objects.values_list('test_enum', 'meta_enum').iterator():
+                    pass
+    connection.close()
+
+
+def run(names):
+    django.setup()
+    runner = get_runner(settings)(verbosity=0)
+    runner.setup_test_environment()
+    old_config = runner.setup_databases()
+    try:
+        for name in names or sorted(BENCHMARKS):
+            print('{}: {}'.format(name, BENCHMARKS[name].__doc__.strip()))
+            BENCHMARKS[name]()
+    finally:
+        runner.teardown_databases(old_config)
+        runner.teardown_test_environment()
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
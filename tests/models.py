@@ -1,8 +1,12 @@
 
+import uuid
 from enum import Enum
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django_enum import EnumField, enum_meta
-from django_more.fields import NullCharField
+from django_more.fields import NullCharField, OrderByField
+from django_more.indexes import PartialUniqueIndex
 
 
 class TestEnum(Enum):
@@ -25,6 +29,11 @@ class MetaEnum(Enum):
     @enum_meta
     class Meta:
         db_type = 'test_enum_meta'
+        db_codes = {
+            'First meta value': 3,
+            'So meta': 1,
+            'Third value is the best': 7,
+        }
 
 
 class FirstModel(models.Model):
@@ -32,5 +41,85 @@ class FirstModel(models.Model):
     meta_enum = EnumField(MetaEnum)
 
 
+class CompactEnumModel(models.Model):
+    test_enum = EnumField(TestEnum, storage='smallint')
+    meta_enum = EnumField(MetaEnum, storage='smallint', null=True)
+
+
 class NullCharModel(models.Model):
     test_field = NullCharField(max_length=50)
+
+
+class PartialUniqueModel(models.Model):
+    name = models.CharField(max_length=50)
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            PartialUniqueIndex(fields=['name'], deleted=False)
+        ]
+
+
+class OrderParent(models.Model):
+    name = models.CharField(max_length=50)
+    comments = GenericRelation('OrderedComment')
+
+
+class OrderedItem(models.Model):
+    parent = models.ForeignKey(OrderParent, on_delete=models.CASCADE)
+    order = OrderByField(unique_for_fields=['parent'])
+
+
+class GapOrderedItem(models.Model):
+    parent = models.ForeignKey(OrderParent, on_delete=models.CASCADE)
+    order = OrderByField(unique_for_fields=['parent'], gap=4)
+
+
+class CounterOrderedItem(models.Model):
+    parent = models.ForeignKey(OrderParent, on_delete=models.CASCADE)
+    order = OrderByField(unique_for_fields=['parent'], allocation='counter', track_size=True)
+
+
+class UntrackedCounterOrderedItem(models.Model):
+    parent = models.ForeignKey(OrderParent, on_delete=models.CASCADE)
+    order = OrderByField(unique_for_fields=['parent'], allocation='counter')
+
+
+class DeferredOrderedItem(models.Model):
+    parent = models.ForeignKey(OrderParent, on_delete=models.CASCADE)
+    order = OrderByField(unique_for_fields=['parent'], deferrable=True)
+
+
+class UUIDOrderParent(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+
+
+class UUIDOrderedItem(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    parent = models.ForeignKey(UUIDOrderParent, on_delete=models.CASCADE)
+    order = OrderByField(unique_for_fields=['parent'])
+
+
+class OrderedComment(models.Model):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey()
+    order = OrderByField(unique_for_fields=['content_type', 'object_id'])
+
+
+try:
+    from enum import Flag
+except ImportError:
+    # Python 3.5, FlagField requires enum.Flag
+    Flag = None
+else:
+    from django_enum import FlagField
+
+    class Permission(Flag):
+        READ = 1
+        WRITE = 2
+        EXECUTE = 4
+        READ_WRITE = 3
+
+    class FlagModel(models.Model):
+        permissions = FlagField(Permission, default=Permission.READ)
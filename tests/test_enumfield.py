@@ -1,11 +1,41 @@
 """ Run tests related to django_enum.EnumField """
+from enum import Enum
+from functools import partial
+from unittest import mock, skipUnless
 # Framework imports
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError
+from django.db import connection, models
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.state import ModelState, ProjectState
 from django.db.models.fields import BLANK_CHOICE_DASH
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django_enum import EnumField
-from .models import TestEnum, WrongEnum, MetaEnum
+from django_enum.casters import get_enum_types, register_casters
+from django_enum.operations import AlterEnum, CreateEnum, enum_state
+from django_enum.patches import MysqlDatabaseSchemaEditor
+from .models import CompactEnumModel, FirstModel, TestEnum, WrongEnum, MetaEnum
 from . import FieldTestCase
 
 
+class CodedEnum(Enum):
+    A = 'a'
+    B = 'b'
+
+
+def coded_state(*operations):
+    """ State with a model storing CodedEnum as codes, and types from operations """
+    state = ProjectState()
+    state.add_model(ModelState('tests', 'Coded', [
+        ('id', models.AutoField(primary_key=True)),
+        ('value', EnumField(CodedEnum, storage='smallint'))]))
+    for operation in operations:
+        operation.state_forwards('tests', state)
+    return state
+
+
 class EnumFieldTest(FieldTestCase):
     multi_db = True
 
@@ -75,3 +105,341 @@ class EnumFieldTest(FieldTestCase):
         choices = field.get_choices(blank_choice=BLANK_CHOICE_DASH)
         expected = BLANK_CHOICE_DASH + [(str(em), em.value) for em in members]
         self.assertEqual(choices, expected)
+
+    def test_member_names(self):
+        self.assertFieldValue(
+            fieldclass=EnumField,
+            valid={
+                'TestEnum.VAL1': TestEnum.VAL1,
+                'TestEnum.VAL3': TestEnum.VAL3},
+            invalid={
+                'TestEnum.VAL4': 'not in enumeration',
+                'WrongEnum.VAL1': 'not in enumeration',
+                'testenum.val1': 'not in enumeration'},
+            field_args=[TestEnum])
+
+    def test_from_db_value(self):
+        field = EnumField(TestEnum)
+        self.assertEqual(field.from_db_value('The second value', None, None, None), TestEnum.VAL2)
+        self.assertIsNone(field.from_db_value(None, None, None, None))
+        with self.assertRaises(ValueError):
+            field.from_db_value('the second value', None, None, None)
+
+    def test_lookups_follow_type_def(self):
+        field = EnumField(TestEnum, case_sensitive=False)
+        field.type_def = WrongEnum
+        self.assertEqual(field.to_python('another ONE wrong'), WrongEnum.VAL2)
+        self.assertEqual(field.to_python('WrongEnum.VAL1'), WrongEnum.VAL1)
+        self.assertEqual(field.from_db_value('Another one wrong', None, None, None), WrongEnum.VAL2)
+        with self.assertRaisesRegex(ValidationError, 'not in enumeration'):
+            field.to_python('The first value')
+
+    def test_validate_manual_choices(self):
+        field = EnumField(TestEnum, choices=[TestEnum.VAL1, TestEnum.VAL2])
+        field.validate(TestEnum.VAL2, None)
+        with self.assertRaisesRegex(ValidationError, 'not a valid choice'):
+            field.validate(TestEnum.VAL3, None)
+
+
+class CompactEnumFieldTest(TestCase):
+
+    def test_storage(self):
+        obj = CompactEnumModel.objects.create(test_enum=TestEnum.VAL2, meta_enum='Third value is the best')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT test_enum, meta_enum FROM {} WHERE id = %s'.format(CompactEnumModel._meta.db_table), [obj.pk])
+            self.assertEqual(cursor.fetchone(), (2, 7))
+        obj.refresh_from_db()
+        self.assertEqual((obj.test_enum, obj.meta_enum), (TestEnum.VAL2, MetaEnum.VAL3))
+
+    def test_lookups(self):
+        CompactEnumModel.objects.create(test_enum=TestEnum.VAL1)
+        CompactEnumModel.objects.create(test_enum=TestEnum.VAL3, meta_enum=MetaEnum.VAL2)
+        self.assertEqual(CompactEnumModel.objects.filter(test_enum='Third value is the best').count(), 1)
+        self.assertEqual(CompactEnumModel.objects.filter(test_enum__in=[TestEnum.VAL1, 'TestEnum.VAL3']).count(), 2)
+        self.assertEqual(
+            list(CompactEnumModel.objects.order_by('pk').values_list('test_enum', 'meta_enum')),
+            [(TestEnum.VAL1, None), (TestEnum.VAL3, MetaEnum.VAL2)])
+
+    def test_field(self):
+        field = CompactEnumModel._meta.get_field('test_enum')
+        self.assertEqual(field.db_type(connection), models.SmallIntegerField().db_type(connection))
+        self.assertEqual(field.deconstruct()[3]['storage'], 'smallint')
+        self.assertNotIn('storage', EnumField(TestEnum).deconstruct()[3])
+        obj = CompactEnumModel(test_enum=TestEnum.VAL3)
+        self.assertEqual(field.value_to_string(obj), 'Third value is the best')
+        with self.assertRaises(ValueError):
+            EnumField(TestEnum, storage='bigint')
+
+    def test_state_codes(self):
+        self.assertEqual(enum_state(TestEnum).codes(), {
+            'The first value': 1, 'The second value': 2, 'Third value is the best': 3})
+        self.assertEqual(enum_state(MetaEnum).codes(), MetaEnum.Meta.db_codes)
+
+        state = ProjectState()
+        CreateEnum('coded', ['b', 'a', 'c'], codes={'a': 1, 'b': 2, 'c': 3}).state_forwards('tests', state)
+        AlterEnum('coded', add_values=['e', 'd'], remove_values=['c']).state_forwards('tests', state)
+        # Codes of removed values are not reused
+        self.assertEqual(state.db_types['coded'].codes(), {'a': 1, 'b': 2, 'd': 4, 'e': 5})
+        AlterEnum('coded', codes={'a': 1, 'b': 2, 'd': 8, 'e': 9}).state_forwards('tests', state)
+        field = EnumField(storage='smallint')
+        field.type_def = state.db_types['coded']
+        self.assertEqual(field.get_prep_value('d'), 8)
+        self.assertEqual(field.from_db_value(9, None, connection, None).value, 'e')
+
+    def test_codes_changed(self):
+        type_name = 'tests_enum_codedenum'
+        from_state = coded_state(CreateEnum(type_name, ['b', 'a'], codes={'b': 1, 'a': 2}))
+        with self.assertRaisesRegex(CommandError, r"Declare Meta.db_codes .* \{'b': 1, 'a': 2\}"):
+            MigrationAutodetector(from_state, coded_state())._detect_changes()
+
+    def test_not_declared(self):
+        changes = MigrationAutodetector(ProjectState(), coded_state())._detect_changes()
+        operation, = [op for op in changes['tests'][0].operations if isinstance(op, CreateEnum)]
+        self.assertIs(operation.declare, False)
+
+        schema_editor = mock.Mock(
+            sql_create_enum='CREATE TYPE %(enum_type)s AS ENUM (%(values)s)', sql_delete_enum='DROP TYPE %(enum_type)s')
+        schema_editor.connection.features.requires_enum_declaration = True
+        from_state = ProjectState()
+        to_state = coded_state(operation)
+        operation.database_forwards('tests', schema_editor, from_state, to_state)
+        self.assertFalse(schema_editor.execute.called)
+        AlterEnum(operation.db_type, add_values=['c']).database_forwards(
+            'tests', schema_editor, to_state, coded_state(operation, AlterEnum(operation.db_type, add_values=['c'])))
+        self.assertFalse(schema_editor.execute.called)
+
+        # Declared with all values once a field stores text
+        declare = AlterEnum(operation.db_type, declare=True)
+        declared_state = coded_state(operation, declare)
+        declare.database_forwards('tests', schema_editor, to_state, declared_state)
+        schema_editor.execute.assert_called_once_with('CREATE TYPE tests_enum_codedenum AS ENUM (%s, %s)', ['a', 'b'])
+        declare.database_backwards('tests', schema_editor, declared_state, to_state)
+        schema_editor.execute.assert_called_with('DROP TYPE tests_enum_codedenum', [])
+
+
+class AlterEnumRemoveTest(TestCase):
+    removed = 'Removed value'
+
+    def setUp(self):
+        # States where the enum of FirstModel.test_enum has an extra value, which is then removed
+        self.type_name = FirstModel._meta.get_field('test_enum').type_name
+        self.from_state = ProjectState.from_apps(apps)
+        CreateEnum(self.type_name, [em.value for em in TestEnum]).state_forwards('tests', self.from_state)
+        AlterEnum(self.type_name, add_values=[self.removed]).state_forwards('tests', self.from_state)
+        self.kept = FirstModel.objects.create(test_enum=TestEnum.VAL2, meta_enum=MetaEnum.VAL1)
+        with connection.cursor() as cursor:
+            for i in range(5):
+                cursor.execute(
+                    'INSERT INTO {} (test_enum, meta_enum) VALUES (%s, %s)'.format(FirstModel._meta.db_table),
+                    [self.removed, MetaEnum.VAL1.value])
+
+    def alter(self, collect_sql=False, **kwargs):
+        operation = AlterEnum(self.type_name, remove_values=[self.removed], **kwargs)
+        to_state = self.from_state.clone()
+        operation.state_forwards('tests', to_state)
+        with connection.schema_editor(collect_sql=collect_sql) as schema_editor:
+            operation.database_forwards('tests', schema_editor, self.from_state, to_state)
+        return schema_editor
+
+    def test_set(self):
+        with CaptureQueriesContext(connection) as context:
+            self.alter(on_delete=models.SET(TestEnum.VAL1.value))
+        # One UPDATE of all records, nothing loaded
+        self.assertEqual(
+            [q['sql'].split()[0] for q in context.captured_queries if FirstModel._meta.db_table in q['sql']],
+            ['UPDATE'])
+        self.assertEqual(FirstModel.objects.filter(test_enum=TestEnum.VAL1).count(), 5)
+        self.assertEqual(FirstModel.objects.get(pk=self.kept.pk).test_enum, TestEnum.VAL2)
+
+    def test_set_codes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO {} (test_enum) VALUES (%s)'.format(CompactEnumModel._meta.db_table), [4])
+        # Value added by the same operation, which has no code before it
+        self.alter(add_values=['Added value'], on_delete=models.SET('Added value'))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT test_enum FROM {}'.format(CompactEnumModel._meta.db_table))
+            self.assertEqual(cursor.fetchall(), [(5, )])
+            cursor.execute('SELECT COUNT(*) FROM {} WHERE test_enum = %s'.format(FirstModel._meta.db_table), ['Added value'])
+            self.assertEqual(cursor.fetchone(), (5, ))
+            cursor.execute('UPDATE {} SET test_enum = 4'.format(CompactEnumModel._meta.db_table))
+        # Enum members are written by value
+        self.alter(on_delete=models.SET(TestEnum.VAL2))
+        self.assertEqual(list(CompactEnumModel.objects.values_list('test_enum', flat=True)), [TestEnum.VAL2])
+
+    def test_cascade(self):
+        self.alter(on_delete=models.CASCADE)
+        self.assertEqual(list(FirstModel.objects.values_list('pk', flat=True)), [self.kept.pk])
+
+    def test_protect(self):
+        with self.assertRaisesRegex(models.ProtectedError, 'protected field'):
+            self.alter(on_delete=models.PROTECT)
+        self.assertEqual(FirstModel.objects.count(), 6)
+
+    def test_batches(self):
+        with CaptureQueriesContext(connection) as context:
+            self.alter(on_delete=models.SET_DEFAULT, batch_size=2)
+        # Primary key ranges of 2, 2 and the remainder
+        self.assertEqual(
+            [q['sql'].split()[0] for q in context.captured_queries
+             if q['sql'].startswith('UPDATE') and FirstModel._meta.db_table in q['sql']],
+            ['UPDATE'] * 3)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM {} WHERE test_enum = %s'.format(FirstModel._meta.db_table), [self.removed])
+            self.assertEqual(cursor.fetchone(), (0, ))
+
+    def test_batches_collect_sql(self):
+        with CaptureQueriesContext(connection) as context:
+            schema_editor = self.alter(collect_sql=True, on_delete=models.SET_DEFAULT, batch_size=2)
+        # Ranges aren't known in advance, so a single statement is written out and nothing is queried
+        self.assertFalse([q for q in context.captured_queries if FirstModel._meta.db_table in q['sql']])
+        self.assertEqual(len([
+            sql for sql in schema_editor.collected_sql
+            if sql.startswith('UPDATE') and FirstModel._meta.db_table in sql]), 1)
+        self.assertTrue(any(sql.startswith('-- ') and 'batches of 2' in sql for sql in schema_editor.collected_sql))
+        self.assertEqual(FirstModel.objects.filter(test_enum__in=list(TestEnum)).count(), 1)
+        self.alter(on_delete=models.CASCADE, batch_size=2)
+        self.assertEqual(FirstModel.objects.count(), 1)
+
+    def test_alter_columns_grouped(self):
+        schema_editor = connection.schema_editor()
+        changes = [
+            AlterEnum.alter_column_type(schema_editor, FirstModel, FirstModel._meta.get_field(name))
+            for name in ['test_enum', 'meta_enum']]
+        statements = AlterEnum.alter_columns_sql(schema_editor, changes)
+        # One statement for the table, with the changes of every column
+        self.assertEqual(len(statements), 1)
+        sql, params = statements[0]
+        self.assertTrue(sql.startswith('ALTER TABLE {}'.format(connection.ops.quote_name(FirstModel._meta.db_table))))
+        self.assertIn('{}, {}'.format(changes[0][1], changes[1][1]), sql)
+        self.assertEqual(params, changes[0][2] + changes[1][2])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Online enum removal is only available for declared enum types')
+class OnlineAlterEnumRemoveTest(TransactionTestCase):
+    available_apps = ['tests']
+    removed = AlterEnumRemoveTest.removed
+    alter = AlterEnumRemoveTest.alter
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TYPE {} ADD VALUE %s'.format(FirstModel._meta.get_field('test_enum').type_name), [self.removed])
+        AlterEnumRemoveTest.setUp(self)
+
+    def test_online(self):
+        schema_editor = self.alter(collect_sql=True, on_delete=models.SET(TestEnum.VAL3.value), online=True, batch_size=2)
+        self.assertTrue(any('CREATE TRIGGER' in sql for sql in schema_editor.collected_sql))
+        self.assertFalse(any('USING' in sql for sql in schema_editor.collected_sql))
+
+        with connection.schema_editor(atomic=False) as schema_editor:
+            operation = AlterEnum(
+                self.type_name, remove_values=[self.removed], on_delete=models.SET(TestEnum.VAL3.value),
+                online=True, batch_size=2)
+            to_state = self.from_state.clone()
+            operation.state_forwards('tests', to_state)
+            operation.database_forwards('tests', schema_editor, self.from_state, to_state)
+        self.assertEqual(FirstModel.objects.filter(test_enum=TestEnum.VAL3).count(), 5)
+        self.assertEqual(FirstModel.objects.get(pk=self.kept.pk).test_enum, TestEnum.VAL2)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT format_type(atttypid, NULL), attnotnull FROM pg_attribute '
+                'WHERE attrelid = %s::regclass AND attname = %s',
+                [FirstModel._meta.db_table, 'test_enum'])
+            self.assertEqual(cursor.fetchone(), (self.type_name, True))
+
+    def test_requires_non_atomic(self):
+        with self.assertRaisesRegex(ValueError, 'atomic = False'):
+            self.alter(on_delete=models.SET(TestEnum.VAL3.value), online=True)
+
+
+class MysqlAlterEnumTest(TestCase):
+    """ Generated SQL for inline enums, using the MySQL schema editor without a connection """
+
+    def setUp(self):
+        self.type_name = FirstModel._meta.get_field('test_enum').type_name
+        self.from_state = ProjectState.from_apps(apps)
+        CreateEnum(self.type_name, [em.value for em in TestEnum]).state_forwards('tests', self.from_state)
+
+    def alter(self, mysql_version=(8, 0, 20), **kwargs):
+        from django.db.backends.mysql.schema import DatabaseSchemaEditor
+
+        editor_class = type('SchemaEditor', (MysqlDatabaseSchemaEditor, DatabaseSchemaEditor), {
+            'quote_value': lambda self, value: "'{}'".format(value)})
+        features = mock.Mock(has_enum=True, requires_enum_declaration=False, can_rollback_ddl=False)
+        mysql = mock.Mock(vendor='mysql', alias=connection.alias, mysql_version=mysql_version, features=features)
+        mysql.ops.quote_name = lambda name: '`{}`'.format(name)
+        schema_editor = editor_class(mysql, collect_sql=True)
+
+        operation = AlterEnum(self.type_name, **kwargs)
+        to_state = self.from_state.clone()
+        operation.state_forwards('tests', to_state)
+        operation.database_forwards('tests', schema_editor, self.from_state, to_state)
+        return [sql for sql in schema_editor.collected_sql if '`{}`'.format(FirstModel._meta.db_table) in sql]
+
+    def test_append_instant(self):
+        self.assertEqual(self.alter(add_values=['Fourth value']), [
+            "ALTER TABLE `tests_firstmodel` MODIFY `test_enum` enum('The first value', 'The second value', "
+            "'Third value is the best', 'Fourth value') NOT NULL, ALGORITHM=INSTANT;"])
+
+    def test_append_inplace(self):
+        sql, = self.alter(mysql_version=(5, 7, 30), add_values=['Fourth value'])
+        self.assertTrue(sql.endswith("'Fourth value') NOT NULL, ALGORITHM=INPLACE, LOCK=NONE;"))
+        sql, = self.alter(mysql_version=(10, 2, 0), add_values=['Fourth value'])
+        self.assertTrue(sql.endswith('ALGORITHM=INPLACE, LOCK=NONE;'))
+        sql, = self.alter(mysql_version=(10, 4, 0), add_values=['Fourth value'])
+        self.assertTrue(sql.endswith('ALGORITHM=INSTANT;'))
+
+    def test_remove_copy(self):
+        sql, = self.alter(remove_values=['The second value'], on_delete=models.DO_NOTHING)
+        self.assertEqual(
+            sql,
+            "ALTER TABLE `tests_firstmodel` MODIFY `test_enum` enum('The first value', 'Third value is the best') "
+            "NOT NULL, ALGORITHM=COPY;")
+
+    def test_algorithm(self):
+        schema_editor = mock.Mock(connection=mock.Mock(mysql_version=(8, 0, 20)))
+        algorithm = partial(MysqlDatabaseSchemaEditor.enum_alter_algorithm, schema_editor)
+        self.assertEqual(algorithm(['a', 'b'], ['a', 'b', 'c']), schema_editor.sql_enum_algorithm_instant)
+        # Reordered, or growing beyond 255 values into 2 bytes
+        self.assertEqual(algorithm(['a', 'b'], ['b', 'a', 'c']), schema_editor.sql_enum_algorithm_copy)
+        values = [str(i) for i in range(255)]
+        self.assertEqual(algorithm(values, values + ['x']), schema_editor.sql_enum_algorithm_copy)
+        self.assertEqual(algorithm(values + ['x'], values + ['x', 'y']), schema_editor.sql_enum_algorithm_instant)
+
+
+class EnumCastersTest(TestCase):
+
+    def test_enum_types(self):
+        enums = get_enum_types()
+        self.assertIs(enums[FirstModel._meta.get_field('test_enum').type_name], TestEnum)
+        self.assertIs(enums[FirstModel._meta.get_field('meta_enum').type_name], MetaEnum)
+
+    def test_converters(self):
+        field = FirstModel._meta.get_field('test_enum')
+        compact_field = CompactEnumModel._meta.get_field('test_enum')
+        fake_connection = mock.Mock(enum_casters={field.type_name: TestEnum})
+        self.assertEqual(field.get_db_converters(fake_connection), [])
+        self.assertEqual(compact_field.get_db_converters(fake_connection), [compact_field.from_db_value])
+        self.assertEqual(field.get_db_converters(connection), [field.from_db_value])
+        # Members decoded by the driver are passed through
+        self.assertIs(field.from_db_value(TestEnum.VAL2, None, connection, None), TestEnum.VAL2)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Casters are only available for declared enum types')
+class RegisterEnumCastersTest(TransactionTestCase):
+    available_apps = ['tests']
+
+    def tearDown(self):
+        # Reconnect to restore default decoding
+        connection.close()
+
+    def test_register(self):
+        FirstModel.objects.create(test_enum=TestEnum.VAL3, meta_enum=MetaEnum.VAL1)
+        register_casters(connection)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT test_enum FROM {}'.format(FirstModel._meta.db_table))
+            self.assertIs(cursor.fetchone()[0], TestEnum.VAL3.value)
+        register_casters(connection, members=True)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT test_enum FROM {}'.format(FirstModel._meta.db_table))
+            self.assertIs(cursor.fetchone()[0], TestEnum.VAL3)
+        self.assertEqual(list(FirstModel.objects.values_list('test_enum', flat=True)), [TestEnum.VAL3])
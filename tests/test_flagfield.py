@@ -0,0 +1,112 @@
+from unittest import skipUnless
+
+from django.apps import apps
+from django.db import connection, models
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.state import ProjectState
+from django.test.utils import CaptureQueriesContext
+from django_enum.operations import CreateEnum
+from .models import Flag, TestEnum
+from . import FieldTestCase
+
+if Flag:
+    from django_enum import FlagField
+    from django_enum.flags import AlterFlag, CreateFlag, flag_state
+    from .models import FlagModel, Permission
+
+
+@skipUnless(Flag, 'FlagField requires enum.Flag from Python 3.6')
+class FlagFieldTest(FieldTestCase):
+
+    def test_assignment(self):
+        self.assertFieldValue(
+            FlagField,
+            field_args=[Permission],
+            valid={
+                Permission.READ: Permission.READ,
+                5: Permission.READ | Permission.EXECUTE,
+                '3': Permission.READ_WRITE,
+                'READ|Permission.EXECUTE': Permission.READ | Permission.EXECUTE,
+                '': Permission(0),
+                (Permission.WRITE, 'EXECUTE'): Permission.WRITE | Permission.EXECUTE,
+            },
+            invalid={
+                8: 'not a combination of flags',
+                'DELETE': 'not in flags',
+                TestEnum.VAL1: 'incompatible enumeration',
+                1.5: 'Invalid type',
+            })
+
+    def test_storage(self):
+        obj = FlagModel.objects.create(permissions=Permission.READ | Permission.EXECUTE)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT permissions FROM {} WHERE id = %s'.format(FlagModel._meta.db_table), [obj.pk])
+            self.assertEqual(cursor.fetchone(), (5,))
+        obj.refresh_from_db()
+        self.assertEqual(obj.permissions, Permission.READ | Permission.EXECUTE)
+        default = FlagModel.objects.create()
+        default.refresh_from_db()
+        self.assertEqual(default.permissions, Permission.READ)
+        field = FlagModel._meta.get_field('permissions')
+        self.assertEqual(field.deconstruct()[3]['default'], 1)
+        self.assertEqual(field.db_type(connection), models.BigIntegerField().db_type(connection))
+        self.assertEqual(field.value_to_string(obj), '5')
+        # Bits of undeclared flags are ignored
+        self.assertEqual(field.from_db_value(9, None, connection, None), Permission.READ)
+
+    def test_lookups(self):
+        FlagModel.objects.create(permissions=Permission.READ)
+        FlagModel.objects.create(permissions=Permission.READ_WRITE)
+        FlagModel.objects.create(permissions=Permission.WRITE | Permission.EXECUTE)
+        FlagModel.objects.create(permissions=Permission(0))
+
+        def values(**kwargs):
+            return sorted(obj.permissions.value for obj in FlagModel.objects.filter(**kwargs))
+
+        self.assertEqual(values(permissions__has_all=Permission.READ_WRITE), [3])
+        self.assertEqual(values(permissions__has_all=Permission.WRITE), [3, 6])
+        self.assertEqual(values(permissions__has_any=['READ', 'EXECUTE']), [1, 3, 6])
+        self.assertEqual(values(permissions__has_none=Permission.READ), [0, 6])
+        self.assertEqual(values(permissions=Permission.READ_WRITE), [3])
+
+    def test_state(self):
+        state = ProjectState()
+        CreateFlag('flag', flag_state(Permission).flags()).state_forwards('tests', state)
+        AlterFlag('flag', add_flags={'DELETE': 8}).state_forwards('tests', state)
+        self.assertEqual(state.db_types['flag'].flags(), {
+            'READ': 1, 'WRITE': 2, 'EXECUTE': 4, 'READ_WRITE': 3, 'DELETE': 8})
+        AlterFlag('flag', add_flags={'RUN': 4}, remove_flags={'EXECUTE': 4}).state_forwards('tests', state)
+        self.assertEqual(state.db_types['flag'].mask(), 15)
+
+    def test_autodetect(self):
+        type_name = FlagModel._meta.get_field('permissions').type_name
+        to_state = ProjectState.from_apps(apps)
+        from_state = ProjectState.from_apps(apps)
+        CreateFlag(type_name, {'READ': 1, 'WRITE': 2, 'DELETE': 16}).state_forwards('tests', from_state)
+        changes = MigrationAutodetector(from_state, to_state)._detect_changes()
+        operations = [op for op in changes['tests'][0].operations if isinstance(op, AlterFlag)]
+        self.assertEqual(len(operations), 1)
+        self.assertEqual(operations[0].add_flags, {'EXECUTE': 4, 'READ_WRITE': 3})
+        self.assertEqual(operations[0].remove_flags, {'DELETE': 16})
+        # No flag types are treated as database enums
+        self.assertFalse([op for op in changes['tests'][0].operations if isinstance(op, CreateEnum) and op.db_type == type_name])
+
+    def test_remove_clears(self):
+        type_name = FlagModel._meta.get_field('permissions').type_name
+        from_state = ProjectState.from_apps(apps)
+        CreateFlag(type_name, flag_state(Permission).flags()).state_forwards('tests', from_state)
+        AlterFlag(type_name, add_flags={'DELETE': 16}).state_forwards('tests', from_state)
+        kept = FlagModel.objects.create(permissions=Permission.READ_WRITE)
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO {} (permissions) VALUES (17), (20)'.format(FlagModel._meta.db_table))
+        operation = AlterFlag(type_name, remove_flags={'DELETE': 16})
+        to_state = from_state.clone()
+        operation.state_forwards('tests', to_state)
+        with CaptureQueriesContext(connection) as context:
+            with connection.schema_editor() as schema_editor:
+                operation.database_forwards('tests', schema_editor, from_state, to_state)
+        self.assertEqual(
+            [q['sql'].split()[0] for q in context.captured_queries if FlagModel._meta.db_table in q['sql']],
+            ['UPDATE'])
+        self.assertEqual(sorted(em.value for em in FlagModel.objects.values_list('permissions', flat=True)), [1, 3, 4])
+        self.assertEqual(FlagModel.objects.get(pk=kept.pk).permissions, Permission.READ_WRITE)
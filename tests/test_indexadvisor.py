@@ -0,0 +1,45 @@
+""" Run tests related to django_more.advisor """
+# Framework imports
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+from django_more.advisor import IndexAdvisor
+from .models import PartialUniqueModel
+
+
+def workload():
+    for name in ['a', 'b', 'c', 'd', 'e', 'f']:
+        list(PartialUniqueModel.objects.filter(deleted=False, name=name))
+
+
+class IndexAdvisorTest(TestCase):
+
+    def setUp(self):
+        PartialUniqueModel.objects.create(name='a')
+        PartialUniqueModel.objects.create(name='b', deleted=True)
+        PartialUniqueModel.objects.create(name='c', deleted=True)
+        PartialUniqueModel.objects.create(name='d', deleted=True)
+
+    def test_suggestions(self):
+        advisor = IndexAdvisor()
+        with advisor.capture():
+            workload()
+        suggestions = advisor.suggestions()
+        self.assertEqual(len(suggestions), 1)
+        s = suggestions[0]
+        self.assertEqual(s.model, PartialUniqueModel)
+        self.assertEqual(s.fields, ['name'])
+        self.assertEqual(s.filters, {'deleted': False})
+        self.assertEqual((s.count, s.matching, s.total), (6, 1, 4))
+        self.assertEqual(advisor.render(s), "PartialIndex(fields=['name'], deleted=False)")
+
+    def test_null_predicates(self):
+        advisor = IndexAdvisor(min_count=1)
+        advisor.add('SELECT "id" FROM "tests_partialuniquemodel" WHERE "tests_partialuniquemodel"."name" IS NULL')
+        self.assertEqual(advisor.suggestions()[0].filters, {'name__isnull': True})
+
+    def test_command(self):
+        out = StringIO()
+        call_command('suggest_partial_indexes', run=['tests.test_indexadvisor.workload'], stdout=out)
+        self.assertIn("PartialIndex(fields=['name'], deleted=False)", out.getvalue())
+        self.assertIn('selectivity 25.0%', out.getvalue())
@@ -0,0 +1,695 @@
+""" Run tests related to django_more.OrderByField """
+import random
+from unittest import mock
+# Framework imports
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection, IntegrityError, models, transaction
+from django.db.migrations import operations
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.state import ProjectState
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+from django_more import OrderByField
+from django_more.models import OrderCounter
+from django_more.operations import AlterUniqueDeferrable
+from .models import (
+    OrderParent, OrderedItem, GapOrderedItem, CounterOrderedItem, UntrackedCounterOrderedItem, DeferredOrderedItem,
+    OrderedComment,
+    UUIDOrderParent, UUIDOrderedItem)
+
+
+class OrderByFieldTestCase(TestCase):
+    model = OrderedItem
+
+    def setUp(self):
+        # unique_for_fields constraints are only generated by migrations, which test models don't have
+        field = self.model._meta.get_field('order')
+        with connection.schema_editor() as schema_editor:
+            schema_editor.execute(schema_editor._create_unique_sql(
+                self.model, field.group_attnames + [field.column]))
+        self.parent = OrderParent.objects.create(name='parent')
+        self.other_parent = OrderParent.objects.create(name='other')
+        self.items = self.create_items(self.parent, 5)
+
+    def create_items(self, parent, count):
+        items = [self.model.objects.create(parent=parent) for i in range(count)]
+        for item in items:
+            item.refresh_from_db()
+        return items
+
+    def assertOrder(self, parent, items):
+        self.assertEqual(
+            list(self.model.objects.filter(parent=parent).order_by('order').values_list('pk', flat=True)),
+            [item.pk for item in items])
+
+    def get_positions(self, parent):
+        return list(self.model.objects.filter(parent=parent).order_by('order').values_list('order', flat=True))
+
+
+class OrderByFieldTest(OrderByFieldTestCase):
+
+    def test_create(self):
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+        other = self.create_items(self.other_parent, 2)
+        self.assertEqual([item.order for item in other], [0, 1])
+
+    def test_set_group_order(self):
+        items = self.items
+        items[0].set_order_set([items[4].pk, items[2].pk])
+        self.assertOrder(self.parent, [items[0], items[1], items[3], items[4], items[2]])
+        items[0].set_order_set([item.pk for item in reversed(items)], reset_values=True)
+        self.assertOrder(self.parent, list(reversed(items)))
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+
+    def test_set_group_order_remote(self):
+        items = self.items
+        other = self.create_items(self.other_parent, 2)
+        # Records outside of the group are ignored
+        self.parent.set_ordereditem_set([items[3].pk, other[0].pk, items[1].pk])
+        self.assertOrder(self.parent, [items[0], items[2], items[4], items[3], items[1]])
+        self.assertOrder(self.other_parent, other)
+        self.assertEqual(list(self.parent.get_ordereditem_set()), [items[i].pk for i in [0, 2, 4, 3, 1]])
+
+    def test_set_group_order_batched(self):
+        # More records than fit within SQLite variable limits in one statement
+        items = [OrderedItem(parent=self.other_parent, order=i) for i in range(1200)]
+        OrderedItem.objects.bulk_create(items)
+        pks = list(OrderedItem.objects.filter(parent=self.other_parent).values_list('pk', flat=True))
+        self.other_parent.set_ordereditem_set(list(reversed(pks)), reset_values=True)
+        self.assertEqual(list(self.other_parent.get_ordereditem_set()), list(reversed(pks)))
+        self.assertEqual(self.get_positions(self.other_parent), list(range(1200)))
+
+    def test_reorder_minimal(self):
+        items = self.create_items(self.other_parent, 20)
+        # Moving one record renumbers only the span it crosses
+        order = items[:3] + items[4:10] + [items[3]] + items[10:]
+        with self.assertNumQueries(5):
+            moved = self.other_parent.reorder_ordereditem_set([item.pk for item in order])
+        self.assertEqual(moved, 7)
+        self.assertOrder(self.other_parent, order)
+        self.assertEqual(self.get_positions(self.other_parent), list(range(20)))
+        # Already in order
+        self.assertEqual(items[0].reorder_order_set([item.pk for item in order]), 0)
+
+    def test_reorder_contiguous(self):
+        items = self.create_items(self.other_parent, 30)
+        rng = random.Random(0)
+        for i in range(50):
+            order = list(items)
+            item = order.pop(rng.randrange(len(order)))
+            order.insert(rng.randrange(len(order) + 1), item)
+            self.other_parent.reorder_ordereditem_set([item.pk for item in order])
+            self.assertOrder(self.other_parent, order)
+            self.assertEqual(self.get_positions(self.other_parent), list(range(30)))
+            items = order
+        # Moving to the end shifts only the records it passes
+        self.assertEqual(self.parent.reorder_ordereditem_set([item.pk for item in self.items[1:] + self.items[:1]]), 5)
+        self.assertEqual(self.get_positions(self.parent), list(range(5)))
+
+    def test_set_group_order_string_ids(self):
+        items = self.items
+        items[0].set_order_set([str(item.pk) for item in reversed(items)], reset_values=True)
+        self.assertOrder(self.parent, list(reversed(items)))
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+
+    def test_reorder_string_ids(self):
+        items = self.items
+        self.assertEqual(items[0].reorder_order_set([str(items[4].pk), str(items[3].pk)]), 5)
+        self.assertOrder(self.parent, [items[4], items[3], items[0], items[1], items[2]])
+
+    def test_reorder_partial(self):
+        items = self.items
+        # Unlisted records follow listed records in their current order
+        self.assertEqual(items[0].reorder_order_set([items[4].pk, items[3].pk]), 5)
+        self.assertOrder(self.parent, [items[4], items[3], items[0], items[1], items[2]])
+        self.assertEqual(self.get_positions(self.parent), list(range(5)))
+
+    def test_move_to(self):
+        items = self.items
+        # Locked reads of the record and the range, two range updates, and the savepoint
+        with self.assertNumQueries(6):
+            items[4].move_to(1)
+        self.assertOrder(self.parent, [items[0], items[4], items[1], items[2], items[3]])
+        self.assertEqual(items[4].order, 1)
+        items[4].move_to(4)
+        self.assertOrder(self.parent, items)
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+        with self.assertRaises(ValueError):
+            items[0].move_to(-1)
+        with self.assertRaises(ValueError):
+            items[0].move_to(5)
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+        # Both ends of the group
+        items[0].move_to(4)
+        items[3].refresh_from_db()
+        items[3].move_to(0)
+        self.assertOrder(self.parent, [items[3], items[1], items[2], items[4], items[0]])
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+
+    def test_move_to_stale(self):
+        items = self.items
+        # Position and group are read from the record, not the instance
+        stale = OrderedItem.objects.get(pk=items[1].pk)
+        stale.order = 0
+        stale.parent = self.other_parent
+        stale.move_to(2)
+        self.assertEqual(stale.order, 2)
+        self.assertOrder(self.parent, [items[0], items[2], items[1], items[3], items[4]])
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+        stale.order = 4
+        stale.move_above(items[0])
+        self.assertOrder(self.parent, [items[1], items[0], items[2], items[3], items[4]])
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+
+    def test_move_above_below(self):
+        items = self.items
+        items[0].move_above(items[3])
+        self.assertOrder(self.parent, [items[1], items[2], items[0], items[3], items[4]])
+        items = [OrderedItem.objects.get(pk=item.pk) for item in items]
+        items[4].move_above(items[1])
+        self.assertOrder(self.parent, [items[4], items[1], items[2], items[0], items[3]])
+        items = [OrderedItem.objects.get(pk=item.pk) for item in items]
+        items[4].move_below(items[3])
+        self.assertOrder(self.parent, [items[1], items[2], items[0], items[3], items[4]])
+        items = [OrderedItem.objects.get(pk=item.pk) for item in items]
+        items[3].move_below(items[1])
+        self.assertOrder(self.parent, [items[1], items[3], items[2], items[0], items[4]])
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+        with self.assertRaises(ValueError):
+            items[0].move_above(self.create_items(self.other_parent, 1)[0])
+
+    def test_bulk_create(self):
+        third_parent = OrderParent.objects.create(name='third')
+        objs = [
+            OrderedItem(parent=self.parent),
+            OrderedItem(parent=self.other_parent),
+            OrderedItem(parent=self.parent),
+            OrderedItem(parent=third_parent, order=3),
+            OrderedItem(parent=third_parent)]
+        # Read end of all groups, then a single insert
+        with self.assertNumQueries(2):
+            OrderedItem.bulk_create_in_order(objs)
+        self.assertEqual([obj.order for obj in objs], [5, 0, 6, 3, 4])
+        self.assertEqual(self.get_positions(self.other_parent), [0])
+        self.assertEqual(self.get_positions(third_parent), [3, 4])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OrderedItem.bulk_create_in_order([OrderedItem(parent=self.parent, order=0)])
+
+    def test_compact_command(self):
+        items = self.items
+        other = self.create_items(self.other_parent, 3)
+        OrderedItem.objects.filter(pk__in=[items[0].pk, items[3].pk, other[0].pk]).delete()
+        OrderedItem.objects.filter(pk=items[4].pk).update(order=50)
+        out = StringIO()
+        call_command(
+            'compact_order_positions', 'tests.OrderedItem.order', filter=['parent={}'.format(self.parent.pk)],
+            batch_size=2, stdout=out)
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2])
+        self.assertOrder(self.parent, [items[1], items[2], items[4]])
+        self.assertIn('parent_id={}: 3 records, 3 moved'.format(self.parent.pk), out.getvalue())
+        # Other groups are untouched unless selected
+        self.assertEqual(self.get_positions(self.other_parent), [1, 2])
+        out = StringIO()
+        call_command('compact_order_positions', 'tests.OrderedItem', stdout=out)
+        self.assertEqual(self.get_positions(self.other_parent), [0, 1])
+        self.assertIn('Compacted 2 groups of tests.OrderedItem, 2 of 5 records moved', out.getvalue())
+
+    def test_keyset_pagination(self):
+        items = self.items
+        items[4].move_to(0)
+        order = [items[4], items[0], items[1], items[2], items[3]]
+        pages = []
+        cursor = None
+        while True:
+            page = list(items[0].get_order_set(after=cursor, limit=2))
+            if not page:
+                break
+            pages.append(page)
+            cursor = OrderedItem.objects.get(pk=page[-1]).get_order_cursor()
+        self.assertEqual(pages, [[order[0].pk, order[1].pk], [order[2].pk, order[3].pk], [order[4].pk]])
+        # Instances can be used in place of cursors
+        self.assertEqual(list(self.parent.get_ordereditem_set(after=OrderedItem.objects.get(pk=order[2].pk), limit=10)), [order[3].pk, order[4].pk])
+        self.assertIn('"order" > ', str(items[0].get_order_set(after=order[2]).query))
+        with self.assertRaises(ValueError):
+            items[0].get_order_set(after='invalid')
+
+    def test_move_to_group(self):
+        items = self.items
+        other = self.create_items(self.other_parent, 2)
+        third_parent = OrderParent.objects.create(name='third')
+        with CaptureQueriesContext(connection) as context:
+            moved = OrderedItem.move_to_order_group([items[3].pk, items[1].pk, other[0]], parent=self.other_parent)
+        self.assertEqual(moved, 3)
+        # Read and lock the records, read the end of the target group, a single update
+        self.assertEqual(len([query for query in context.captured_queries if 'SAVEPOINT' not in query['sql']]), 3)
+        # Appended in their current order, including records already in the group
+        self.assertOrder(self.other_parent, [other[1], items[1], items[3], other[0]])
+        self.assertEqual(self.get_positions(self.other_parent), [1, 2, 3, 4])
+        self.assertOrder(self.parent, [items[0], items[2], items[4]])
+        # Source groups renumbered on request
+        OrderedItem.move_to_order_group(
+            OrderedItem.objects.filter(pk__in=[items[2].pk, other[1].pk]), parent=third_parent.pk, compact=True)
+        self.assertOrder(third_parent, [items[2], other[1]])
+        self.assertEqual(self.get_positions(self.parent), [0, 1])
+        self.assertEqual(self.get_positions(self.other_parent), [0, 1, 2])
+        with self.assertRaises(ValueError):
+            OrderedItem.move_to_order_group([items[0].pk])
+
+    def test_get_sets(self):
+        items = self.items
+        other = self.create_items(self.other_parent, 2)
+        empty = OrderParent.objects.create(name='empty')
+        items[4].move_to(0)
+        with self.assertNumQueries(1):
+            sets = OrderParent.get_ordereditem_sets([self.parent, self.other_parent, empty])
+        self.assertEqual(sets, {
+            self.parent.pk: [items[i].pk for i in [4, 0, 1, 2, 3]],
+            self.other_parent.pk: [item.pk for item in other],
+            empty.pk: []})
+        with self.assertNumQueries(1):
+            sets = OrderParent.get_ordereditem_sets([self.parent, self.other_parent], objects=True)
+        self.assertEqual([item.pk for item in sets[self.parent.pk]], [items[i].pk for i in [4, 0, 1, 2, 3]])
+
+    def test_prefetch(self):
+        items = self.items
+        other = self.create_items(self.other_parent, 2)
+        items[4].move_to(0)
+        with self.assertNumQueries(2):
+            parents = list(OrderParent.objects.filter(pk__in=[self.parent.pk, self.other_parent.pk]).order_by(
+                'pk').prefetch_related(OrderParent.prefetch_ordereditem_set(to_attr='ordered_items')))
+            self.assertEqual(
+                [[item.pk for item in parent.ordered_items] for parent in parents],
+                [[items[i].pk for i in [4, 0, 1, 2, 3]], [item.pk for item in other]])
+        with self.assertNumQueries(2):
+            parents = list(OrderParent.objects.order_by('pk').prefetch_related(OrderParent.prefetch_ordereditem_set()))
+            self.assertEqual([item.pk for item in parents[0].ordereditem_set.all()], [items[i].pk for i in [4, 0, 1, 2, 3]])
+
+    def test_next_previous(self):
+        items = self.items
+        self.assertEqual(items[1].get_next_in_order(), items[2])
+        self.assertEqual(items[1].get_previous_in_order(), items[0])
+        self.assertIsNone(items[4].get_next_in_order())
+
+    def test_annotate_neighbours(self):
+        items = self.items
+        other = self.create_items(self.other_parent, 2)
+        items[3].move_to(0)
+        order = [items[3], items[0], items[1], items[2], items[4]]
+        with self.assertNumQueries(1):
+            annotated = {
+                item.pk: item
+                for item in OrderedItem.annotate_order_neighbours().order_by('parent', 'order')[1:]}
+        # Neighbours are found before slicing
+        self.assertNotIn(items[3].pk, annotated)
+        self.assertEqual(annotated[items[0].pk].previous_in_order_id, items[3].pk)
+        for rank, item in enumerate(order[1:], 1):
+            self.assertEqual(annotated[item.pk].rank_in_order, rank)
+            self.assertEqual(annotated[item.pk].previous_in_order_id, order[rank - 1].pk)
+        self.assertIsNone(annotated[items[4].pk].next_in_order_id)
+        self.assertIsNone(annotated[other[0].pk].previous_in_order_id)
+        self.assertEqual(annotated[other[0].pk].next_in_order_id, other[1].pk)
+
+
+class GapOrderByFieldTest(OrderByFieldTestCase):
+    model = GapOrderedItem
+
+    def test_gap_validation(self):
+        with self.assertRaises(ValueError):
+            OrderByField(gap=1)
+        name, path, args, kwargs = GapOrderedItem._meta.get_field('order').deconstruct()
+        self.assertEqual(kwargs['gap'], 4)
+
+    def test_create(self):
+        self.assertEqual(self.get_positions(self.parent), [0, 4, 8, 12, 16])
+
+    def test_move_between_single_update(self):
+        items = self.items
+        # Read neighbour positions and update a single record
+        with self.assertNumQueries(2):
+            items[4].move_between(items[0], items[1])
+        self.assertEqual(items[4].order, 2)
+        self.assertOrder(self.parent, [items[0], items[4], items[1], items[2], items[3]])
+        # Neighbour lookup when only one side is given
+        items[0].move_between(following=items[4])
+        self.assertEqual(items[0].order, 0)
+        items[1].move_between(previous=items[3])
+        self.assertOrder(self.parent, [items[0], items[4], items[2], items[3], items[1]])
+
+    def test_move_to(self):
+        items = self.items
+        # Shifted by the gap, keeping the spacing
+        items[0].move_to(8)
+        self.assertOrder(self.parent, [items[1], items[2], items[0], items[3], items[4]])
+        self.assertEqual(self.get_positions(self.parent), [0, 4, 8, 12, 16])
+        items[4].move_to(0)
+        self.assertOrder(self.parent, [items[4], items[1], items[2], items[0], items[3]])
+        self.assertEqual(self.get_positions(self.parent), [0, 4, 8, 12, 16])
+        items[1].move_below(items[0])
+        self.assertOrder(self.parent, [items[4], items[2], items[0], items[1], items[3]])
+        self.assertEqual(self.get_positions(self.parent), [0, 4, 8, 12, 16])
+
+    def test_move_to_start(self):
+        items = self.items
+        items[3].move_between(following=items[0])
+        self.assertOrder(self.parent, [items[3], items[0], items[1], items[2], items[4]])
+
+    def test_set_group_order(self):
+        items = self.items
+        items[0].set_order_set([items[2].pk, items[0].pk])
+        self.assertEqual(self.get_positions(self.parent), [4, 12, 16, 20, 24])
+        items[0].set_order_set([item.pk for item in reversed(items)], reset_values=True)
+        self.assertOrder(self.parent, list(reversed(items)))
+        self.assertEqual(self.get_positions(self.parent), [0, 4, 8, 12, 16])
+
+    def test_annotate_neighbours(self):
+        items = self.items
+        items[4].move_between(items[0], items[1])
+        qs = GapOrderedItem.annotate_order_neighbours(GapOrderedItem.objects.filter(parent=self.parent))
+        # Rank ignores gaps between positions
+        self.assertEqual(
+            list(qs.order_by('order').values_list('pk', 'order', 'rank_in_order', 'next_in_order_id')),
+            [(items[0].pk, 0, 0, items[4].pk),
+             (items[4].pk, 2, 1, items[1].pk),
+             (items[1].pk, 4, 2, items[2].pk),
+             (items[2].pk, 8, 3, items[3].pk),
+             (items[3].pk, 12, 4, None)])
+
+    def test_compact_group(self):
+        items = self.items
+        GapOrderedItem.objects.filter(pk=items[1].pk).delete()
+        field = GapOrderedItem._meta.get_field('order')
+        self.assertEqual(list(field.compact_group((self.parent.pk, ), batch_size=3)), [(3, 2), (1, 1)])
+        self.assertEqual(self.get_positions(self.parent), [0, 4, 8, 12])
+
+    def test_reorder_uses_gaps(self):
+        items = self.items
+        order = [items[0], items[3], items[1], items[4], items[2]]
+        self.assertEqual(items[0].reorder_order_set([item.pk for item in order]), 2)
+        self.assertOrder(self.parent, order)
+
+    def test_rebalance(self):
+        items = self.items
+        items[4].move_between(items[0], items[1])
+        items[3].move_between(items[0], items[4])
+        # No gap remaining between 0 and 1
+        items[2].move_between(items[0], items[3])
+        self.assertOrder(self.parent, [items[0], items[2], items[3], items[4], items[1]])
+        self.assertEqual(self.get_positions(self.parent), [0, 4, 8, 12, 16])
+        self.assertEqual(items[2].order, 4)
+
+
+class CounterOrderByFieldTest(OrderByFieldTestCase):
+    model = CounterOrderedItem
+
+    def test_allocation_validation(self):
+        with self.assertRaises(ValueError):
+            OrderByField(allocation='lock')
+        with self.assertRaises(ValueError):
+            OrderByField(track_size=True)
+        name, path, args, kwargs = CounterOrderedItem._meta.get_field('order').deconstruct()
+        self.assertEqual(kwargs['allocation'], 'counter')
+        self.assertIs(kwargs['track_size'], True)
+        name, path, args, kwargs = OrderedItem._meta.get_field('order').deconstruct()
+        self.assertNotIn('allocation', kwargs)
+
+    def test_create(self):
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+        other = self.create_items(self.other_parent, 2)
+        self.assertEqual([item.order for item in other], [0, 1])
+        # A counter row per group
+        self.assertEqual(
+            dict(OrderCounter.objects.filter(scope='tests.counterordereditem.order').values_list('group', 'value')),
+            {'[{}]'.format(self.parent.pk): 4, '[{}]'.format(self.other_parent.pk): 1})
+        # Lock counter row, read it, insert
+        with transaction.atomic(), self.assertNumQueries(3):
+            CounterOrderedItem.objects.create(parent=self.parent)
+
+    def test_follows_positions_set_elsewhere(self):
+        items = self.items
+        # Moves records beyond the counter value
+        items[0].set_order_set([items[1].pk, items[0].pk])
+        self.assertEqual(self.get_positions(self.parent), [2, 3, 4, 5, 6])
+        self.assertEqual(self.create_items(self.parent, 1)[0].order, 7)
+        CounterOrderedItem.objects.create(parent=self.parent, order=20)
+        self.assertEqual(self.create_items(self.parent, 1)[0].order, 21)
+
+    def test_group_size(self):
+        items = self.items
+        # Single read of the counter row
+        with self.assertNumQueries(1):
+            self.assertEqual(items[0].count_order_set(), 5)
+        CounterOrderedItem.objects.create(parent=self.parent, order=10)
+        CounterOrderedItem.objects.filter(pk__in=[items[0].pk, items[1].pk]).delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.parent.count_counterordereditem_set(), 4)
+        # Counted on first use where the size is not known
+        OrderCounter.objects.update(size=None)
+        self.assertEqual(self.parent.count_counterordereditem_set(), 4)
+        self.assertEqual(self.other_parent.count_counterordereditem_set(), 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.parent.count_counterordereditem_set(), 4)
+        # Counted directly without counter allocation
+        self.assertEqual(self.parent.count_ordereditem_set(), 0)
+
+    def test_move_to_group(self):
+        items = self.items
+        other = self.create_items(self.other_parent, 1)
+        CounterOrderedItem.move_to_order_group([items[0].pk, items[1].pk, other[0].pk], parent=self.other_parent)
+        self.assertEqual(self.get_positions(self.other_parent), [1, 2, 3])
+        self.assertEqual(self.parent.count_counterordereditem_set(), 3)
+        self.assertEqual(self.other_parent.count_counterordereditem_set(), 3)
+        self.assertEqual(self.create_items(self.other_parent, 1)[0].order, 4)
+
+    def test_compact_group(self):
+        items = self.items
+        CounterOrderedItem.objects.filter(pk__in=[items[1].pk, items[4].pk]).delete()
+        field = CounterOrderedItem._meta.get_field('order')
+        self.assertEqual(list(field.compact_group((self.parent.pk, ), batch_size=2)), [(2, 1), (1, 1)])
+        # The counter follows the end of the compacted group
+        self.assertEqual(
+            OrderCounter.objects.filter(**field.get_counter_kwargs((self.parent.pk, ))).values_list('value', 'size').get(),
+            (2, 3))
+        self.create_items(self.parent, 1)
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3])
+        self.assertEqual(self.parent.count_counterordereditem_set(), 4)
+
+    def test_save_to_other_group(self):
+        items = self.items
+        other = self.create_items(self.other_parent, 1)
+        self.assertEqual(self.parent.count_counterordereditem_set(), 5)
+        items[0].parent = self.other_parent
+        items[0].order = 10
+        items[0].save()
+        self.assertEqual(self.parent.count_counterordereditem_set(), 4)
+        self.assertEqual(self.other_parent.count_counterordereditem_set(), 2)
+        # Saves within the group, or not including the grouping fields, are not counted again
+        with self.assertNumQueries(1):
+            other[0].save()
+        with self.assertNumQueries(1):
+            items[0].save()
+        items[1].parent = self.other_parent
+        items[1].save(update_fields=['order'])
+        self.assertEqual(self.parent.count_counterordereditem_set(), 4)
+        self.assertEqual(self.other_parent.count_counterordereditem_set(), 2)
+
+    def test_save_refreshed(self):
+        items = self.items
+        CounterOrderedItem.move_to_order_group([items[0].pk], parent=self.other_parent)
+        items[0].refresh_from_db()
+        items[0].save()
+        # Already counted by the move, the group is checked as it differs from when loaded
+        self.assertEqual(self.parent.count_counterordereditem_set(), 4)
+        self.assertEqual(self.other_parent.count_counterordereditem_set(), 1)
+        deferred = CounterOrderedItem.objects.only('pk').get(pk=items[1].pk)
+        deferred.parent = self.other_parent
+        deferred.save()
+        self.assertEqual(self.parent.count_counterordereditem_set(), 3)
+        self.assertEqual(self.other_parent.count_counterordereditem_set(), 2)
+
+    def test_untracked_size(self):
+        # Without track_size deletes aren't made per record to maintain sizes, which are counted instead
+        self.assertFalse(models.signals.post_delete.has_listeners(UntrackedCounterOrderedItem))
+        self.assertTrue(models.signals.post_delete.has_listeners(CounterOrderedItem))
+        items = [UntrackedCounterOrderedItem.objects.create(parent=self.parent) for i in range(3)]
+        self.assertEqual([item.order for item in items], [0, 1, 2])
+        UntrackedCounterOrderedItem.objects.filter(pk=items[0].pk).delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.parent.count_untrackedcounterordereditem_set(), 2)
+
+    def test_delete_group(self):
+        self.create_items(self.other_parent, 2)
+        self.assertEqual(self.parent.count_counterordereditem_set(), 5)
+        self.parent.delete()
+        # Counter rows of emptied groups are removed with them
+        self.assertEqual(
+            list(OrderCounter.objects.values_list('group', flat=True)),
+            ['[{}]'.format(self.other_parent.pk)])
+        self.assertEqual(self.other_parent.count_counterordereditem_set(), 2)
+
+    def test_bulk_create(self):
+        objs = [
+            CounterOrderedItem(parent=self.parent),
+            CounterOrderedItem(parent=self.other_parent, order=3),
+            CounterOrderedItem(parent=self.parent),
+            CounterOrderedItem(parent=self.other_parent)]
+        CounterOrderedItem.bulk_create_in_order(objs)
+        self.assertEqual([obj.order for obj in objs], [5, 3, 6, 4])
+        self.assertEqual(self.create_items(self.other_parent, 1)[0].order, 5)
+        self.assertEqual(self.parent.count_counterordereditem_set(), 7)
+        self.assertEqual(self.other_parent.count_counterordereditem_set(), 3)
+
+
+class DeferredOrderByFieldTest(OrderByFieldTestCase):
+    model = DeferredOrderedItem
+
+    def setUp(self):
+        super().setUp()
+        self.operation = AlterUniqueDeferrable('DeferredOrderedItem', ['parent', 'order'])
+        state = ProjectState.from_apps(apps)
+        with connection.schema_editor() as schema_editor:
+            self.operation.database_forwards('tests', schema_editor, state, state)
+
+    def test_deconstruct(self):
+        name, path, args, kwargs = DeferredOrderedItem._meta.get_field('order').deconstruct()
+        self.assertIs(kwargs['deferrable'], True)
+        name, path, args, kwargs = OrderedItem._meta.get_field('order').deconstruct()
+        self.assertNotIn('deferrable', kwargs)
+        name, args, kwargs = self.operation.deconstruct()
+        self.assertEqual(kwargs, {'model_name': 'DeferredOrderedItem', 'fields': ['parent', 'order']})
+
+    def test_autodetector(self):
+        def detect(from_state, to_state):
+            # Types of other test models are also detected, as they are not in states from apps
+            changes = MigrationAutodetector(from_state, to_state)._detect_changes()
+            return [
+                operation for migration in changes.get('tests', ()) for operation in migration.operations
+                if isinstance(operation, (
+                    operations.CreateModel, operations.AlterField, operations.AlterUniqueTogether, AlterUniqueDeferrable))]
+
+        to_state = ProjectState.from_apps(apps)
+        from_state = to_state.clone()
+        model_state = from_state.models['tests', 'deferredordereditem']
+        model_state.fields = [
+            (name, OrderByField(unique_for_fields=['parent']) if name == 'order' else field)
+            for name, field in model_state.fields]
+
+        # Made deferrable after the field is altered
+        alter_field, operation = detect(from_state, to_state)
+        self.assertIsInstance(alter_field, operations.AlterField)
+        self.assertIsInstance(operation, AlterUniqueDeferrable)
+        self.assertEqual((operation.model_name, operation.fields, operation.deferrable), (
+            'DeferredOrderedItem', ['parent', 'order'], True))
+        # Returned to immediate
+        alter_field, operation = detect(to_state, from_state)
+        self.assertIs(operation.deferrable, False)
+        # Made deferrable once the constraint is created
+        from_state.remove_model('tests', 'deferredordereditem')
+        self.assertEqual(
+            [type(operation) for operation in detect(from_state, to_state)],
+            [operations.CreateModel, operations.AlterUniqueTogether, AlterUniqueDeferrable])
+        # Unchanged
+        self.assertEqual(detect(ProjectState.from_apps(apps), ProjectState.from_apps(apps)), [])
+
+    def test_operation_sql(self):
+        state = ProjectState.from_apps(apps)
+        with connection.schema_editor(collect_sql=True) as schema_editor:
+            self.operation.database_backwards('tests', schema_editor, state, state)
+        if connection.vendor == 'postgresql':
+            self.assertEqual(len(schema_editor.collected_sql), 1)
+            self.assertNotIn('DEFERRABLE', schema_editor.collected_sql[0])
+        else:
+            # Deferred unique constraints are not supported
+            self.assertEqual(schema_editor.collected_sql, [])
+
+    def test_set_group_order_single_pass(self):
+        items = self.items
+        with CaptureQueriesContext(connection) as context:
+            items[0].set_order_set([item.pk for item in reversed(items)], reset_values=True)
+        updates = [query for query in context.captured_queries if query['sql'].startswith(('UPDATE', 'WITH'))]
+        self.assertEqual(len(updates), 1 if connection.vendor == 'postgresql' else 2)
+        self.assertOrder(self.parent, list(reversed(items)))
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+
+    def test_move_to(self):
+        items = self.items
+        items[4].move_to(1)
+        self.assertOrder(self.parent, [items[0], items[4], items[1], items[2], items[3]])
+        items[4].move_to(4)
+        self.assertOrder(self.parent, items)
+        self.assertEqual(self.get_positions(self.parent), [0, 1, 2, 3, 4])
+
+
+class UUIDOrderByFieldTest(TestCase):
+
+    def setUp(self):
+        self.parent = UUIDOrderParent.objects.create()
+        self.other_parent = UUIDOrderParent.objects.create()
+        self.items = [UUIDOrderedItem.objects.create(parent=self.parent) for i in range(3)]
+        self.other_items = [UUIDOrderedItem.objects.create(parent=self.other_parent) for i in range(2)]
+
+    def test_move_to_group(self):
+        items = self.items
+        UUIDOrderedItem.move_to_order_group([items[2].pk, items[0].pk], compact=True, parent=self.other_parent)
+        self.assertEqual(
+            list(UUIDOrderedItem.objects.filter(parent=self.other_parent).order_by('order').values_list('pk', 'order')),
+            [(item.pk, i) for i, item in enumerate(self.other_items + [items[0], items[2]])])
+        self.assertEqual(
+            list(UUIDOrderedItem.objects.filter(parent=self.parent).values_list('pk', 'order')), [(items[1].pk, 0)])
+
+    def test_set_group_order_string_ids(self):
+        items = self.items
+        self.parent.set_uuidordereditem_set([str(item.pk) for item in reversed(items)], reset_values=True)
+        self.assertEqual(
+            list(UUIDOrderedItem.objects.filter(parent=self.parent).order_by('order').values_list('pk', flat=True)),
+            [item.pk for item in reversed(items)])
+
+    def test_bulk_update_sql(self):
+        field = UUIDOrderedItem._meta.get_field('order')
+        fields = [field, UUIDOrderedItem._meta.get_field('parent')]
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            sql = field.get_bulk_update_sql(connection, 2, fields)
+        # Only the first row is cast, which the other rows follow
+        self.assertIn('(VALUES (%s::{}, %s::{}, %s::{}), (%s, %s, %s))'.format(
+            UUIDOrderedItem._meta.pk.rel_db_type(connection),
+            field.db_type(connection),
+            UUIDOrderParent._meta.pk.rel_db_type(connection)), sql)
+
+
+class GenericOrderByFieldTest(TestCase):
+
+    def setUp(self):
+        self.parent = OrderParent.objects.create(name='parent')
+        self.other_parent = OrderParent.objects.create(name='other')
+        self.comments = [OrderedComment.objects.create(content_object=self.parent) for i in range(3)]
+        self.other_comments = [OrderedComment.objects.create(content_object=self.other_parent) for i in range(2)]
+
+    def test_accessors(self):
+        comments = self.comments
+        self.assertEqual(list(self.parent.get_orderedcomment_set()), [comment.pk for comment in comments])
+        self.parent.set_orderedcomment_set([comments[2].pk, comments[1].pk, comments[0].pk], reset_values=True)
+        self.assertEqual(list(self.parent.get_orderedcomment_set()), [comment.pk for comment in reversed(comments)])
+        self.assertEqual(self.parent.count_orderedcomment_set(), 3)
+        self.assertEqual(list(self.other_parent.get_orderedcomment_set()), [comment.pk for comment in self.other_comments])
+        # No accessors through the content type
+        self.assertFalse(hasattr(ContentType, 'get_orderedcomment_set'))
+
+    def test_get_sets(self):
+        # Single query by content type and object ids
+        with CaptureQueriesContext(connection) as context:
+            sets = OrderParent.get_orderedcomment_sets([self.parent, self.other_parent])
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn('IN', context.captured_queries[0]['sql'])
+        self.assertEqual(sets, {
+            self.parent.pk: [comment.pk for comment in self.comments],
+            self.other_parent.pk: [comment.pk for comment in self.other_comments]})
+
+    def test_prefetch(self):
+        self.comments[2].move_to(0)
+        with self.assertNumQueries(2):
+            parents = list(OrderParent.objects.order_by('pk').prefetch_related(OrderParent.prefetch_orderedcomment_set()))
+            self.assertEqual(
+                [comment.pk for comment in parents[0].comments.all()],
+                [self.comments[i].pk for i in [2, 0, 1]])
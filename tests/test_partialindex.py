@@ -0,0 +1,94 @@
+""" Run tests related to django_more.PartialIndex """
+# Framework imports
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, IntegrityError, transaction
+from django.db.models import Q
+from django.test import TestCase
+from django.utils.six import StringIO
+from django_more import PartialUniqueIndex
+from .models import PartialUniqueModel
+
+
+class PartialUniqueIndexTest(TestCase):
+
+    def get_index(self):
+        return PartialUniqueModel._meta.indexes[0]
+
+    def test_create_sql(self):
+        index = self.get_index()
+        with connection.schema_editor() as editor:
+            sql = index.create_sql(PartialUniqueModel, editor)
+        self.assertTrue(sql.startswith('CREATE UNIQUE INDEX'))
+        self.assertIn('WHERE', sql)
+
+    def test_deconstruct(self):
+        path, args, kwargs = self.get_index().deconstruct()
+        self.assertEqual(path, 'django_more.indexes.PartialUniqueIndex')
+        self.assertEqual(kwargs['fields'], ['name'])
+        self.assertNotEqual(self.get_index(), PartialUniqueIndex(fields=['name'], deleted=True))
+
+    def test_database_constraint(self):
+        PartialUniqueModel.objects.create(name='one')
+        PartialUniqueModel.objects.create(name='one', deleted=True)
+        PartialUniqueModel.objects.create(name='one', deleted=True)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PartialUniqueModel.objects.create(name='one')
+
+    def test_matches(self):
+        index = self.get_index()
+        self.assertTrue(index.matches(PartialUniqueModel(name='a')))
+        self.assertFalse(index.matches(PartialUniqueModel(name='a', deleted=True)))
+        index = PartialUniqueIndex(~Q(name__in=['a', 'b']) | Q(name__startswith='c'), fields=['name'])
+        # startswith can't be evaluated in python, so is unknown unless the other condition decides
+        self.assertIsNone(index.matches(PartialUniqueModel(name='a')))
+        self.assertTrue(index.matches(PartialUniqueModel(name='d')))
+        index = PartialUniqueIndex(~Q(name__in=['a', 'b']) | Q(deleted=True), fields=['name'])
+        self.assertIs(index.matches(PartialUniqueModel(name='a')), False)
+        self.assertIs(index.matches(PartialUniqueModel(name='a', deleted=True)), True)
+
+    def test_validate_unique(self):
+        PartialUniqueModel.objects.create(name='one')
+        existing = PartialUniqueModel.objects.create(name='two', deleted=True)
+        index = self.get_index()
+        with self.assertRaisesRegex(ValidationError, 'already exists'):
+            index.validate_unique(PartialUniqueModel(name='one'))
+        index.validate_unique(PartialUniqueModel(name='one', deleted=True))
+        index.validate_unique(PartialUniqueModel(name='two'))
+        index.validate_unique(PartialUniqueModel(name='one'), exclude=['name'])
+        index.validate_unique(existing)
+
+    def test_full_clean(self):
+        PartialUniqueModel.objects.create(name='one')
+        with self.assertRaises(ValidationError) as context:
+            PartialUniqueModel(name='one').full_clean()
+        self.assertIn('already exists', context.exception.message_dict['name'][0])
+        PartialUniqueModel(name='one', deleted=True).full_clean()
+        PartialUniqueModel(name='two').full_clean()
+        PartialUniqueModel(name='one').full_clean(exclude=['name'])
+
+    def test_violations_single_query(self):
+        saved = PartialUniqueModel.objects.create(name='one')
+        instances = [
+            PartialUniqueModel(name='one'),
+            PartialUniqueModel(name='one', deleted=True),
+            PartialUniqueModel(name='two'),
+            PartialUniqueModel(name='three'),
+            PartialUniqueModel(name='three'),
+            saved]
+        with self.assertNumQueries(1):
+            violations = self.get_index().get_violations(instances)
+        self.assertEqual(violations, [instances[0], instances[3], instances[4], saved])
+
+
+class PartialIndexReportTest(TestCase):
+
+    def test_report(self):
+        PartialUniqueModel.objects.create(name='one')
+        out = StringIO()
+        call_command('partial_index_report', 'tests', stdout=out)
+        output = out.getvalue()
+        self.assertIn('tests.PartialUniqueModel {}:'.format(PartialUniqueModel._meta.indexes[0].name), output)
+        self.assertNotIn('DUPLICATE', output)
+        if connection.vendor == 'sqlite':
+            self.assertIn('scans unknown', output)